@@ -0,0 +1,97 @@
+"""
+Load test: idle collectors held at once under WSGI (thread per request) and
+ASGI (async views). Not collected by the default test run; execute with
+
+    python manage.py test api.tests.bench_async_capacity
+
+Tunable through BENCH_COLLECTORS, BENCH_WSGI_WORKERS and BENCH_POLL_SECONDS.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.test import AsyncRequestFactory, RequestFactory, TransactionTestCase, override_settings
+
+from api.views import astream_continue_or_delete, stream_continue_or_delete
+from data.models import PixStream
+from util.notifications import stop_listener
+
+
+COLLECTORS = int(os.environ.get("BENCH_COLLECTORS", 1000))
+WSGI_WORKERS = int(os.environ.get("BENCH_WSGI_WORKERS", 16))
+POLL_SECONDS = float(os.environ.get("BENCH_POLL_SECONDS", 3.0))
+
+
+@override_settings(STREAM_LONG_POLLING_TIMEOUT_SECONDS=POLL_SECONDS)
+class BenchAsyncCapacity(TransactionTestCase):
+    def setUp(self) -> None:
+        self.addCleanup(stop_listener)
+        self.streams = PixStream.objects.bulk_create([
+            PixStream(interation_id=f"bench{i}", ispb=f"{i // 6:08d}") for i in range(COLLECTORS)
+        ])
+
+
+    def _peak_waiting(self, intervals: list) -> int:
+        events = sorted([(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals])
+        waiting = peak = 0
+        for _, delta in events:
+            waiting += delta
+            peak = max(peak, waiting)
+        return peak
+
+
+    def _run_wsgi(self) -> dict:
+        factory = RequestFactory()
+
+        def pull(stream: PixStream) -> tuple:
+            try:
+                started_at = time.monotonic()
+                request = factory.get(f"/api/pix/{stream.ispb}/stream/{stream.interation_id}")
+                stream_continue_or_delete(request, stream.ispb, stream.interation_id)
+                return started_at, time.monotonic()
+            finally:
+                connection.close()
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=WSGI_WORKERS) as pool:
+            intervals = list(pool.map(pull, self.streams))
+        return {
+            "peak_waiting_collectors": self._peak_waiting(intervals),
+            "total_seconds": round(time.monotonic() - started, 2),
+        }
+
+
+    def _run_asgi(self) -> dict:
+        factory = AsyncRequestFactory()
+
+        async def pull(stream: PixStream) -> tuple:
+            started_at = time.monotonic()
+            request = factory.get(f"/api/pix/{stream.ispb}/stream/{stream.interation_id}")
+            await astream_continue_or_delete(request, stream.ispb, stream.interation_id)
+            return started_at, time.monotonic()
+
+        async def run_all() -> list:
+            intervals = await asyncio.gather(*(pull(stream) for stream in self.streams))
+            await sync_to_async(lambda: connection.close())()
+            return intervals
+
+        started = time.monotonic()
+        intervals = asyncio.run(run_all())
+        return {
+            "peak_waiting_collectors": self._peak_waiting(intervals),
+            "total_seconds": round(time.monotonic() - started, 2),
+        }
+
+
+    def test_idle_collectors_wsgi_vs_asgi(self):
+        wsgi = self._run_wsgi()
+        asgi = self._run_asgi()
+        print(
+            f"\nidle collectors={COLLECTORS} poll={POLL_SECONDS}s wsgi_workers={WSGI_WORKERS}\n"
+            f"  wsgi: {wsgi}\n"
+            f"  asgi: {asgi}"
+        )
+        self.assertGreater(asgi["peak_waiting_collectors"], wsgi["peak_waiting_collectors"])
@@ -0,0 +1,70 @@
+"""
+Benchmark: bytes on the wire and CPU time per 1k messages of a multipart
+pull for each available Content-Encoding, compressing the whole body at once
+and chunk by chunk as a streamed pull does. Not collected by the default
+test run; execute with
+
+    python manage.py test api.tests.bench_compression
+
+Tunable through BENCH_MESSAGES, BENCH_CHUNK and BENCH_ROUNDS. br and zstd
+are measured only when ``brotli`` and ``zstandard`` are installed.
+"""
+import os
+import random
+import time
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from data.serializers import encode_pix_messages, iter_encode_pix_messages
+from util.compression import ENCODERS, _compress_chunks, compress_one
+
+
+MESSAGES = int(os.environ.get("BENCH_MESSAGES", 5000))
+CHUNK = int(os.environ.get("BENCH_CHUNK", 500))
+ROUNDS = int(os.environ.get("BENCH_ROUNDS", 5))
+
+
+def _rows(count: int) -> list:
+    rng = random.Random(7)
+    paid = datetime(2024, 5, 1, 12, tzinfo=dt_timezone.utc)
+    # In PIX_MESSAGE_WIRE_FIELDS order.
+    return [
+        (
+            f"E12345678{i:024d}", Decimal(rng.randint(1, 10 ** 6)) / 100,
+            f"Payer {i}", f"{rng.randint(0, 10 ** 11 - 1):011d}", f"{rng.randint(0, 10 ** 8 - 1):08d}",
+            "0001", str(rng.randint(1, 10 ** 8)), "CACC",
+            "Receiver", "01987654321", "12345678", "0001", "222", "SVGS",
+            "", f"tx{rng.getrandbits(64):x}", paid,
+        )
+        for i in range(count)
+    ]
+
+
+class BenchCompression(SimpleTestCase):
+    def _per_thousand(self, encode) -> tuple:
+        """Median (bytes, cpu ms) of ``encode`` scaled to 1k messages."""
+        sizes, cpu = [], []
+        for _ in range(ROUNDS):
+            started = time.process_time()
+            size = encode()
+            cpu.append(time.process_time() - started)
+            sizes.append(size)
+        scale = 1000 / MESSAGES
+        return round(sorted(sizes)[ROUNDS // 2] * scale), round(sorted(cpu)[ROUNDS // 2] * scale * 1000, 3)
+
+
+    def test_encodings(self):
+        rows = _rows(MESSAGES)
+        body = encode_pix_messages(rows)
+        chunks = list(iter_encode_pix_messages(rows, CHUNK))
+
+        print(f"\nmessages={MESSAGES} chunk={CHUNK} rounds={ROUNDS} (per 1k messages)")
+        print(f"  {'identity':>8} whole bytes={len(body) * 1000 // MESSAGES:>8} cpu_ms=   0.000")
+        for encoding, encoder in ENCODERS.items():
+            whole = self._per_thousand(lambda: len(compress_one(body, encoding)))
+            streamed = self._per_thousand(lambda: sum(len(c) for c in _compress_chunks(chunks, encoder())))
+            print(f"  {encoding:>8} whole bytes={whole[0]:>8} cpu_ms={whole[1]:>8}")
+            print(f"  {encoding:>8} chunk bytes={streamed[0]:>8} cpu_ms={streamed[1]:>8}")
+            self.assertLess(whole[0], len(body) * 1000 // MESSAGES)
@@ -0,0 +1,81 @@
+"""
+Benchmark: history page latency by depth, keyset (the history endpoint)
+against LIMIT/OFFSET over the same order. Not collected by the default test
+run; execute with
+
+    python manage.py test api.tests.bench_history
+
+Tunable through BENCH_HISTORY_ROWS, BENCH_DEPTHS (comma separated row
+offsets), BENCH_PAGE and BENCH_ROUNDS.
+"""
+import os
+import statistics
+import time
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from data.models import PixMessage
+from util.history import parse_history_query
+
+
+HISTORY_ROWS = int(os.environ.get("BENCH_HISTORY_ROWS", 2000000))
+DEPTHS = [int(depth) for depth in os.environ.get("BENCH_DEPTHS", "0,10000,100000,1000000,1900000").split(",")]
+PAGE = int(os.environ.get("BENCH_PAGE", 100))
+ROUNDS = int(os.environ.get("BENCH_ROUNDS", 20))
+
+TABLE = PixMessage._meta.db_table
+
+_INSERT_SQL = f"""
+INSERT INTO {TABLE} (
+    end_to_end_id, tx_id, amount, payment_at, free_text,
+    payer_name, payer_cpf_cnpj, payer_ispb, payer_agencia, payer_conta_transacional, payer_tipo_conta,
+    receiver_name, receiver_cpf_cnpj, receiver_ispb, receiver_agencia, receiver_conta_transacional, receiver_tipo_conta,
+    status, consumed_at, created_at
+)
+SELECT
+    'Hbench' || n, 'tx' || n, 10.00, %(now)s, '',
+    'Tester', '12345678901', '87654321', '0001', '111', 'CACC',
+    'Receiver', '01987654321', %(ispb)s, '0001', '222', 'SVGS',
+    'finalizado', %(now)s, %(now)s
+FROM generate_series(1, %(count)s) AS n
+"""
+
+
+class BenchHistory(TransactionTestCase):
+    def setUp(self) -> None:
+        self.ispb = "12345678"
+
+
+    def _median_ms(self, page) -> float:
+        latencies = []
+        for _ in range(ROUNDS):
+            started = time.perf_counter()
+            rows = page()
+            latencies.append(time.perf_counter() - started)
+            self.assertEqual(len(rows), PAGE)
+        return round(statistics.median(latencies) * 1000, 3)
+
+
+    def test_page_latency_by_depth(self):
+        with connection.cursor() as cursor:
+            cursor.execute(_INSERT_SQL, {"now": timezone.now(), "ispb": self.ispb, "count": HISTORY_ROWS})
+            cursor.execute(f"VACUUM ANALYZE {TABLE}")
+        history = PixMessage.objects.filter(
+            receiver_ispb=self.ispb, status=PixMessage.MessageStatus.CONSUMED
+        ).order_by("id")
+        first_id = history.values_list("id", flat=True).first()
+
+        print(f"\nhistory={HISTORY_ROWS} page={PAGE} rounds={ROUNDS}")
+        for depth in DEPTHS:
+            # Ids are dense here, so the keyset cursor of a depth is known.
+            query = parse_history_query(self.ispb, {"after": str(first_id + depth - 1), "limit": str(PAGE)})
+
+            def keyset():
+                return list(query.rows(query.page_bound()))
+
+            def offset():
+                return list(history.values_list("end_to_end_id")[depth:depth + PAGE])
+
+            print(f"  depth={depth:>8} keyset_ms={self._median_ms(keyset):>8} offset_ms={self._median_ms(offset):>9}")
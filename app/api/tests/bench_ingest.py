@@ -0,0 +1,114 @@
+"""
+Benchmark: bulk ingest rate through /api/pix/ingest (NDJSON and JSON array)
+against building PixMessage instances for bulk_create, the path used by
+generate_messages. Not collected by the default test run; execute with
+
+    python manage.py test api.tests.bench_ingest
+
+Tunable through BENCH_MESSAGES and BENCH_INGEST_BATCH_SIZE.
+"""
+import json
+import os
+import time
+from decimal import Decimal
+
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from data.models import PixMessage
+
+
+MESSAGES = int(os.environ.get("BENCH_MESSAGES", 100000))
+BATCH_SIZE = int(os.environ.get("BENCH_INGEST_BATCH_SIZE", 5000))
+
+
+@override_settings(INGEST_BATCH_SIZE=BATCH_SIZE)
+class BenchIngest(TransactionTestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+
+
+    def _messages(self, prefix: str) -> list:
+        return [
+            {
+                "endToEndId": f"E{i % 500:08d}{prefix}{i}",
+                "valor": f"{(i % 100000 + 1) / 100:.2f}",
+                "pagador": {
+                    "nome": "Tester",
+                    "cpfCnpj": "12345678901",
+                    "ispb": "87654321",
+                    "agencia": "0001",
+                    "contaTransacional": "111",
+                    "tipoConta": "CACC",
+                },
+                "recebedor": {
+                    "nome": "Receiver",
+                    "cpfCnpj": "01987654321",
+                    "ispb": f"{i % 500:08d}",
+                    "agencia": "0001",
+                    "contaTransacional": "222",
+                    "tipoConta": "SVGS",
+                },
+                "campoLivre": "",
+                "txId": f"tx{i}",
+                "dataHoraPagamento": "2024-02-21T19:27:00Z",
+            }
+            for i in range(MESSAGES)
+        ]
+
+
+    def _ingest(self, body: bytes, content_type: str) -> dict:
+        started = time.perf_counter()
+        resp = self.client.generic("POST", "/api/pix/ingest", body, content_type=content_type)
+        elapsed = time.perf_counter() - started
+        self.assertEqual(resp.json()["inserted"], MESSAGES)
+        return {"seconds": round(elapsed, 2), "messages_per_second": round(MESSAGES / elapsed)}
+
+
+    def _bulk_create(self) -> dict:
+        messages = self._messages("orm")
+        now = timezone.now()
+        started = time.perf_counter()
+        PixMessage.objects.bulk_create(
+            [
+                PixMessage(
+                    end_to_end_id=m["endToEndId"],
+                    tx_id=m["txId"],
+                    amount=Decimal(m["valor"]),
+                    payment_at=now,
+                    free_text=m["campoLivre"],
+                    payer_name=m["pagador"]["nome"],
+                    payer_cpf_cnpj=m["pagador"]["cpfCnpj"],
+                    payer_ispb=m["pagador"]["ispb"],
+                    payer_agencia=m["pagador"]["agencia"],
+                    payer_conta_transacional=m["pagador"]["contaTransacional"],
+                    payer_tipo_conta=m["pagador"]["tipoConta"],
+                    receiver_name=m["recebedor"]["nome"],
+                    receiver_cpf_cnpj=m["recebedor"]["cpfCnpj"],
+                    receiver_ispb=m["recebedor"]["ispb"],
+                    receiver_agencia=m["recebedor"]["agencia"],
+                    receiver_conta_transacional=m["recebedor"]["contaTransacional"],
+                    receiver_tipo_conta=m["recebedor"]["tipoConta"],
+                )
+                for m in messages
+            ],
+            batch_size=1000,
+        )
+        elapsed = time.perf_counter() - started
+        return {"seconds": round(elapsed, 2), "messages_per_second": round(MESSAGES / elapsed)}
+
+
+    def test_ingest_rate(self):
+        ndjson = b"\n".join(json.dumps(m).encode() for m in self._messages("nd"))
+        array = json.dumps(self._messages("ar")).encode()
+
+        results = {
+            "ndjson": self._ingest(ndjson, "application/x-ndjson"),
+            "json_array": self._ingest(array, "application/json"),
+            "bulk_create": self._bulk_create(),
+        }
+        print(f"\nmessages={MESSAGES} batch={BATCH_SIZE}")
+        for name, result in results.items():
+            print(f"  {name:>11}: {result}")
+        self.assertGreater(results["ndjson"]["messages_per_second"], results["bulk_create"]["messages_per_second"])
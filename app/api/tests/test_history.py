@@ -0,0 +1,145 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from data.models import PixMessage, PixStream
+from util.history import parse_history_query
+
+
+class TestMessageHistory(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.ispb = "12345678"
+        self.now = timezone.now()
+
+
+    def _create_message(self, suffix: str, ispb: str = "", paid_days_ago: int = 0, **fields) -> PixMessage:
+        return PixMessage.objects.create(
+            end_to_end_id=f"E{ispb or self.ispb}{suffix}",
+            tx_id=f"tx{suffix}",
+            amount=Decimal("10.00"),
+            payment_at=self.now - timedelta(days=paid_days_ago),
+            free_text="",
+            payer_name="Tester",
+            payer_cpf_cnpj="12345678901",
+            payer_ispb="87654321",
+            payer_agencia="0001",
+            payer_conta_transacional="111",
+            payer_tipo_conta="CACC",
+            receiver_name="Receiver",
+            receiver_cpf_cnpj="01987654321",
+            receiver_ispb=ispb or self.ispb,
+            receiver_agencia="0001",
+            receiver_conta_transacional="222",
+            receiver_tipo_conta="SVGS",
+            **fields,
+        )
+
+
+    def _consumed(self, suffix: str, consumed_days_ago: int = 0, **kwargs) -> PixMessage:
+        message = self._create_message(
+            suffix,
+            status=PixMessage.MessageStatus.CONSUMED,
+            consumed_at=self.now - timedelta(days=consumed_days_ago),
+            **kwargs,
+        )
+        # Stored before it was paid and consumed, as real messages are.
+        PixMessage.objects.filter(pk=message.pk).update(created_at=message.payment_at - timedelta(minutes=1))
+        return message
+
+
+    def _get(self, query: str = ""):
+        return self.client.get(f"/api/pix/{self.ispb}/history{'?' + query if query else ''}")
+
+
+    def _ids(self, resp) -> list:
+        body = b"".join(resp.streaming_content) if resp.streaming else resp.content
+        return [message["endToEndId"] for message in json.loads(body)]
+
+
+    def test_pages_walk_consumed_messages_in_order(self):
+        consumed = [self._consumed(f"{i:02d}") for i in range(5)]
+        self._create_message("pending")
+        self._consumed("other", ispb="87654321")
+
+        seen, query = [], "limit=2"
+        while True:
+            resp = self._get(query)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            page = self._ids(resp)
+            if not page:
+                self.assertNotIn("History-Next", resp)
+                break
+            seen.extend(page)
+            query = resp["History-Next"].split("?", 1)[1]
+
+        self.assertEqual(seen, [m.end_to_end_id for m in consumed])
+
+
+    def test_history_does_not_touch_reservations(self):
+        stream = PixStream.objects.create(interation_id="busy", ispb=self.ispb)
+        reserved = self._create_message("reserved", status=PixMessage.MessageStatus.RESERVED, reserved_by=stream)
+        self._consumed("done")
+
+        with self.assertNumQueries(2):
+            resp = self._get()
+
+        self.assertEqual(self._ids(resp), [f"E{self.ispb}done"])
+        reserved.refresh_from_db()
+        self.assertEqual(reserved.status, PixMessage.MessageStatus.RESERVED)
+        self.assertEqual(reserved.reserved_by, stream)
+
+
+    def test_time_filters(self):
+        self._consumed("old", paid_days_ago=10, consumed_days_ago=9)
+        self._consumed("mid", paid_days_ago=5, consumed_days_ago=1)
+        self._consumed("new")
+        from_ = (self.now - timedelta(days=6)).isoformat()
+        to = (self.now - timedelta(days=1)).isoformat()
+
+        by_payment = self.client.get(f"/api/pix/{self.ispb}/history", {"paymentFrom": from_, "paymentTo": to})
+        by_consumption = self.client.get(f"/api/pix/{self.ispb}/history", {"consumedTo": to})
+
+        self.assertEqual(self._ids(by_payment), [f"E{self.ispb}mid"])
+        self.assertEqual(self._ids(by_consumption), [f"E{self.ispb}old"])
+        self.assertIn("paymentFrom=", by_payment["History-Next"])
+
+
+    @override_settings(STREAM_STREAMING_MIN_MESSAGES=3, STREAM_STREAMING_CHUNK_SIZE=2)
+    def test_large_pages_are_streamed(self):
+        for i in range(5):
+            self._consumed(str(i))
+
+        streamed = self._get("limit=4")
+        small = self._get("limit=2")
+
+        self.assertTrue(streamed.streaming)
+        self.assertFalse(small.streaming)
+        self.assertEqual(self._ids(streamed), [f"E{self.ispb}{i}" for i in range(4)])
+
+
+    def test_invalid_queries_return_400(self):
+        for query in ("after=x", "limit=0", "after=-1", "paymentFrom=yesterday", "consumedTo=2024-01-01T00:00:00"):
+            self.assertEqual(self._get(query).status_code, status.HTTP_400_BAD_REQUEST, query)
+        resp = self.client.get("/api/pix/123/history")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_page_keys_come_from_an_index_only_scan(self):
+        query = parse_history_query(self.ispb, {"after": "1000", "limit": "50"})
+        sql, params = query.messages().values_list("id", flat=True)[:query.limit].query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_bitmapscan = off")
+            cursor.execute("EXPLAIN " + sql, params)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+
+        self.assertIn("Index Only Scan", plan)
+        self.assertIn("Index Cond: ((receiver_ispb = '12345678'::text) AND (id > 1000))", plan)
@@ -0,0 +1,230 @@
+import json
+from decimal import Decimal
+from io import BytesIO
+
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from data.models import PixMessage, PixStream
+from util.ingest import MALFORMED_JSON, READ_CHUNK_BYTES, RECORD_TOO_LARGE, iter_json_array, iter_ndjson
+
+
+class TestIngestMessages(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.ispb = "12345678"
+
+
+    def _message(self, suffix: str, **overrides) -> dict:
+        message = {
+            "endToEndId": f"E{self.ispb}{suffix}",
+            "valor": "10.50",
+            "pagador": {
+                "nome": "Tester",
+                "cpfCnpj": "12345678901",
+                "ispb": "87654321",
+                "agencia": "0001",
+                "contaTransacional": "111",
+                "tipoConta": "CACC",
+            },
+            "recebedor": {
+                "nome": "Receiver",
+                "cpfCnpj": "01987654321",
+                "ispb": self.ispb,
+                "agencia": "0001",
+                "contaTransacional": "222",
+                "tipoConta": "SVGS",
+            },
+            "campoLivre": "",
+            "txId": f"tx{suffix}",
+            "dataHoraPagamento": "2024-02-21T19:27:00Z",
+        }
+        message.update(overrides)
+        return message
+
+
+    def _ndjson(self, messages: list) -> bytes:
+        return b"\n".join(json.dumps(message).encode() for message in messages) + b"\n"
+
+
+    def _post(self, body: bytes, content_type: str = "application/x-ndjson"):
+        return self.client.generic("POST", "/api/pix/ingest", body, content_type=content_type)
+
+
+    def test_ndjson_feed_is_inserted_as_pending(self):
+        resp = self._post(self._ndjson([self._message(str(i)) for i in range(3)]))
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            resp.json(), {"inserted": 3, "new": [f"E{self.ispb}{i}" for i in range(3)], "rejected": []}
+        )
+        self.assertEqual(
+            PixMessage.objects.filter(receiver_ispb=self.ispb, status=PixMessage.MessageStatus.PENDING).count(), 3
+        )
+
+
+    def test_json_array_feed_is_inserted(self):
+        body = json.dumps([self._message(str(i)) for i in range(4)]).encode()
+        resp = self._post(body, content_type="application/json")
+
+        self.assertEqual(
+            resp.json(), {"inserted": 4, "new": [f"E{self.ispb}{i}" for i in range(4)], "rejected": []}
+        )
+
+
+    def test_ingested_message_round_trips_through_the_stream(self):
+        sent = self._message("rt", valor="1234.5", campoLivre='linha "1"\n\ttab \\ fim')
+        self._post(self._ndjson([sent]))
+        PixStream.objects.create(interation_id="rt", ispb=self.ispb)
+
+        resp = self.client.get(f"/api/pix/{self.ispb}/stream/rt", HTTP_ACCEPT="application/json")
+
+        self.assertEqual(resp.json(), dict(sent, valor="1234.50"))
+
+
+    def test_invalid_records_are_rejected_with_their_position(self):
+        messages = [
+            self._message("ok1"),
+            self._message("badispb", recebedor=dict(self._message("x")["recebedor"], ispb="123")),
+            self._message("badvalor", valor="1.001"),
+            {"endToEndId": f"E{self.ispb}partial"},
+            self._message("ok2"),
+        ]
+        resp = self._post(self._ndjson(messages))
+
+        report = resp.json()
+        self.assertEqual(report["inserted"], 2)
+        self.assertEqual(report["new"], [f"E{self.ispb}ok1", f"E{self.ispb}ok2"])
+        self.assertEqual([reject["index"] for reject in report["rejected"]], [1, 2, 3])
+        self.assertEqual(report["rejected"][0]["endToEndId"], f"E{self.ispb}badispb")
+        self.assertIn("recebedor.ispb", report["rejected"][0]["detail"])
+        self.assertIn("valor", report["rejected"][1]["detail"])
+
+
+    def test_nul_character_is_rejected_without_failing_the_batch(self):
+        resp = self._post(self._ndjson([self._message("ok"), self._message("nul", campoLivre="a\u0000b")]))
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        report = resp.json()
+        self.assertEqual(report["inserted"], 1)
+        self.assertEqual([reject["index"] for reject in report["rejected"]], [1])
+        self.assertIn("campoLivre", report["rejected"][0]["detail"])
+        self.assertTrue(PixMessage.objects.filter(end_to_end_id=f"E{self.ispb}ok").exists())
+
+
+    def test_duplicates_are_reported_and_the_rest_inserted(self):
+        self._post(self._ndjson([self._message("dup")]))
+        messages = [self._message("new1"), self._message("dup"), self._message("new2"), self._message("new1")]
+        resp = self._post(self._ndjson(messages))
+
+        report = resp.json()
+        self.assertEqual(report["inserted"], 2)
+        self.assertEqual(report["new"], [f"E{self.ispb}new1", f"E{self.ispb}new2"])
+        self.assertEqual(
+            report["rejected"],
+            [
+                {"index": 1, "endToEndId": f"E{self.ispb}dup", "detail": "Duplicate endToEndId."},
+                {"index": 3, "endToEndId": f"E{self.ispb}new1", "detail": "Duplicate endToEndId."},
+            ],
+        )
+        self.assertEqual(PixMessage.objects.filter(receiver_ispb=self.ispb).count(), 3)
+
+
+    @override_settings(INGEST_BATCH_SIZE=2)
+    def test_feed_is_loaded_in_batches(self):
+        messages = [self._message(str(i)) for i in range(5)] + [self._message("0")]
+        resp = self._post(self._ndjson(messages))
+
+        self.assertEqual(resp.json()["inserted"], 5)
+        self.assertEqual(resp.json()["new"], [f"E{self.ispb}{i}" for i in range(5)])
+        self.assertEqual([reject["index"] for reject in resp.json()["rejected"]], [5])
+
+
+    def test_malformed_ndjson_line_is_skipped(self):
+        body = self._ndjson([self._message("a")]) + b"{not json\n" + self._ndjson([self._message("b")])
+        resp = self._post(body)
+
+        self.assertEqual(
+            resp.json(),
+            {
+                "inserted": 2,
+                "new": [f"E{self.ispb}a", f"E{self.ispb}b"],
+                "rejected": [{"index": 1, "detail": MALFORMED_JSON}],
+            },
+        )
+
+
+    def test_unsupported_content_type_returns_415(self):
+        resp = self._post(b"", content_type="text/csv")
+        self.assertEqual(resp.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+
+    def test_priority_parameter_selects_the_lane(self):
+        resp = self.client.generic(
+            "POST", "/api/pix/ingest?priority=baixa", self._ndjson([self._message("bulk")]),
+            content_type="application/x-ndjson",
+        )
+        self._post(self._ndjson([self._message("default")]))
+
+        self.assertEqual(resp.json(), {"inserted": 1, "new": [f"E{self.ispb}bulk"], "rejected": []})
+        self.assertEqual(
+            dict(PixMessage.objects.values_list("end_to_end_id", "priority")),
+            {
+                f"E{self.ispb}bulk": PixMessage.MessagePriority.LOW,
+                f"E{self.ispb}default": PixMessage.MessagePriority.NORMAL,
+            },
+        )
+
+
+    def test_unknown_priority_returns_400(self):
+        resp = self.client.generic(
+            "POST", "/api/pix/ingest?priority=urgente", self._ndjson([self._message("x")]),
+            content_type="application/x-ndjson",
+        )
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(PixMessage.objects.exists())
+
+
+class TestIterJsonArray(TestCase):
+    def _parse(self, body: bytes) -> list:
+        return list(iter_json_array(BytesIO(body)))
+
+
+    def test_items_spanning_read_chunks_are_parsed(self):
+        items = [{"n": i, "text": "ç" * 1000, "valor": 1.25} for i in range(3 * READ_CHUNK_BYTES // 1000)]
+        parsed = self._parse(json.dumps(items).encode())
+
+        self.assertEqual([payload["n"] for payload, _ in parsed], [item["n"] for item in items])
+        self.assertEqual(parsed[0][0]["valor"], Decimal("1.25"))
+
+
+    def test_empty_array(self):
+        self.assertEqual(self._parse(b" [ ] "), [])
+
+
+    def test_syntax_error_ends_parsing(self):
+        parsed = self._parse(b'[{"n": 1}, {"n": 2} {"n": 3}]')
+        self.assertEqual(parsed, [({"n": 1}, None), ({"n": 2}, None), (None, MALFORMED_JSON)])
+
+
+    def test_truncated_array_is_reported(self):
+        self.assertEqual(self._parse(b'[{"n": 1}, {"n"'), [({"n": 1}, None), (None, MALFORMED_JSON)])
+
+
+    @override_settings(INGEST_MAX_RECORD_BYTES=2 * READ_CHUNK_BYTES)
+    def test_unterminated_record_stops_at_the_record_cap(self):
+        body = BytesIO(b'[{"n": 1}, {"text": "' + b"x" * (10 * READ_CHUNK_BYTES))
+        parsed = list(iter_json_array(body))
+
+        self.assertEqual(parsed, [({"n": 1}, None), (None, RECORD_TOO_LARGE)])
+        self.assertLess(body.tell(), 4 * READ_CHUNK_BYTES)
+
+
+    @override_settings(INGEST_MAX_RECORD_BYTES=2 * READ_CHUNK_BYTES)
+    def test_ndjson_line_over_the_record_cap_is_skipped(self):
+        huge = b'{"text": "' + b"x" * (10 * READ_CHUNK_BYTES) + b'"}\n'
+        parsed = list(iter_ndjson(BytesIO(b'{"n": 1}\n' + huge + b'{"n": 2}\n')))
+
+        self.assertEqual(parsed, [({"n": 1}, None), (None, RECORD_TOO_LARGE), ({"n": 2}, None)])
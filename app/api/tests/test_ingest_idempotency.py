@@ -0,0 +1,153 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from data.models import PixMessage, PixMessageKey
+from util.bloom import recent_ids_filter, reset_recent_ids_filter
+
+
+def _message(ispb: str, suffix: str) -> dict:
+    return {
+        "endToEndId": f"E{ispb}{suffix}",
+        "valor": "10.00",
+        "pagador": {
+            "nome": "Tester",
+            "cpfCnpj": "12345678901",
+            "ispb": "87654321",
+            "agencia": "0001",
+            "contaTransacional": "111",
+            "tipoConta": "CACC",
+        },
+        "recebedor": {
+            "nome": "Receiver",
+            "cpfCnpj": "01987654321",
+            "ispb": ispb,
+            "agencia": "0001",
+            "contaTransacional": "222",
+            "tipoConta": "SVGS",
+        },
+        "campoLivre": "",
+        "txId": f"tx{suffix}",
+        "dataHoraPagamento": "2024-02-21T19:27:00Z",
+    }
+
+
+def _feed(ispb: str, suffixes) -> bytes:
+    return b"\n".join(json.dumps(_message(ispb, str(suffix))).encode() for suffix in suffixes)
+
+
+def _ingest(client: APIClient, body: bytes) -> dict:
+    return client.generic("POST", "/api/pix/ingest", body, content_type="application/x-ndjson").json()
+
+
+@override_settings(INGEST_BATCH_SIZE=2)
+class TestIngestRetryStorm(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.ispb = "12345678"
+        reset_recent_ids_filter()
+        self.addCleanup(reset_recent_ids_filter)
+
+
+    def test_replayed_feed_is_stored_once(self):
+        feed = _feed(self.ispb, range(6))
+        first = _ingest(self.client, feed)
+        replays = [_ingest(self.client, feed) for _ in range(20)]
+
+        self.assertEqual(first, {"inserted": 6, "new": [f"E{self.ispb}{i}" for i in range(6)], "rejected": []})
+        for replay in replays:
+            self.assertEqual(replay["inserted"], 0)
+            self.assertEqual(replay["new"], [])
+            self.assertEqual(
+                [(reject["index"], reject["detail"]) for reject in replay["rejected"]],
+                [(index, "Duplicate endToEndId.") for index in range(6)],
+            )
+        self.assertEqual(PixMessage.objects.filter(receiver_ispb=self.ispb).count(), 6)
+        self.assertEqual(PixMessageKey.objects.count(), 6)
+
+
+    def test_retry_after_partial_delivery_only_adds_the_rest(self):
+        _ingest(self.client, _feed(self.ispb, range(3)))
+        report = _ingest(self.client, _feed(self.ispb, range(7)))
+
+        self.assertEqual(report["inserted"], 4)
+        self.assertEqual(report["new"], [f"E{self.ispb}{i}" for i in range(3, 7)])
+        self.assertEqual([reject["index"] for reject in report["rejected"]], [0, 1, 2])
+        self.assertEqual(PixMessage.objects.filter(receiver_ispb=self.ispb).count(), 7)
+
+
+    @override_settings(INGEST_BLOOM_FILTER_ENABLED=True)
+    def test_bloom_filter_answers_replays_without_loading(self):
+        feed = _feed(self.ispb, range(6))
+        _ingest(self.client, feed)
+
+        with CaptureQueriesContext(connection) as queries:
+            report = _ingest(self.client, feed)
+
+        self.assertEqual(report["inserted"], 0)
+        self.assertEqual(len(report["rejected"]), 6)
+        statements = [query["sql"] for query in queries.captured_queries]
+        self.assertFalse([sql for sql in statements if "INSERT INTO" in sql])
+        self.assertEqual(len(statements), 3)  # one key lookup per batch
+
+
+    @override_settings(INGEST_BLOOM_FILTER_ENABLED=True)
+    def test_bloom_false_positives_are_still_inserted(self):
+        bloom = recent_ids_filter()
+        bloom.bits = bytearray(b"\xff" * len(bloom.bits))
+
+        report = _ingest(self.client, _feed(self.ispb, range(4)))
+
+        self.assertEqual(report, {"inserted": 4, "new": [f"E{self.ispb}{i}" for i in range(4)], "rejected": []})
+
+
+    @override_settings(INGEST_BLOOM_FILTER_ENABLED=True)
+    def test_bloom_filter_is_warmed_from_stored_ids(self):
+        _ingest(self.client, _feed(self.ispb, range(2)))
+        reset_recent_ids_filter()
+
+        bloom = recent_ids_filter()
+        self.assertIn(f"E{self.ispb}0", bloom)
+        self.assertIn(f"E{self.ispb}1", bloom)
+
+
+@override_settings(INGEST_BATCH_SIZE=25)
+class TestConcurrentIngestRetryStorm(TransactionTestCase):
+    def setUp(self) -> None:
+        self.ispb = "12345678"
+        reset_recent_ids_filter()
+        self.addCleanup(reset_recent_ids_filter)
+
+
+    def _storm(self) -> list:
+        feed = _feed(self.ispb, range(100))
+
+        def replay(_) -> dict:
+            try:
+                return _ingest(APIClient(), feed)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            return list(pool.map(replay, range(40)))
+
+
+    def test_concurrent_replays_store_each_message_once(self):
+        reports = self._storm()
+
+        self.assertEqual(sum(report["inserted"] for report in reports), 100)
+        self.assertEqual(sum(len(report["rejected"]) for report in reports), 39 * 100)
+        self.assertEqual(PixMessage.objects.filter(receiver_ispb=self.ispb).count(), 100)
+        self.assertEqual(PixMessageKey.objects.count(), 100)
+
+
+    @override_settings(INGEST_BLOOM_FILTER_ENABLED=True)
+    def test_concurrent_replays_with_bloom_filter(self):
+        reports = self._storm()
+
+        self.assertEqual(sum(report["inserted"] for report in reports), 100)
+        self.assertEqual(PixMessage.objects.filter(receiver_ispb=self.ispb).count(), 100)
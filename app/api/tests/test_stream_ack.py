@@ -0,0 +1,162 @@
+import json
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.views import astream_ack
+from data.models import PixMessage, PixStream
+
+
+@override_settings(STREAM_LONG_POLLING_TIMEOUT_SECONDS=0.0)
+class TestStreamAck(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.ispb = "12345678"
+        self.stream = PixStream.objects.create(interation_id="acking", ispb=self.ispb)
+
+
+    def _create_message(self, suffix: str) -> PixMessage:
+        return PixMessage.objects.create(
+            end_to_end_id=f"E{self.ispb}{suffix}",
+            tx_id=f"tx{suffix}",
+            amount=Decimal("10.00"),
+            payment_at=timezone.now(),
+            free_text="",
+            payer_name="Tester",
+            payer_cpf_cnpj="12345678901",
+            payer_ispb="87654321",
+            payer_agencia="0001",
+            payer_conta_transacional="111",
+            payer_tipo_conta="CACC",
+            receiver_name="Receiver",
+            receiver_cpf_cnpj="01987654321",
+            receiver_ispb=self.ispb,
+            receiver_agencia="0001",
+            receiver_conta_transacional="222",
+            receiver_tipo_conta="SVGS",
+        )
+
+
+    def _pull(self, limit: int = 10):
+        return self.client.get(
+            f"/api/pix/{self.ispb}/stream/{self.stream.interation_id}?limit={limit}", HTTP_ACCEPT="multipart/json"
+        )
+
+
+    def _ack(self, body=None, interation_id: str = "", **headers):
+        return self.client.post(
+            f"/api/pix/{self.ispb}/stream/{interation_id or self.stream.interation_id}/ack",
+            json.dumps(body) if body is not None else "",
+            content_type="application/json",
+            **headers,
+        )
+
+
+    def _statuses(self) -> dict:
+        return dict(PixMessage.objects.values_list("end_to_end_id", "status"))
+
+
+    def test_ack_by_end_to_end_ids_consumes_them_and_keeps_the_stream(self):
+        for i in range(4):
+            self._create_message(str(i))
+        delivered = [message["endToEndId"] for message in self._pull().json()]
+
+        resp = self._ack({"endToEndIds": delivered[:2]})
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json(), {"acknowledged": 2})
+        statuses = self._statuses()
+        self.assertEqual([statuses[i] for i in delivered], ["finalizado", "finalizado", "reservado", "reservado"])
+        self.stream.refresh_from_db()
+        self.assertTrue(self.stream.active)
+
+
+    def test_ack_by_batch_token_confirms_only_that_pull(self):
+        for i in range(4):
+            self._create_message(str(i))
+        first = self._pull(limit=2)
+        second = self._pull(limit=2)
+
+        resp = self._ack({"batch": first["Pull-Batch"]})
+
+        self.assertEqual(resp.json(), {"acknowledged": 2})
+        statuses = self._statuses()
+        self.assertEqual({statuses[m["endToEndId"]] for m in first.json()}, {"finalizado"})
+        self.assertEqual({statuses[m["endToEndId"]] for m in second.json()}, {"reservado"})
+
+
+    def test_batch_token_can_be_sent_as_header(self):
+        self._create_message("1")
+        pulled = self._pull()
+
+        resp = self._ack(HTTP_PULL_BATCH=pulled["Pull-Batch"])
+
+        self.assertEqual(resp.json(), {"acknowledged": 1})
+
+
+    def test_ack_is_idempotent_and_ignores_foreign_messages(self):
+        self._create_message("mine")
+        self._create_message("theirs")
+        other = PixStream.objects.create(interation_id="other", ispb=self.ispb)
+        self._pull(limit=1)
+        self.client.get(f"/api/pix/{self.ispb}/stream/{other.interation_id}", HTTP_ACCEPT="application/json")
+        ids = [f"E{self.ispb}mine", f"E{self.ispb}theirs"]
+
+        self.assertEqual(self._ack({"endToEndIds": ids}).json(), {"acknowledged": 1})
+        self.assertEqual(self._ack({"endToEndIds": ids}).json(), {"acknowledged": 0})
+        self.assertEqual(self._statuses()[f"E{self.ispb}theirs"], "reservado")
+
+
+    def test_ack_renews_the_lease(self):
+        PixStream.objects.filter(pk=self.stream.pk).update(last_pull_at=None)
+        self._ack({"endToEndIds": ["E1"]})
+
+        self.stream.refresh_from_db()
+        self.assertIsNotNone(self.stream.last_pull_at)
+
+
+    def test_delete_after_acks_consumes_the_rest(self):
+        for i in range(3):
+            self._create_message(str(i))
+        delivered = [message["endToEndId"] for message in self._pull().json()]
+        self._ack({"endToEndIds": delivered[:1]})
+
+        self.client.delete(f"/api/pix/{self.ispb}/stream/{self.stream.interation_id}")
+
+        self.assertEqual(set(self._statuses().values()), {"finalizado"})
+
+
+    def test_invalid_acks_return_400(self):
+        for body in ({}, {"endToEndIds": []}, {"endToEndIds": [1]}, {"batch": "yesterday"}, ["E1"]):
+            self.assertEqual(self._ack(body).status_code, status.HTTP_400_BAD_REQUEST, body)
+        self.assertEqual(self._ack().status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_closed_stream_returns_410(self):
+        self.stream.active = False
+        self.stream.save(update_fields=["active"])
+
+        self.assertEqual(self._ack({"endToEndIds": ["E1"]}).status_code, status.HTTP_410_GONE)
+
+
+    def test_unknown_stream_returns_404(self):
+        resp = self._ack({"endToEndIds": ["E1"]}, interation_id="missing")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+
+    async def test_async_ack(self):
+        await sync_to_async(self._create_message)("a1")
+        await PixMessage.objects.filter(end_to_end_id=f"E{self.ispb}a1").aupdate(
+            status=PixMessage.MessageStatus.RESERVED, reserved_by=self.stream, reserved_at=timezone.now()
+        )
+        request = AsyncRequestFactory().post(
+            "/ack", json.dumps({"endToEndIds": [f"E{self.ispb}a1"]}), content_type="application/json"
+        )
+
+        resp = await astream_ack(request, self.ispb, self.stream.interation_id)
+
+        self.assertEqual(json.loads(resp.content), {"acknowledged": 1})
@@ -0,0 +1,117 @@
+import asyncio
+import time
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+
+from api.views import astream_continue_or_delete, astream_start
+from data.models import PixMessage, PixStream
+from util.notifications import notify_new_messages, stop_listener
+
+
+def _create_message(ispb: str, suffix: str) -> PixMessage:
+    return PixMessage.objects.create(
+        end_to_end_id=f"E{ispb}{suffix}",
+        tx_id=f"tx{suffix}",
+        amount=Decimal("10.00"),
+        payment_at=timezone.now(),
+        free_text="",
+        payer_name="Tester",
+        payer_cpf_cnpj="12345678901",
+        payer_ispb="87654321",
+        payer_agencia="0001",
+        payer_conta_transacional="111",
+        payer_tipo_conta="CACC",
+        receiver_name="Receiver",
+        receiver_cpf_cnpj="01987654321",
+        receiver_ispb=ispb,
+        receiver_agencia="0001",
+        receiver_conta_transacional="222",
+        receiver_tipo_conta="SVGS",
+    )
+
+
+@override_settings(STREAM_LONG_POLLING_TIMEOUT_SECONDS=0.5)
+class TestAsyncStreamViews(TestCase):
+    def setUp(self) -> None:
+        self.factory = AsyncRequestFactory()
+        self.ispb = "12345678"
+
+
+    async def test_start_returns_single_message(self):
+        await sync_to_async(_create_message)(self.ispb, "a1")
+        request = self.factory.get(f"/api/pix/{self.ispb}/stream/start", HTTP_ACCEPT="application/json")
+        resp = await astream_start(request, self.ispb)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIn("Pull-Next", resp)
+        msg = await PixMessage.objects.aget(end_to_end_id=f"E{self.ispb}a1")
+        self.assertEqual(msg.status, PixMessage.MessageStatus.RESERVED)
+
+
+    async def test_start_over_limit_returns_429(self):
+        await PixStream.objects.abulk_create([
+            PixStream(interation_id=f"s{i}", ispb=self.ispb, active=True) for i in range(6)
+        ])
+        request = self.factory.get(f"/api/pix/{self.ispb}/stream/start")
+        resp = await astream_start(request, self.ispb)
+        self.assertEqual(resp.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+    async def test_continuation_without_messages_returns_204(self):
+        stream = await PixStream.objects.acreate(interation_id="a204", ispb=self.ispb)
+        request = self.factory.get(f"/api/pix/{self.ispb}/stream/a204", HTTP_ACCEPT="application/json")
+        resp = await astream_continue_or_delete(request, self.ispb, stream.interation_id)
+
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertIn("Pull-Next", resp)
+
+
+    async def test_delete_consumes_and_closes_stream(self):
+        stream = await PixStream.objects.acreate(interation_id="adel", ispb=self.ispb)
+        await sync_to_async(_create_message)(self.ispb, "d1")
+        request = self.factory.get(f"/api/pix/{self.ispb}/stream/adel", HTTP_ACCEPT="multipart/json")
+        resp = await astream_continue_or_delete(request, self.ispb, stream.interation_id)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        request = self.factory.delete(f"/api/pix/{self.ispb}/stream/adel")
+        resp = await astream_continue_or_delete(request, self.ispb, stream.interation_id)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        await stream.arefresh_from_db()
+        self.assertFalse(stream.active)
+        msg = await PixMessage.objects.aget(end_to_end_id=f"E{self.ispb}d1")
+        self.assertEqual(msg.status, PixMessage.MessageStatus.CONSUMED)
+
+
+    async def test_closed_stream_returns_410(self):
+        stream = await PixStream.objects.acreate(interation_id="aclosed", ispb=self.ispb, active=False)
+        request = self.factory.get(f"/api/pix/{self.ispb}/stream/aclosed")
+        resp = await astream_continue_or_delete(request, self.ispb, stream.interation_id)
+        self.assertEqual(resp.status_code, status.HTTP_410_GONE)
+
+
+@override_settings(STREAM_LONG_POLLING_TIMEOUT_SECONDS=5.0, STREAM_NOTIFY_SAFETY_POLL_SECONDS=5.0)
+class TestAsyncStreamWakeUp(TransactionTestCase):
+    def setUp(self) -> None:
+        self.factory = AsyncRequestFactory()
+        self.ispb = "12345678"
+        self.addCleanup(stop_listener)
+
+
+    async def test_waiting_pull_wakes_up_on_notification(self):
+        stream = await PixStream.objects.acreate(interation_id="await", ispb=self.ispb)
+        request = self.factory.get(f"/api/pix/{self.ispb}/stream/await", HTTP_ACCEPT="application/json")
+        pull = asyncio.create_task(astream_continue_or_delete(request, self.ispb, stream.interation_id))
+
+        await asyncio.sleep(0.5)
+        await sync_to_async(_create_message)(self.ispb, "w1")
+        await sync_to_async(notify_new_messages)([self.ispb])
+        inserted_at = time.monotonic()
+
+        resp = await asyncio.wait_for(pull, timeout=10)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertLess(time.monotonic() - inserted_at, 0.1)
@@ -0,0 +1,124 @@
+import gzip
+import json
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.views import astream_continue_or_delete
+from data.models import PixMessage, PixStream
+
+
+def _create_messages(ispb: str, count: int) -> None:
+    now = timezone.now()
+    PixMessage.objects.bulk_create([
+        PixMessage(
+            end_to_end_id=f"E{ispb}{i}",
+            tx_id=f"tx{i}",
+            amount=Decimal("10.00"),
+            payment_at=now,
+            free_text="",
+            payer_name="Tester",
+            payer_cpf_cnpj="12345678901",
+            payer_ispb="87654321",
+            payer_agencia="0001",
+            payer_conta_transacional="111",
+            payer_tipo_conta="CACC",
+            receiver_name="Receiver",
+            receiver_cpf_cnpj="01987654321",
+            receiver_ispb=ispb,
+            receiver_agencia="0001",
+            receiver_conta_transacional="222",
+            receiver_tipo_conta="SVGS",
+        )
+        for i in range(count)
+    ])
+
+
+@override_settings(
+    STREAM_LONG_POLLING_TIMEOUT_SECONDS=0.0,
+    STREAM_STREAMING_MIN_MESSAGES=100,
+    STREAM_STREAMING_CHUNK_SIZE=50,
+    STREAM_COMPRESSION_MIN_BYTES=1024,
+)
+class TestStreamCompression(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.ispb = "12345678"
+
+
+    def _pull(self, interation_id: str, limit: int, **headers):
+        PixStream.objects.get_or_create(interation_id=interation_id, ispb=self.ispb)
+        return self.client.get(
+            f"/api/pix/{self.ispb}/stream/{interation_id}?limit={limit}", HTTP_ACCEPT="multipart/json", **headers
+        )
+
+
+    def test_buffered_pull_is_gzipped(self):
+        _create_messages(self.ispb, 20)
+
+        resp = self._pull("buffered", 20, HTTP_ACCEPT_ENCODING="gzip, deflate")
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertFalse(resp.streaming)
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", resp["Vary"])
+        self.assertTrue(resp.has_header("Pull-Batch"))
+        self.assertEqual(len(json.loads(gzip.decompress(resp.content))), 20)
+
+
+    def test_streamed_pull_is_gzipped(self):
+        _create_messages(self.ispb, 120)
+
+        resp = self._pull("streamed", 200, HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        body = json.loads(gzip.decompress(b"".join(resp.streaming_content)))
+        self.assertEqual(sorted(m["endToEndId"] for m in body), sorted(f"E{self.ispb}{i}" for i in range(120)))
+
+
+    def test_identity_without_accept_encoding(self):
+        _create_messages(self.ispb, 20)
+
+        resp = self._pull("plain", 20)
+
+        self.assertFalse(resp.has_header("Content-Encoding"))
+        self.assertEqual(len(resp.json()), 20)
+
+
+    def test_single_message_is_below_the_threshold(self):
+        _create_messages(self.ispb, 1)
+
+        resp = self.client.get(
+            f"/api/pix/{self.ispb}/stream/start", HTTP_ACCEPT="application/json", HTTP_ACCEPT_ENCODING="gzip"
+        )
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertFalse(resp.has_header("Content-Encoding"))
+
+
+    def test_empty_pull_is_untouched(self):
+        resp = self._pull("empty", 10, HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(resp.has_header("Content-Encoding"))
+
+
+    async def test_async_streamed_pull_is_gzipped(self):
+        await sync_to_async(_create_messages)(self.ispb, 120)
+        stream = await PixStream.objects.acreate(interation_id="abig", ispb=self.ispb)
+        request = AsyncRequestFactory().get(
+            f"/api/pix/{self.ispb}/stream/abig?limit=200",
+            headers={"accept": "multipart/json", "accept-encoding": "gzip"},
+        )
+
+        resp = await astream_continue_or_delete(request, self.ispb, stream.interation_id)
+
+        self.assertTrue(resp.is_async)
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        body = b"".join([chunk async for chunk in resp.streaming_content])
+        self.assertEqual(len(json.loads(gzip.decompress(body))), 120)
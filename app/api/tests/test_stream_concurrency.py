@@ -0,0 +1,175 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from data.models import PixMessage, PixStream
+from util.utils import ADMISSION_LOCK_CLASS
+
+
+@override_settings(STREAM_LONG_POLLING_TIMEOUT_SECONDS=1.0, STREAM_NOTIFICATIONS_ENABLED=False)
+class TestStreamConcurrency(TransactionTestCase):
+    def setUp(self) -> None:
+        self.ispb = "12345678"
+
+
+    def _create_message(self, suffix: str) -> PixMessage:
+        return PixMessage.objects.create(
+            end_to_end_id=f"E{self.ispb}{suffix}",
+            tx_id=f"tx{suffix}",
+            amount=Decimal("10.00"),
+            payment_at=timezone.now(),
+            free_text="",
+            payer_name="Tester",
+            payer_cpf_cnpj="12345678901",
+            payer_ispb="87654321",
+            payer_agencia="0001",
+            payer_conta_transacional="111",
+            payer_tipo_conta="CACC",
+            receiver_name="Receiver",
+            receiver_cpf_cnpj="01987654321",
+            receiver_ispb=self.ispb,
+            receiver_agencia="0001",
+            receiver_conta_transacional="222",
+            receiver_tipo_conta="SVGS",
+        )
+
+
+    def _run_parallel(self, requests: int, path: str, accept: str = "application/json") -> list:
+        results = []
+        lock = threading.Lock()
+
+        def run():
+            try:
+                resp = APIClient().get(path, HTTP_ACCEPT=accept)
+                body = resp.json() if resp.status_code == status.HTTP_200_OK else None
+                with lock:
+                    results.append((resp.status_code, body))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+        return results
+
+
+    def test_parallel_starts_complete_in_one_poll_window(self):
+        PixStream.objects.create(interation_id="existing", ispb=self.ispb)
+
+        started = time.monotonic()
+        results = self._run_parallel(5, f"/api/pix/{self.ispb}/stream/start")
+        elapsed = time.monotonic() - started
+
+        self.assertEqual([code for code, _ in results], [status.HTTP_204_NO_CONTENT] * 5)
+        self.assertLess(elapsed, 2.0)
+
+
+    def test_parallel_pulls_on_one_stream_complete_in_one_poll_window(self):
+        stream = PixStream.objects.create(interation_id="shared", ispb=self.ispb)
+
+        started = time.monotonic()
+        results = self._run_parallel(4, f"/api/pix/{self.ispb}/stream/{stream.interation_id}")
+        elapsed = time.monotonic() - started
+
+        self.assertEqual([code for code, _ in results], [status.HTTP_204_NO_CONTENT] * 4)
+        self.assertLess(elapsed, 2.0)
+
+
+    def test_waiting_pull_does_not_stay_idle_in_transaction(self):
+        stream = PixStream.objects.create(interation_id="idle", ispb=self.ispb)
+        thread = threading.Thread(
+            target=self._run_parallel, args=(1, f"/api/pix/{self.ispb}/stream/{stream.interation_id}")
+        )
+        thread.start()
+        time.sleep(0.5)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_stat_activity "
+                "WHERE datname = current_database() AND state = 'idle in transaction'"
+            )
+            idle_in_transaction = cursor.fetchone()[0]
+        thread.join(timeout=10)
+
+        self.assertEqual(idle_in_transaction, 0)
+
+
+    def test_parallel_starts_never_deliver_a_message_twice(self):
+        for i in range(30):
+            self._create_message(str(i))
+
+        results = self._run_parallel(6, f"/api/pix/{self.ispb}/stream/start", accept="multipart/json")
+        delivered = [m["endToEndId"] for code, body in results if body for m in body]
+
+        self.assertEqual(len(delivered), len(set(delivered)))
+        self.assertEqual(
+            PixMessage.objects.filter(status=PixMessage.MessageStatus.RESERVED).count(), len(delivered)
+        )
+
+
+    def test_delete_consumes_reservation_made_while_closing(self):
+        stream = PixStream.objects.create(interation_id="racing", ispb=self.ispb)
+        self._create_message("late")
+
+        results = self._run_parallel(1, f"/api/pix/{self.ispb}/stream/{stream.interation_id}")
+        resp = APIClient().delete(f"/api/pix/{self.ispb}/stream/{stream.interation_id}")
+
+        self.assertEqual(results[0][0], status.HTTP_200_OK)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        message = PixMessage.objects.get(end_to_end_id=f"E{self.ispb}late")
+        self.assertEqual(message.status, PixMessage.MessageStatus.CONSUMED)
+
+
+    @override_settings(STREAM_MAX_COLLECTORS_PER_ISPB=6, STREAM_LONG_POLLING_TIMEOUT_SECONDS=0.0)
+    def test_parallel_starts_admit_exactly_the_collector_limit(self):
+        results = self._run_parallel(10, f"/api/pix/{self.ispb}/stream/start")
+        codes = sorted(code for code, _ in results)
+
+        self.assertEqual(codes, [status.HTTP_204_NO_CONTENT] * 6 + [status.HTTP_429_TOO_MANY_REQUESTS] * 4)
+        self.assertEqual(PixStream.objects.filter(ispb=self.ispb, active=True).count(), 6)
+
+
+    @override_settings(STREAM_LONG_POLLING_TIMEOUT_SECONDS=0.0)
+    def test_admission_of_one_ispb_does_not_wait_for_another(self):
+        holder = threading.Event()
+        release = threading.Event()
+
+        def hold_admission_lock():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("BEGIN")
+                    cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", [ADMISSION_LOCK_CLASS, int(self.ispb)])
+                    holder.set()
+                    release.wait(10)
+                    cursor.execute("ROLLBACK")
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold_admission_lock)
+        thread.start()
+        holder.wait(5)
+        try:
+            started = time.monotonic()
+            other = self._run_parallel(1, "/api/pix/87654321/stream/start")
+            elapsed = time.monotonic() - started
+            waiting = threading.Thread(target=self._run_parallel, args=(1, f"/api/pix/{self.ispb}/stream/start"))
+            waiting.start()
+            waiting.join(timeout=0.5)
+            self.assertTrue(waiting.is_alive())
+        finally:
+            release.set()
+            thread.join(timeout=10)
+        waiting.join(timeout=10)
+
+        self.assertEqual(other[0][0], status.HTTP_204_NO_CONTENT)
+        self.assertLess(elapsed, 1.0)
+        self.assertFalse(waiting.is_alive())
+        self.assertEqual(PixStream.objects.filter(ispb=self.ispb, active=True).count(), 1)
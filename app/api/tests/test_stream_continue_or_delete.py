@@ -1,5 +1,5 @@
 from decimal import Decimal
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
@@ -159,4 +159,80 @@ class TestStreamContinueAndDelete(TestCase):
         self.assertEqual(r2.status_code, status.HTTP_200_OK)
         id2 = r2.json()["endToEndId"]
 
-        self.assertNotEqual(id1, id2)
\ No newline at end of file
+        self.assertNotEqual(id1, id2)
+
+
+    def test_multipart_limit_query_param_sets_batch_size(self):
+        stream = self._create_stream("limit")
+        for i in range(30):
+            self._create_message(f"lq{i}")
+        resp = self.client.get(
+            f"/api/pix/{self.ispb}/stream/{stream.interation_id}?limit=25", HTTP_ACCEPT="multipart/json"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(resp.json()), 25)
+        self.assertEqual(resp["Pull-Next"], f"/api/pix/{self.ispb}/stream/{stream.interation_id}")
+
+
+    @override_settings(STREAM_MULTIPART_MAX_MESSAGES=20)
+    def test_multipart_limit_header_is_capped_by_settings(self):
+        stream = self._create_stream("capped")
+        for i in range(30):
+            self._create_message(f"lh{i}")
+        resp = self.client.get(
+            f"/api/pix/{self.ispb}/stream/{stream.interation_id}",
+            HTTP_ACCEPT="multipart/json",
+            HTTP_PULL_LIMIT="500",
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(resp.json()), 20)
+
+
+    def test_invalid_limit_returns_400(self):
+        stream = self._create_stream("badlimit")
+        resp = self.client.get(
+            f"/api/pix/{self.ispb}/stream/{stream.interation_id}?limit=0", HTTP_ACCEPT="multipart/json"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("detail", resp.json())
+
+
+    def test_single_message_pull_ignores_limit(self):
+        stream = self._create_stream("single")
+        for i in range(3):
+            self._create_message(f"ls{i}")
+        resp = self.client.get(
+            f"/api/pix/{self.ispb}/stream/{stream.interation_id}?limit=3", HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(resp.json(), dict)
+
+
+    def test_multipart_batch_respects_byte_budget(self):
+        stream = self._create_stream("budget")
+        for i in range(10):
+            self._create_message(f"lb{i}")
+        with override_settings(STREAM_MULTIPART_MAX_BYTES=1500):
+            resp = self.client.get(
+                f"/api/pix/{self.ispb}/stream/{stream.interation_id}?limit=10", HTTP_ACCEPT="multipart/json"
+            )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(resp.content), 1500)
+        self.assertGreater(len(resp.json()), 0)
+        self.assertEqual(PixMessage.objects.filter(reserved_by=stream).count(), len(resp.json()))
+
+
+    def test_multipart_byte_budget_counts_escaped_non_ascii_names(self):
+        stream = self._create_stream("budget-accents")
+        for i in range(10):
+            self._create_message(f"la{i}")
+        # Each accented letter goes out as a 6-byte \uXXXX escape, not 2 UTF-8 bytes.
+        PixMessage.objects.update(payer_name="Conceição Ávila " * 5, receiver_name="João Gonçalves " * 5)
+        with override_settings(STREAM_MULTIPART_MAX_BYTES=3000):
+            resp = self.client.get(
+                f"/api/pix/{self.ispb}/stream/{stream.interation_id}?limit=10", HTTP_ACCEPT="multipart/json"
+            )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(resp.content), 3000)
+        self.assertGreater(len(resp.json()), 0)
+        self.assertEqual(resp.json()[0]["pagador"]["nome"], "Conceição Ávila " * 5)
@@ -0,0 +1,119 @@
+from decimal import Decimal
+
+import msgpack
+from asgiref.sync import sync_to_async
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.views import astream_continue_or_delete
+from data.models import PixMessage, PixStream
+from data.serializers import PixMessageSerializer
+
+
+def _create_messages(ispb: str, count: int) -> None:
+    now = timezone.now()
+    PixMessage.objects.bulk_create([
+        PixMessage(
+            end_to_end_id=f"E{ispb}{i:04d}",
+            tx_id=f"tx{i}",
+            amount=Decimal("10.25"),
+            payment_at=now,
+            free_text="",
+            payer_name="Tester",
+            payer_cpf_cnpj="12345678901",
+            payer_ispb="87654321",
+            payer_agencia="0001",
+            payer_conta_transacional="111",
+            payer_tipo_conta="CACC",
+            receiver_name="Receiver",
+            receiver_cpf_cnpj="01987654321",
+            receiver_ispb=ispb,
+            receiver_agencia="0001",
+            receiver_conta_transacional="222",
+            receiver_tipo_conta="SVGS",
+        )
+        for i in range(count)
+    ])
+
+
+def _unpack(body: bytes) -> list:
+    unpacker = msgpack.Unpacker(timestamp=3)
+    unpacker.feed(body)
+    return list(unpacker)
+
+
+@override_settings(
+    STREAM_LONG_POLLING_TIMEOUT_SECONDS=0.0,
+    STREAM_STREAMING_MIN_MESSAGES=100,
+    STREAM_STREAMING_CHUNK_SIZE=50,
+)
+class TestStreamMsgpack(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.ispb = "12345678"
+
+
+    def _pull(self, interation_id: str, accept: str, limit: int = 10):
+        PixStream.objects.get_or_create(interation_id=interation_id, ispb=self.ispb)
+        return self.client.get(f"/api/pix/{self.ispb}/stream/{interation_id}?limit={limit}", HTTP_ACCEPT=accept)
+
+
+    def test_single_pull(self):
+        _create_messages(self.ispb, 2)
+
+        resp = self.client.get(f"/api/pix/{self.ispb}/stream/start", HTTP_ACCEPT="application/msgpack")
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp["Content-Type"], "application/msgpack")
+        [message] = _unpack(resp.content)
+        stored = PixMessage.objects.get(end_to_end_id=message["endToEndId"])
+        self.assertEqual(message["valor"], 1025)
+        self.assertEqual(message["dataHoraPagamento"], stored.payment_at)
+        self.assertEqual(message["recebedor"]["ispb"], self.ispb)
+
+
+    def test_batch_pull_has_the_json_fields(self):
+        _create_messages(self.ispb, 6)
+
+        packed = _unpack(self._pull("binary", "multipart/msgpack", limit=3).content)
+
+        self.assertEqual(len(packed), 3)
+        for message in packed:
+            stored = PixMessage.objects.get(end_to_end_id=message["endToEndId"])
+            expected = dict(PixMessageSerializer(stored).data)
+            expected["valor"] = 1025
+            expected["dataHoraPagamento"] = stored.payment_at
+            self.assertEqual(message, expected)
+
+
+    def test_streamed_batch_pull(self):
+        _create_messages(self.ispb, 120)
+
+        resp = self._pull("streamed", "multipart/msgpack", limit=200)
+
+        self.assertTrue(resp.streaming)
+        messages = _unpack(b"".join(resp.streaming_content))
+        self.assertEqual(sorted(m["endToEndId"] for m in messages), [f"E{self.ispb}{i:04d}" for i in range(120)])
+
+
+    def test_unknown_binary_type_is_still_406(self):
+        resp = self._pull("cbor", "application/cbor")
+
+        self.assertEqual(resp.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+        self.assertIn("multipart/msgpack", resp.json()["detail"])
+
+
+    async def test_async_streamed_batch_pull(self):
+        await sync_to_async(_create_messages)(self.ispb, 120)
+        stream = await PixStream.objects.acreate(interation_id="abig", ispb=self.ispb)
+        request = AsyncRequestFactory().get(
+            f"/api/pix/{self.ispb}/stream/abig?limit=200", headers={"accept": "multipart/msgpack"}
+        )
+
+        resp = await astream_continue_or_delete(request, self.ispb, stream.interation_id)
+
+        self.assertTrue(resp.is_async)
+        body = b"".join([chunk async for chunk in resp.streaming_content])
+        self.assertEqual(len(_unpack(body)), 120)
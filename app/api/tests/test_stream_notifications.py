@@ -0,0 +1,199 @@
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from data.models import PixMessage, PixStream
+from util import metrics
+from util.notifications import MessageListener, get_listener, stop_listener
+
+
+def _claims() -> int:
+    return sum(
+        int(sum(values[:-1]))
+        for (name, _), values in metrics._current().histograms.items()
+        if name == "stream_claim_seconds"
+    )
+
+
+@override_settings(STREAM_LONG_POLLING_TIMEOUT_SECONDS=5.0, STREAM_NOTIFY_SAFETY_POLL_SECONDS=5.0)
+class TestStreamNotifications(TransactionTestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.ispb = "12345678"
+        self.addCleanup(stop_listener)
+
+
+    def _pull_in_thread(self, interation_id: str, result: dict) -> threading.Thread:
+        def run():
+            try:
+                resp = APIClient().get(
+                    f"/api/pix/{self.ispb}/stream/{interation_id}", HTTP_ACCEPT="application/json"
+                )
+                result["status"] = resp.status_code
+                result["finished_at"] = time.monotonic()
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+
+    def _wait_until_listening(self) -> None:
+        listener = get_listener()
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            if listener.available and f"pix_ispb_{self.ispb}" in listener._listening:
+                return
+            time.sleep(0.01)
+        self.fail("listener did not subscribe to the ispb channel")
+
+
+    def test_waiting_stream_wakes_up_right_after_insert(self):
+        stream = PixStream.objects.create(interation_id="wake", ispb=self.ispb)
+        result: dict = {}
+        thread = self._pull_in_thread(stream.interation_id, result)
+
+        self._wait_until_listening()
+        time.sleep(0.2)
+        resp = self.client.post(f"/api/util/msgs/{self.ispb}/1")
+        inserted_at = time.monotonic()
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+
+        thread.join(timeout=10)
+        self.assertEqual(result["status"], status.HTTP_200_OK)
+        self.assertLess(result["finished_at"] - inserted_at, 0.1)
+
+
+    @override_settings(STREAM_NOTIFICATIONS_ENABLED=False)
+    def test_falls_back_to_polling_without_notifications(self):
+        stream = PixStream.objects.create(interation_id="poll", ispb=self.ispb)
+        result: dict = {}
+        thread = self._pull_in_thread(stream.interation_id, result)
+
+        time.sleep(0.3)
+        resp = self.client.post(f"/api/util/msgs/{self.ispb}/1")
+        inserted_at = time.monotonic()
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+
+        thread.join(timeout=10)
+        self.assertEqual(result["status"], status.HTTP_200_OK)
+        self.assertLess(result["finished_at"] - inserted_at, 1.0)
+
+
+    def test_missed_notification_is_found_by_the_probe(self):
+        stream = PixStream.objects.create(interation_id="missed", ispb=self.ispb)
+        result: dict = {}
+        with override_settings(STREAM_NOTIFY_SAFETY_POLL_SECONDS=0.4):
+            thread = self._pull_in_thread(stream.interation_id, result)
+            self._wait_until_listening()
+            time.sleep(0.2)
+            # Written without notify_new_messages, like a notification lost in transit.
+            PixMessage.objects.create(
+                end_to_end_id=f"E{self.ispb}missed",
+                tx_id="txmissed",
+                amount=Decimal("10.00"),
+                payment_at=timezone.now(),
+                free_text="",
+                payer_name="Tester",
+                payer_cpf_cnpj="12345678901",
+                payer_ispb="87654321",
+                payer_agencia="0001",
+                payer_conta_transacional="111",
+                payer_tipo_conta="CACC",
+                receiver_name="Receiver",
+                receiver_cpf_cnpj="01987654321",
+                receiver_ispb=self.ispb,
+                receiver_agencia="0001",
+                receiver_conta_transacional="222",
+                receiver_tipo_conta="SVGS",
+            )
+            inserted_at = time.monotonic()
+            thread.join(timeout=10)
+
+        self.assertEqual(result["status"], status.HTTP_200_OK)
+        self.assertLess(result["finished_at"] - inserted_at, 1.0)
+
+
+    @override_settings(
+        STREAM_NOTIFICATIONS_ENABLED=False,
+        STREAM_LONG_POLLING_TIMEOUT_SECONDS=1.5,
+        STREAM_POLL_INTERVAL_SECONDS=0.05,
+        STREAM_POLL_MAX_INTERVAL_SECONDS=0.4,
+    )
+    def test_waiters_of_an_ispb_share_one_probe(self):
+        streams = [PixStream.objects.create(interation_id=f"shared-{n}", ispb=self.ispb) for n in range(6)]
+        metrics._registry = metrics._Registry()
+        results = [{} for _ in streams]
+        threads = [self._pull_in_thread(stream.interation_id, result) for stream, result in zip(streams, results)]
+        for thread in threads:
+            thread.join(timeout=10)
+
+        self.assertEqual([result["status"] for result in results], [status.HTTP_204_NO_CONTENT] * len(streams))
+        # Alone, each waiter would have claimed every 50 ms, about 30 times; here
+        # it claims on arrival and maybe once more before the listener connects.
+        self.assertLessEqual(_claims(), 3 * len(streams))
+        self.assertLessEqual(get_listener().probes, 10)
+
+
+    @override_settings(STREAM_POLL_INTERVAL_SECONDS=0.05, STREAM_POLL_MAX_INTERVAL_SECONDS=0.2)
+    def test_probe_backs_off_while_idle_and_resets_on_delivery(self):
+        listener = MessageListener(listen=False)
+        listener.start()
+        self.addCleanup(listener.stop)
+        with listener.subscribe(self.ispb) as subscription:
+            self.assertFalse(subscription.wait(0.6))
+            probe = listener._probes[f"pix_ispb_{self.ispb}"]
+            self.assertEqual(probe.interval, 0.2)
+            # 0.05 + 0.1 + 0.2 + 0.2: a fixed 50 ms timer would have run twelve.
+            self.assertLessEqual(listener.probes, 5)
+
+            listener.delivered(self.ispb)
+            self.assertEqual(probe.interval, 0.05)
+
+            listener.delivered(self.ispb, full=True)
+            self.assertTrue(subscription.wait(0))
+
+
+    @override_settings(STREAM_POLL_INTERVAL_SECONDS=0.05, STREAM_POLL_MAX_INTERVAL_SECONDS=0.2)
+    def test_busy_probe_keeps_its_interval_while_a_waiter_stays_subscribed(self):
+        resp = self.client.post(f"/api/util/msgs/{self.ispb}/1")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        listener = MessageListener(listen=False)
+        listener.start()
+        self.addCleanup(listener.stop)
+        with listener.subscribe(self.ispb) as subscription:
+            # Woken but never claiming, like a waiter stuck behind the pool.
+            self.assertTrue(subscription.wait(1.0))
+            probes = listener.probes
+            time.sleep(0.5)
+            # One probe per 50 ms interval, not one per loop iteration.
+            self.assertLessEqual(listener.probes - probes, 15)
+
+
+    @override_settings(STREAM_POLL_INTERVAL_SECONDS=0.05)
+    def test_listener_survives_an_unexpected_error(self):
+        resp = self.client.post(f"/api/util/msgs/{self.ispb}/1")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        failures = [RuntimeError("metrics backend down")]
+
+        def fail_once(*args, **kwargs):
+            if failures:
+                raise failures.pop()
+
+        with mock.patch("util.notifications.increment_counter", side_effect=fail_once):
+            listener = MessageListener(listen=False)
+            listener.start()
+            self.addCleanup(listener.stop)
+            with listener.subscribe(self.ispb) as subscription:
+                self.assertTrue(subscription.wait(5.0))
+
+        self.assertEqual(failures, [])
+        self.assertTrue(listener.is_running())
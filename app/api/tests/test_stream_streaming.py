@@ -0,0 +1,161 @@
+import json
+import tracemalloc
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.views import astream_continue_or_delete
+from data.models import PixMessage, PixStream
+from data.serializers import PIX_MESSAGE_WIRE_FIELDS, encode_pix_messages
+
+
+def _create_messages(ispb: str, count: int, prefix: str = "m") -> None:
+    now = timezone.now()
+    PixMessage.objects.bulk_create([
+        PixMessage(
+            end_to_end_id=f"E{ispb}{prefix}{i}",
+            tx_id=f"tx{prefix}{i}",
+            amount=Decimal("10.00"),
+            payment_at=now,
+            free_text="",
+            payer_name="Tester",
+            payer_cpf_cnpj="12345678901",
+            payer_ispb="87654321",
+            payer_agencia="0001",
+            payer_conta_transacional="111",
+            payer_tipo_conta="CACC",
+            receiver_name="Receiver",
+            receiver_cpf_cnpj="01987654321",
+            receiver_ispb=ispb,
+            receiver_agencia="0001",
+            receiver_conta_transacional="222",
+            receiver_tipo_conta="SVGS",
+        )
+        for i in range(count)
+    ])
+
+
+@override_settings(
+    STREAM_LONG_POLLING_TIMEOUT_SECONDS=0.0,
+    STREAM_MULTIPART_MAX_MESSAGES=5000,
+    STREAM_STREAMING_MIN_MESSAGES=100,
+    STREAM_STREAMING_CHUNK_SIZE=50,
+)
+class TestStreamedMultipartResponse(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.ispb = "12345678"
+
+
+    def _pull(self, stream: PixStream, limit: int):
+        return self.client.get(
+            f"/api/pix/{self.ispb}/stream/{stream.interation_id}?limit={limit}",
+            HTTP_ACCEPT="multipart/json",
+        )
+
+
+    def _json(self, resp) -> list:
+        return json.loads(b"".join(resp.streaming_content))
+
+
+    def test_large_batch_is_streamed(self):
+        _create_messages(self.ispb, 120)
+        stream = PixStream.objects.create(interation_id="big", ispb=self.ispb)
+        resp = self._pull(stream, 200)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(resp, StreamingHttpResponse)
+        self.assertIn("Pull-Next", resp)
+        self.assertEqual(len(self._json(resp)), 120)
+        self.assertEqual(
+            PixMessage.objects.filter(reserved_by=stream, status=PixMessage.MessageStatus.RESERVED).count(), 120
+        )
+
+
+    def test_small_batch_is_not_streamed(self):
+        _create_messages(self.ispb, 5)
+        stream = PixStream.objects.create(interation_id="small", ispb=self.ispb)
+        resp = self._pull(stream, 10)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotIsInstance(resp, StreamingHttpResponse)
+        self.assertEqual(len(resp.json()), 5)
+
+
+    def test_streamed_body_matches_in_memory_encoding(self):
+        _create_messages(self.ispb, 130)
+        stream = PixStream.objects.create(interation_id="bytes", ispb=self.ispb)
+        body = b"".join(self._pull(stream, 1000).streaming_content)
+
+        rows = PixMessage.objects.filter(reserved_by=stream).order_by("id").values_list(*PIX_MESSAGE_WIRE_FIELDS)
+        self.assertEqual(body, encode_pix_messages(rows))
+
+
+    def test_streamed_pull_only_returns_its_own_batch(self):
+        _create_messages(self.ispb, 250)
+        stream = PixStream.objects.create(interation_id="twice", ispb=self.ispb)
+        first = self._json(self._pull(stream, 150))
+        second = self._json(self._pull(stream, 150))
+
+        self.assertEqual(len(first), 150)
+        self.assertEqual(len(second), 100)
+        self.assertFalse({m["endToEndId"] for m in first} & {m["endToEndId"] for m in second})
+
+
+    def test_streamed_pull_without_messages_returns_204(self):
+        stream = PixStream.objects.create(interation_id="empty", ispb=self.ispb)
+        resp = self._pull(stream, 500)
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+
+
+    def test_peak_memory_does_not_grow_with_batch_size(self):
+        def peak_while_draining(count: int, prefix: str) -> int:
+            _create_messages(self.ispb, count, prefix)
+            stream = PixStream.objects.create(interation_id=f"mem{prefix}", ispb=self.ispb)
+            tracemalloc.start()
+            try:
+                resp = self._pull(stream, count)
+                largest = max(len(chunk) for chunk in resp.streaming_content)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            self.assertLess(largest, 50 * 1024)
+            return peak
+
+        small = peak_while_draining(200, "s")
+        large = peak_while_draining(4000, "l")
+        # Twenty times the messages, bounded by the chunk size rather than the batch.
+        self.assertLess(large, small * 2)
+
+
+@override_settings(
+    STREAM_LONG_POLLING_TIMEOUT_SECONDS=0.0,
+    STREAM_STREAMING_MIN_MESSAGES=100,
+    STREAM_STREAMING_CHUNK_SIZE=50,
+)
+class TestAsyncStreamedMultipartResponse(TestCase):
+    def setUp(self) -> None:
+        self.factory = AsyncRequestFactory()
+        self.ispb = "12345678"
+
+
+    async def test_async_view_streams_large_batch(self):
+        await sync_to_async(_create_messages)(self.ispb, 120)
+        stream = await PixStream.objects.acreate(interation_id="abig", ispb=self.ispb)
+        request = self.factory.get(
+            f"/api/pix/{self.ispb}/stream/abig?limit=200", headers={"accept": "multipart/json"}
+        )
+        resp = await astream_continue_or_delete(request, self.ispb, stream.interation_id)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.is_async)
+        body = b"".join([chunk async for chunk in resp.streaming_content])
+        rows = await sync_to_async(list)(
+            PixMessage.objects.filter(reserved_by=stream).order_by("id").values_list(*PIX_MESSAGE_WIRE_FIELDS)
+        )
+        self.assertEqual(body, encode_pix_messages(rows))
@@ -1,12 +1,31 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import stream_start, stream_continue_or_delete
+from .views import (
+    astream_ack,
+    astream_continue_or_delete,
+    astream_start,
+    ingest_messages,
+    message_history,
+    stream_ack,
+    stream_continue_or_delete,
+    stream_start,
+)
+
+
+if settings.STREAM_ASYNC_VIEWS:
+    start_view, continue_or_delete_view, ack_view = astream_start, astream_continue_or_delete, astream_ack
+else:
+    start_view, continue_or_delete_view, ack_view = stream_start, stream_continue_or_delete, stream_ack
 
 
 urlpatterns = [
-    path("pix/<str:ispb>/stream/start", stream_start, name="stream_start"),
+    path("pix/ingest", ingest_messages, name="ingest_messages"),
+    path("pix/<str:ispb>/history", message_history, name="message_history"),
+    path("pix/<str:ispb>/stream/start", start_view, name="stream_start"),
     path("pix/<str:ispb>/stream/<str:interation_id>",
-        stream_continue_or_delete,
+        continue_or_delete_view,
         name="stream_continue_or_delete",
     ),
+    path("pix/<str:ispb>/stream/<str:interation_id>/ack", ack_view, name="stream_ack"),
 ]
@@ -1,45 +1,49 @@
-from django.db import transaction
-from django.http import JsonResponse
-from django.views.decorators.http import require_GET, require_http_methods
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 
 from data.models import PixStream
-from django.conf import settings
+from data.serializers import encode_pix_messages, iter_encode_pix_messages
 import logging
+from util.compression import compress_response
+from util.history import parse_history_query
+from util.ingest import ingest_pix_messages, iter_json_array, iter_ndjson, parse_priority
 from util.utils import (
-    generate_random_string,
+    acknowledge_messages,
+    admit_stream,
+    astream_fetch_and_response,
+    stream_closed_response,
     stream_fetch_and_response,
     consume_and_close_stream,
+    invalid_ack_response,
     is_valid_ispb,
+    parse_ack_request,
 )
 
 @require_GET
-@transaction.atomic
 def stream_start(request, ispb: str):
     logger = logging.getLogger(__name__)
     if not is_valid_ispb(ispb):
         return JsonResponse({"detail": "Invalid ispb. Expected 8 digits."}, status=400)
-    active_count = PixStream.objects.select_for_update().filter(ispb=ispb, active=True).count()
-    
-    max_collectors = int(getattr(settings, "STREAM_MAX_COLLECTORS_PER_ISPB", 6))
-    if active_count >= max_collectors:
-        logger.warning("stream.limit_reached", extra={"ispb": ispb, "active": active_count})
+
+    stream = admit_stream(ispb)
+    if stream is None:
         return JsonResponse({"detail": "Too Many Streams"}, status=429)
 
-    stream = PixStream.objects.create(interation_id=generate_random_string(12), ispb=ispb)
     logger.info("stream.start", extra={"ispb": ispb, "stream": stream.interation_id})
     return stream_fetch_and_response(request, stream)
 
 
 @csrf_exempt
 @require_http_methods(["GET", "DELETE"])
-@transaction.atomic
 def stream_continue_or_delete(request, ispb: str, interation_id: str):
     logger = logging.getLogger(__name__)
     if not is_valid_ispb(ispb):
         return JsonResponse({"detail": "Invalid ispb. Expected 8 digits."}, status=400)
     try:
-        stream = PixStream.objects.select_for_update().get(interation_id=interation_id, ispb=ispb)
+        stream = PixStream.objects.get(interation_id=interation_id, ispb=ispb, is_prefetch=False)
     except PixStream.DoesNotExist:
         return JsonResponse({"detail": "Stream not found for provided interationId and ispb."}, status=404)
 
@@ -49,6 +53,135 @@ def stream_continue_or_delete(request, ispb: str, interation_id: str):
         return JsonResponse({})
 
     if not stream.active:
-        return JsonResponse({"detail": "Stream is already closed. Start a new stream."}, status=410)
+        return stream_closed_response()
+
+    return stream_fetch_and_response(request, stream)
+
+
+@csrf_exempt
+@require_POST
+def stream_ack(request, ispb: str, interation_id: str):
+    logger = logging.getLogger(__name__)
+    if not is_valid_ispb(ispb):
+        return JsonResponse({"detail": "Invalid ispb. Expected 8 digits."}, status=400)
+    try:
+        stream = PixStream.objects.get(interation_id=interation_id, ispb=ispb, is_prefetch=False)
+    except PixStream.DoesNotExist:
+        return JsonResponse({"detail": "Stream not found for provided interationId and ispb."}, status=404)
+
+    selection = parse_ack_request(request)
+    if selection is None:
+        return invalid_ack_response()
+    acknowledged = acknowledge_messages(stream, **selection)
+    if acknowledged is None:
+        return stream_closed_response()
+
+    logger.info("stream.ack", extra={"ispb": ispb, "stream": interation_id, "count": acknowledged})
+    return JsonResponse({"acknowledged": acknowledged})
+
+
+@require_GET
+async def astream_start(request, ispb: str):
+    logger = logging.getLogger(__name__)
+    if not is_valid_ispb(ispb):
+        return JsonResponse({"detail": "Invalid ispb. Expected 8 digits."}, status=400)
+
+    stream = await sync_to_async(admit_stream)(ispb)
+    if stream is None:
+        return JsonResponse({"detail": "Too Many Streams"}, status=429)
+
+    logger.info("stream.start", extra={"ispb": ispb, "stream": stream.interation_id})
+    return await astream_fetch_and_response(request, stream)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "DELETE"])
+async def astream_continue_or_delete(request, ispb: str, interation_id: str):
+    logger = logging.getLogger(__name__)
+    if not is_valid_ispb(ispb):
+        return JsonResponse({"detail": "Invalid ispb. Expected 8 digits."}, status=400)
+    try:
+        stream = await PixStream.objects.aget(interation_id=interation_id, ispb=ispb, is_prefetch=False)
+    except PixStream.DoesNotExist:
+        return JsonResponse({"detail": "Stream not found for provided interationId and ispb."}, status=404)
+
+    if request.method == "DELETE":
+        await sync_to_async(consume_and_close_stream)(stream)
+        logger.info("stream.delete", extra={"ispb": ispb, "stream": interation_id})
+        return JsonResponse({})
+
+    if not stream.active:
+        return stream_closed_response()
+
+    return await astream_fetch_and_response(request, stream)
+
+
+@csrf_exempt
+@require_POST
+async def astream_ack(request, ispb: str, interation_id: str):
+    logger = logging.getLogger(__name__)
+    if not is_valid_ispb(ispb):
+        return JsonResponse({"detail": "Invalid ispb. Expected 8 digits."}, status=400)
+    try:
+        stream = await PixStream.objects.aget(interation_id=interation_id, ispb=ispb, is_prefetch=False)
+    except PixStream.DoesNotExist:
+        return JsonResponse({"detail": "Stream not found for provided interationId and ispb."}, status=404)
+
+    selection = parse_ack_request(request)
+    if selection is None:
+        return invalid_ack_response()
+    acknowledged = await sync_to_async(acknowledge_messages)(stream, **selection)
+    if acknowledged is None:
+        return stream_closed_response()
+
+    logger.info("stream.ack", extra={"ispb": ispb, "stream": interation_id, "count": acknowledged})
+    return JsonResponse({"acknowledged": acknowledged})
+
+
+@csrf_exempt
+@require_POST
+def ingest_messages(request):
+    logger = logging.getLogger(__name__)
+    priority = parse_priority(request.GET.get("priority"))
+    if priority is None:
+        return JsonResponse({"detail": "Invalid priority. Expected alta, normal or baixa."}, status=400)
+    if request.content_type == "application/x-ndjson":
+        records = iter_ndjson(request)
+    elif request.content_type == "application/json":
+        records = iter_json_array(request)
+    else:
+        return JsonResponse(
+            {"detail": "Unsupported Content-Type. Use application/x-ndjson or application/json."}, status=415
+        )
+
+    report = ingest_pix_messages(records, priority=priority)
+    logger.info("ingest.done", extra={"inserted": report["inserted"], "rejected": len(report["rejected"])})
+    return JsonResponse(report)
+
+
+@require_GET
+def message_history(request, ispb: str):
+    logger = logging.getLogger(__name__)
+    if not is_valid_ispb(ispb):
+        return JsonResponse({"detail": "Invalid ispb. Expected 8 digits."}, status=400)
+    query = parse_history_query(ispb, request.GET)
+    if query is None:
+        return JsonResponse(
+            {"detail": "Invalid history query. Expected integer after/limit and ISO-8601 times with offset."},
+            status=400,
+        )
+
+    bound = query.page_bound()
+    if bound is None:
+        return HttpResponse(b"[]", content_type="application/json")
 
-    return stream_fetch_and_response(request, stream)
\ No newline at end of file
+    if query.limit >= int(getattr(settings, "STREAM_STREAMING_MIN_MESSAGES", 500)):
+        chunk_size = int(getattr(settings, "STREAM_STREAMING_CHUNK_SIZE", 500))
+        response = StreamingHttpResponse(
+            iter_encode_pix_messages(query.rows(bound, chunk_size), chunk_size), content_type="application/json"
+        )
+    else:
+        response = HttpResponse(encode_pix_messages(query.rows(bound)), content_type="application/json")
+    response["History-Next"] = f"/api/pix/{ispb}/history?{query.next_query_string(bound)}"
+    logger.info("history.page", extra={"ispb": ispb, "after": query.after, "bound": bound})
+    return compress_response(request, response)
@@ -0,0 +1,174 @@
+"""
+PostgreSQL backend whose connections come from a bounded per-process pool.
+
+Django's own connection handling is kept: a request still "closes" its
+connection when it finishes (CONN_MAX_AGE = 0), but closing hands the
+psycopg2 connection back to the pool instead of ending the session, and the
+next ``connect()`` takes an idle one. At most ``DB_POOL_MAX_SIZE`` sessions
+are open per process; a thread that needs one while all are in use waits up
+to ``DB_POOL_TIMEOUT_SECONDS``. A connection idle for longer than
+``DB_POOL_CHECK_SECONDS`` is pinged before it is handed out, and one idle for
+longer than ``DB_POOL_MAX_IDLE_SECONDS`` is closed.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+import psycopg2
+from psycopg2 import extensions
+from django.conf import settings
+from django.db import OperationalError
+from django.db.backends.postgresql import base
+
+
+class ConnectionPool:
+    def __init__(self) -> None:
+        self.pid = os.getpid()
+        self._condition = threading.Condition()
+        # (connection, returned at) in LIFO order, so the warm ones are reused.
+        self._idle: List[Tuple[object, float]] = []
+        self.opened = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    @property
+    def max_size(self) -> int:
+        return int(getattr(settings, "DB_POOL_MAX_SIZE", 10))
+
+    def get(self, connect: Callable, timeout: float):
+        """An idle connection, or a new one from ``connect`` while below ``max_size``."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                self._discard_stale()
+                if self._idle:
+                    connection, returned_at = self._idle.pop()
+                    break
+                if self.opened < self.max_size:
+                    connection, returned_at = None, None
+                    self.opened += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise OperationalError(
+                        f"No database connection available: all {self.max_size} pooled connections are in use."
+                    )
+                self._condition.wait(remaining)
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+        try:
+            if connection is None:
+                return connect()
+            if time.monotonic() - returned_at >= float(getattr(settings, "DB_POOL_CHECK_SECONDS", 30.0)):
+                connection = self._checked(connection, connect)
+            return connection
+        except Exception:
+            with self._condition:
+                self.opened -= 1
+                self.in_use -= 1
+                self._condition.notify()
+            raise
+
+    def _checked(self, connection, connect: Callable):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            if not connection.autocommit:
+                connection.rollback()
+            return connection
+        except psycopg2.Error:
+            _close_quietly(connection)
+            return connect()
+
+    def put(self, connection) -> None:
+        reusable = not connection.closed
+        if reusable and connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                reusable = False
+        if not reusable:
+            _close_quietly(connection)
+        with self._condition:
+            self.in_use -= 1
+            if reusable:
+                self._idle.append((connection, time.monotonic()))
+            else:
+                self.opened -= 1
+            self._condition.notify()
+
+    def _discard_stale(self) -> None:
+        max_idle = float(getattr(settings, "DB_POOL_MAX_IDLE_SECONDS", 300.0))
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] >= max_idle:
+            connection, _ = self._idle.pop(0)
+            _close_quietly(connection)
+            self.opened -= 1
+
+    def close_idle(self) -> None:
+        with self._condition:
+            while self._idle:
+                connection, _ = self._idle.pop()
+                _close_quietly(connection)
+                self.opened -= 1
+
+
+def _close_quietly(connection) -> None:
+    try:
+        connection.close()
+    except psycopg2.Error:
+        pass
+
+
+_pools: Dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_for(conn_params: dict) -> ConnectionPool:
+    key = tuple(sorted((name, repr(value)) for name, value in conn_params.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            # A forked worker must not share its parent's sockets.
+            pool = _pools[key] = ConnectionPool()
+        return pool
+
+
+def close_pools() -> None:
+    """Closes every idle pooled connection of this process, e.g. before dropping a database."""
+    with _pools_lock:
+        pools = [pool for pool in _pools.values() if pool.pid == os.getpid()]
+    for pool in pools:
+        pool.close_idle()
+
+
+def pool_stats() -> List[dict]:
+    with _pools_lock:
+        return [
+            {"opened": pool.opened, "in_use": pool.in_use, "peak_in_use": pool.peak_in_use, "max_size": pool.max_size}
+            for pool in _pools.values()
+            if pool.pid == os.getpid()
+        ]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # Closing is cheap, so callers may give the connection back while idle.
+    pooled = True
+
+    def get_new_connection(self, conn_params):
+        self._pool = _pool_for(conn_params)
+        connection = self._pool.get(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            float(getattr(settings, "DB_POOL_TIMEOUT_SECONDS", 10.0)),
+        )
+        # Set by the parent only when it opens a connection.
+        isolation_level = self.settings_dict["OPTIONS"].get("isolation_level")
+        self.isolation_level = base.IsolationLevel(isolation_level or base.IsolationLevel.READ_COMMITTED)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self._pool.put(self.connection)
@@ -80,17 +80,28 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'beeteller.wsgi.application'
 
+TEST_RUNNER = 'beeteller.test_runner.TestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
+# With DB_POOL_ENABLED, connections come from a bounded per-process pool
+# (beeteller/pooled_postgresql) and "closing" one returns it to the pool.
+DB_POOL_ENABLED = config('DB_POOL_ENABLED', default=True, cast=bool)
+DB_POOL_MAX_SIZE = int(config('DB_POOL_MAX_SIZE', default=10))
+DB_POOL_TIMEOUT_SECONDS = float(config('DB_POOL_TIMEOUT_SECONDS', default=10.0))
+DB_POOL_CHECK_SECONDS = float(config('DB_POOL_CHECK_SECONDS', default=30.0))
+DB_POOL_MAX_IDLE_SECONDS = float(config('DB_POOL_MAX_IDLE_SECONDS', default=300.0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'beeteller.pooled_postgresql' if DB_POOL_ENABLED else 'django.db.backends.postgresql',
         'NAME': config('DB_NAME'),
         'USER': config('DB_USER'),
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST'),
         'PORT': config('DB_PORT'),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -143,4 +154,44 @@ REST_FRAMEWORK = {
 }
 
 STREAM_MAX_COLLECTORS_PER_ISPB = int(config('STREAM_MAX_COLLECTORS_PER_ISPB', default=6))
-STREAM_LONG_POLLING_TIMEOUT_SECONDS = float(config('STREAM_LONG_POLLING_TIMEOUT_SECONDS', default=8.0))
\ No newline at end of file
+STREAM_LEASE_TIMEOUT_SECONDS = float(config('STREAM_LEASE_TIMEOUT_SECONDS', default=120.0))
+STREAM_FAIR_SHARE_ENABLED = config('STREAM_FAIR_SHARE_ENABLED', default=True, cast=bool)
+STREAM_FAIR_SHARE_WINDOW_SECONDS = float(config('STREAM_FAIR_SHARE_WINDOW_SECONDS', default=10.0))
+STREAM_LONG_POLLING_TIMEOUT_SECONDS = float(config('STREAM_LONG_POLLING_TIMEOUT_SECONDS', default=8.0))
+STREAM_POLL_INTERVAL_SECONDS = float(config('STREAM_POLL_INTERVAL_SECONDS', default=0.2))
+STREAM_NOTIFICATIONS_ENABLED = config('STREAM_NOTIFICATIONS_ENABLED', default=True, cast=bool)
+STREAM_NOTIFY_SAFETY_POLL_SECONDS = float(config('STREAM_NOTIFY_SAFETY_POLL_SECONDS', default=2.0))
+STREAM_WAIT_COORDINATION_ENABLED = config('STREAM_WAIT_COORDINATION_ENABLED', default=True, cast=bool)
+STREAM_POLL_MAX_INTERVAL_SECONDS = float(config('STREAM_POLL_MAX_INTERVAL_SECONDS', default=1.6))
+
+STREAM_ASYNC_VIEWS = config('STREAM_ASYNC_VIEWS', default=False, cast=bool)
+STREAM_MULTIPART_DEFAULT_MESSAGES = int(config('STREAM_MULTIPART_DEFAULT_MESSAGES', default=10))
+STREAM_MULTIPART_MAX_MESSAGES = int(config('STREAM_MULTIPART_MAX_MESSAGES', default=5000))
+STREAM_MULTIPART_MAX_BYTES = int(config('STREAM_MULTIPART_MAX_BYTES', default=8 * 1024 * 1024))
+STREAM_STREAMING_MIN_MESSAGES = int(config('STREAM_STREAMING_MIN_MESSAGES', default=500))
+STREAM_STREAMING_CHUNK_SIZE = int(config('STREAM_STREAMING_CHUNK_SIZE', default=500))
+STREAM_COMPRESSION_ENABLED = config('STREAM_COMPRESSION_ENABLED', default=True, cast=bool)
+STREAM_COMPRESSION_MIN_BYTES = int(config('STREAM_COMPRESSION_MIN_BYTES', default=1024))
+STREAM_PREFETCH_ENABLED = config('STREAM_PREFETCH_ENABLED', default=False, cast=bool)
+STREAM_PREFETCH_MESSAGES = int(config('STREAM_PREFETCH_MESSAGES', default=500))
+STREAM_PREFETCH_LEASE_SECONDS = float(config('STREAM_PREFETCH_LEASE_SECONDS', default=30.0))
+STREAM_CONSUME_CHUNK_SIZE = int(config('STREAM_CONSUME_CHUNK_SIZE', default=5000))
+STREAM_CONSUME_ASYNC = config('STREAM_CONSUME_ASYNC', default=False, cast=bool)
+
+MESSAGE_RETENTION_DAYS = int(config('MESSAGE_RETENTION_DAYS', default=90))
+MESSAGE_PARTITION_PREMAKE_DAYS = int(config('MESSAGE_PARTITION_PREMAKE_DAYS', default=7))
+MESSAGE_QUEUE_HORIZON_CACHE_SECONDS = float(config('MESSAGE_QUEUE_HORIZON_CACHE_SECONDS', default=60.0))
+
+HISTORY_PAGE_DEFAULT_MESSAGES = int(config('HISTORY_PAGE_DEFAULT_MESSAGES', default=100))
+HISTORY_PAGE_MAX_MESSAGES = int(config('HISTORY_PAGE_MAX_MESSAGES', default=5000))
+
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_DIR = str(config('METRICS_DIR', default=''))
+METRICS_FLUSH_SECONDS = float(config('METRICS_FLUSH_SECONDS', default=5.0))
+
+INGEST_BATCH_SIZE = int(config('INGEST_BATCH_SIZE', default=5000))
+INGEST_MAX_RECORD_BYTES = int(config('INGEST_MAX_RECORD_BYTES', default=1024 * 1024))
+INGEST_BLOOM_FILTER_ENABLED = config('INGEST_BLOOM_FILTER_ENABLED', default=False, cast=bool)
+INGEST_BLOOM_CAPACITY = int(config('INGEST_BLOOM_CAPACITY', default=1000000))
+INGEST_BLOOM_ERROR_RATE = float(config('INGEST_BLOOM_ERROR_RATE', default=0.01))
+INGEST_BLOOM_WARM_HOURS = float(config('INGEST_BLOOM_WARM_HOURS', default=24.0))
@@ -0,0 +1,20 @@
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+from beeteller.pooled_postgresql.base import close_pools
+from util.finalize import wait_for_finalizers
+from util.notifications import stop_listener
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Lets background finalizers finish and closes the LISTEN and pooled
+    connections before the test database is dropped.
+    """
+
+    def teardown_databases(self, old_config, **kwargs):
+        wait_for_finalizers()
+        stop_listener()
+        connections.close_all()
+        close_pools()
+        super().teardown_databases(old_config, **kwargs)
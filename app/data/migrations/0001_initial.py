@@ -0,0 +1,62 @@
+# Generated by Django 5.0 on 2026-10-18 14:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PixStream',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interation_id', models.CharField(db_index=True, max_length=64, unique=True)),
+                ('ispb', models.CharField(db_index=True, max_length=8)),
+                ('active', models.BooleanField(default=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('last_pull_at', models.DateTimeField(blank=True, null=True)),
+                ('terminated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ispb', 'active'], name='data_pixstr_ispb_b2dd81_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PixMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('end_to_end_id', models.CharField(db_index=True, max_length=64, unique=True)),
+                ('tx_id', models.CharField(max_length=128)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('payment_at', models.DateTimeField()),
+                ('free_text', models.TextField(blank=True, default='')),
+                ('payer_name', models.CharField(max_length=200)),
+                ('payer_cpf_cnpj', models.CharField(max_length=14)),
+                ('payer_ispb', models.CharField(max_length=8)),
+                ('payer_agencia', models.CharField(max_length=10)),
+                ('payer_conta_transacional', models.CharField(max_length=50)),
+                ('payer_tipo_conta', models.CharField(max_length=10)),
+                ('receiver_name', models.CharField(max_length=200)),
+                ('receiver_cpf_cnpj', models.CharField(max_length=14)),
+                ('receiver_ispb', models.CharField(db_index=True, max_length=8)),
+                ('receiver_agencia', models.CharField(max_length=10)),
+                ('receiver_conta_transacional', models.CharField(max_length=50)),
+                ('receiver_tipo_conta', models.CharField(max_length=10)),
+                ('status', models.CharField(choices=[('pendente', 'pendente'), ('reservado', 'reservado'), ('finalizado', 'finalizado')], db_index=True, default='pendente', max_length=16)),
+                ('reserved_at', models.DateTimeField(blank=True, null=True)),
+                ('consumed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('reserved_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reserved_messages', to='data.pixstream')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['receiver_ispb', 'status', 'id'], name='data_pixmes_receive_3f1199_idx'), models.Index(fields=['status', 'created_at'], name='data_pixmes_status_dd0ba8_idx')],
+            },
+        ),
+    ]
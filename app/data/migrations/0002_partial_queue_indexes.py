@@ -0,0 +1,41 @@
+# Generated by Django 5.0 on 2026-10-18 14:47
+
+import django.db.models.deletion
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The partial indexes are built before the full ones are dropped, and
+    # concurrently, so claims keep an index and writes are not blocked while
+    # a large message table is migrated.
+    atomic = False
+
+    dependencies = [
+        ('data', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='pixmessage',
+            index=models.Index(condition=models.Q(('status', 'pendente')), fields=['receiver_ispb', 'id'], name='pixmessage_pending_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='pixmessage',
+            index=models.Index(condition=models.Q(('status', 'reservado')), fields=['reserved_by', 'id'], name='pixmessage_reserved_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='pixmessage',
+            name='data_pixmes_receive_3f1199_idx',
+        ),
+        migrations.AlterField(
+            model_name='pixmessage',
+            name='reserved_by',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reserved_messages', to='data.pixstream'),
+        ),
+        migrations.AlterField(
+            model_name='pixmessage',
+            name='status',
+            field=models.CharField(choices=[('pendente', 'pendente'), ('reservado', 'reservado'), ('finalizado', 'finalizado')], default='pendente', max_length=16),
+        ),
+    ]
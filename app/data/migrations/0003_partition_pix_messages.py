@@ -0,0 +1,115 @@
+# Generated by Django 5.0 on 2026-10-18 14:53
+
+from django.db import migrations, models
+
+
+# Rebuilds data_pixmessage as a table partitioned by range of created_at. The
+# rows are copied into a DEFAULT partition; `manage.py partition_messages`
+# then creates the daily partitions and moves those rows into them. Identity
+# columns and cross-partition unique indexes are not available on
+# partitioned tables, so the id comes from a plain sequence and end_to_end_id
+# uniqueness is enforced through data_pixmessagekey by insert and delete
+# triggers.
+PARTITION_SQL = """
+ALTER TABLE data_pixmessage RENAME TO data_pixmessage_unpartitioned;
+
+CREATE TABLE data_pixmessage (LIKE data_pixmessage_unpartitioned INCLUDING DEFAULTS)
+    PARTITION BY RANGE (created_at);
+CREATE SEQUENCE data_pixmessage_partitioned_id_seq OWNED BY data_pixmessage.id;
+SELECT setval(
+    'data_pixmessage_partitioned_id_seq',
+    coalesce((SELECT max(id) FROM data_pixmessage_unpartitioned), 0) + 1,
+    false
+);
+ALTER TABLE data_pixmessage ALTER COLUMN id SET DEFAULT nextval('data_pixmessage_partitioned_id_seq');
+CREATE TABLE data_pixmessage_default PARTITION OF data_pixmessage DEFAULT;
+
+INSERT INTO data_pixmessagekey (end_to_end_id, created_at)
+    SELECT end_to_end_id, created_at FROM data_pixmessage_unpartitioned;
+INSERT INTO data_pixmessage SELECT * FROM data_pixmessage_unpartitioned;
+DROP TABLE data_pixmessage_unpartitioned;
+
+ALTER TABLE data_pixmessage ADD CONSTRAINT data_pixmessage_pkey PRIMARY KEY (id, created_at);
+ALTER TABLE data_pixmessage ADD CONSTRAINT data_pixmessage_reserved_by_id_195fda7b_fk_data_pixstream_id
+    FOREIGN KEY (reserved_by_id) REFERENCES data_pixstream (id) DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX data_pixmessage_end_to_end_id_c3982863 ON data_pixmessage (end_to_end_id);
+CREATE INDEX data_pixmessage_receiver_ispb_f78a137c ON data_pixmessage (receiver_ispb);
+CREATE INDEX data_pixmes_status_dd0ba8_idx ON data_pixmessage (status, created_at);
+CREATE INDEX pixmessage_pending_idx ON data_pixmessage (receiver_ispb, id) WHERE status = 'pendente';
+CREATE INDEX pixmessage_reserved_idx ON data_pixmessage (reserved_by_id, id) WHERE status = 'reservado';
+
+CREATE FUNCTION data_pixmessage_register_key() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO data_pixmessagekey (end_to_end_id, created_at) VALUES (NEW.end_to_end_id, NEW.created_at);
+    RETURN NEW;
+END
+$$;
+CREATE TRIGGER data_pixmessage_register_key BEFORE INSERT ON data_pixmessage
+    FOR EACH ROW EXECUTE FUNCTION data_pixmessage_register_key();
+
+-- Also fired when an update moves a row to another partition, which runs as
+-- a delete followed by an insert.
+CREATE FUNCTION data_pixmessage_release_key() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM data_pixmessagekey WHERE end_to_end_id = OLD.end_to_end_id;
+    RETURN OLD;
+END
+$$;
+CREATE TRIGGER data_pixmessage_release_key BEFORE DELETE ON data_pixmessage
+    FOR EACH ROW EXECUTE FUNCTION data_pixmessage_release_key();
+"""
+
+UNPARTITION_SQL = """
+DROP TRIGGER data_pixmessage_release_key ON data_pixmessage;
+DROP FUNCTION data_pixmessage_release_key();
+DROP TRIGGER data_pixmessage_register_key ON data_pixmessage;
+DROP FUNCTION data_pixmessage_register_key();
+ALTER TABLE data_pixmessage RENAME TO data_pixmessage_partitioned;
+
+CREATE TABLE data_pixmessage (LIKE data_pixmessage_partitioned);
+ALTER TABLE data_pixmessage ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY;
+INSERT INTO data_pixmessage SELECT * FROM data_pixmessage_partitioned;
+SELECT setval(
+    pg_get_serial_sequence('data_pixmessage', 'id'),
+    coalesce((SELECT max(id) FROM data_pixmessage), 0) + 1,
+    false
+);
+DROP TABLE data_pixmessage_partitioned;
+
+ALTER TABLE data_pixmessage ADD CONSTRAINT data_pixmessage_pkey PRIMARY KEY (id);
+ALTER TABLE data_pixmessage ADD CONSTRAINT data_pixmessage_end_to_end_id_key UNIQUE (end_to_end_id);
+ALTER TABLE data_pixmessage ADD CONSTRAINT data_pixmessage_reserved_by_id_195fda7b_fk_data_pixstream_id
+    FOREIGN KEY (reserved_by_id) REFERENCES data_pixstream (id) DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX data_pixmessage_end_to_end_id_c3982863_like ON data_pixmessage (end_to_end_id varchar_pattern_ops);
+CREATE INDEX data_pixmessage_receiver_ispb_f78a137c ON data_pixmessage (receiver_ispb);
+CREATE INDEX data_pixmessage_receiver_ispb_f78a137c_like ON data_pixmessage (receiver_ispb varchar_pattern_ops);
+CREATE INDEX data_pixmes_status_dd0ba8_idx ON data_pixmessage (status, created_at);
+CREATE INDEX pixmessage_pending_idx ON data_pixmessage (receiver_ispb, id) WHERE status = 'pendente';
+CREATE INDEX pixmessage_reserved_idx ON data_pixmessage (reserved_by_id, id) WHERE status = 'reservado';
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0002_partial_queue_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PixMessageKey',
+            fields=[
+                ('end_to_end_id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PixQueueHorizon',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_after', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunSQL(PARTITION_SQL, UNPARTITION_SQL),
+    ]
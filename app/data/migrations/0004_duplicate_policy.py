@@ -0,0 +1,42 @@
+from django.db import migrations
+
+
+# Lets a transaction opt into skipping duplicate end_to_end_ids instead of
+# failing: with `SET LOCAL pix.duplicate_policy = 'skip'`, a row whose key is
+# already registered is silently dropped from the insert (and from RETURNING).
+SKIP_SQL = """
+CREATE OR REPLACE FUNCTION data_pixmessage_register_key() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF current_setting('pix.duplicate_policy', true) = 'skip' THEN
+        INSERT INTO data_pixmessagekey (end_to_end_id, created_at) VALUES (NEW.end_to_end_id, NEW.created_at)
+            ON CONFLICT DO NOTHING;
+        IF NOT FOUND THEN
+            RETURN NULL;
+        END IF;
+        RETURN NEW;
+    END IF;
+    INSERT INTO data_pixmessagekey (end_to_end_id, created_at) VALUES (NEW.end_to_end_id, NEW.created_at);
+    RETURN NEW;
+END
+$$;
+"""
+
+RAISE_SQL = """
+CREATE OR REPLACE FUNCTION data_pixmessage_register_key() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO data_pixmessagekey (end_to_end_id, created_at) VALUES (NEW.end_to_end_id, NEW.created_at);
+    RETURN NEW;
+END
+$$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0003_partition_pix_messages'),
+    ]
+
+    operations = [
+        migrations.RunSQL(SKIP_SQL, RAISE_SQL),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0004_duplicate_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pixstream',
+            name='is_prefetch',
+            field=models.BooleanField(default=False),
+        ),
+    ]
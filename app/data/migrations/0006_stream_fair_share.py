@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-18 15:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0005_stream_prefetch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pixstream',
+            name='last_claim_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pixstream',
+            name='recent_claims',
+            field=models.FloatField(default=0),
+        ),
+    ]
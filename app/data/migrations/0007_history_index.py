@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-18 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0006_stream_fair_share'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pixmessage',
+            index=models.Index(condition=models.Q(('status', 'finalizado')), fields=['receiver_ispb', 'id'], include=('payment_at', 'consumed_at', 'created_at'), name='pixmessage_history_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0 on 2026-10-18 15:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0007_history_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='pixmessage',
+            name='pixmessage_pending_idx',
+        ),
+        migrations.AddField(
+            model_name='pixmessage',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'alta'), (1, 'normal'), (2, 'baixa')], db_default=models.Value(1), default=1),
+        ),
+        migrations.AddIndex(
+            model_name='pixmessage',
+            index=models.Index(condition=models.Q(('status', 'pendente')), fields=['receiver_ispb', 'priority', 'id'], name='pixmessage_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0 on 2026-10-18 15:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0008_message_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pixstream',
+            name='consume_pending',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='pixstream',
+            index=models.Index(condition=models.Q(('consume_pending', True)), fields=['id'], name='pixstream_consume_pending_idx'),
+        ),
+    ]
@@ -10,10 +10,21 @@ class PixStream(models.Model):
     started_at = models.DateTimeField(auto_now_add=True)
     last_pull_at = models.DateTimeField(null=True, blank=True)
     terminated_at = models.DateTimeField(null=True, blank=True)
+    # Holds messages claimed ahead by one process (util/prefetch.py); never
+    # exposed to clients nor counted against the collector limit.
+    is_prefetch = models.BooleanField(default=False)
+    # Messages claimed lately, decayed from last_claim_at by the fair-share
+    # window; maintained by the claim statement in util/utils.py.
+    recent_claims = models.FloatField(default=0)
+    last_claim_at = models.DateTimeField(null=True, blank=True)
+    # Closed, with reserved messages still being consumed in chunks
+    # (util/finalize.py).
+    consume_pending = models.BooleanField(default=False)
 
     class Meta:
         indexes = [
             models.Index(fields=["ispb", "active"]),
+            models.Index(fields=["id"], condition=models.Q(consume_pending=True), name="pixstream_consume_pending_idx"),
         ]
 
     def __str__(self) -> str:  
@@ -22,12 +33,22 @@ class PixStream(models.Model):
 
 
 class PixMessage(models.Model):
+    # Stored as a table range-partitioned by created_at (see
+    # data/migrations/0003_partition_pix_messages.py and util/partitions.py).
+    # The database primary key is (id, created_at); end_to_end_id uniqueness
+    # across partitions is kept by PixMessageKey.
 
     class MessageStatus(models.TextChoices):
         PENDING = "pendente", "pendente"
         RESERVED = "reservado", "reservado"  
         CONSUMED = "finalizado", "finalizado"  
 
+    class MessagePriority(models.IntegerChoices):
+        # Lower values are claimed first.
+        HIGH = 0, "alta"
+        NORMAL = 1, "normal"
+        LOW = 2, "baixa"
+
     end_to_end_id = models.CharField(max_length=64, unique=True, db_index=True)
     tx_id = models.CharField(max_length=128)
     amount = models.DecimalField(max_digits=14, decimal_places=2)
@@ -53,7 +74,14 @@ class PixMessage(models.Model):
         max_length=16,
         choices=MessageStatus.choices,
         default=MessageStatus.PENDING,
-        db_index=True,
+    )
+    # Claim lane: an ISPB's pending messages are claimed by priority, then id,
+    # so a bulk feed loaded as LOW does not hold back later HIGH messages.
+    priority = models.PositiveSmallIntegerField(
+        choices=MessagePriority.choices,
+        default=MessagePriority.NORMAL,
+        # Also kept in the database, for rows written by raw SQL loaders.
+        db_default=MessagePriority.NORMAL,
     )
     reserved_by = models.ForeignKey(
         PixStream,
@@ -61,6 +89,7 @@ class PixMessage(models.Model):
         on_delete=models.SET_NULL,
         null=True,
         blank=True,
+        db_index=False,
     )
     reserved_at = models.DateTimeField(null=True, blank=True)
     consumed_at = models.DateTimeField(null=True, blank=True)
@@ -68,9 +97,31 @@ class PixMessage(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
+        # The claim and consume paths only ever look at pending and reserved
+        # rows, so their indexes are partial: consumed history, which keeps
+        # growing, never enters them. Within an ISPB the pending index holds
+        # one id-ordered run per priority lane, in the order claims drain them.
         indexes = [
-            models.Index(fields=["receiver_ispb", "status", "id"]),
+            models.Index(
+                fields=["receiver_ispb", "priority", "id"],
+                condition=models.Q(status="pendente"),
+                name="pixmessage_pending_idx",
+            ),
+            models.Index(
+                fields=["reserved_by", "id"],
+                condition=models.Q(status="reservado"),
+                name="pixmessage_reserved_idx",
+            ),
             models.Index(fields=["status", "created_at"]),
+            # History pages walk an ISPB's consumed messages by id; the time
+            # filters and the partition key are carried in the index, so a
+            # page's keys come from an index-only scan at any depth.
+            models.Index(
+                fields=["receiver_ispb", "id"],
+                include=["payment_at", "consumed_at", "created_at"],
+                condition=models.Q(status="finalizado"),
+                name="pixmessage_history_idx",
+            ),
         ]
         ordering = ["id"]
 
@@ -87,3 +138,30 @@ class PixMessage(models.Model):
         return f"PixMessage({self.end_to_end_id}, ispb={self.receiver_ispb}, status={self.status})"
 
 
+
+
+class PixMessageKey(models.Model):
+    """
+    One row per stored end_to_end_id, filled by an insert trigger on the
+    partitioned message table, where a unique index can only be per partition.
+    """
+
+    end_to_end_id = models.CharField(max_length=64, primary_key=True)
+    created_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return f"PixMessageKey({self.end_to_end_id})"
+
+
+class PixQueueHorizon(models.Model):
+    """
+    Single row holding a lower bound on created_at for every pending or
+    reserved message. Claims filter on it so that older partitions, which hold
+    only consumed history, are pruned from the plan.
+    """
+
+    created_after = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"PixQueueHorizon({self.created_after.isoformat()})"
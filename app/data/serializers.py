@@ -1,7 +1,18 @@
+from decimal import Decimal, InvalidOperation
+from json.encoder import encode_basestring_ascii
+from typing import Iterable, Iterator, Sequence
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import serializers
 
 from .models import PixMessage
 
+try:
+    import msgpack
+except ImportError:  # optional: only the MessagePack media types need it
+    msgpack = None
+
 
 class PartySerializer(serializers.Serializer):
     nome = serializers.CharField(source="name")
@@ -55,3 +66,213 @@ class PixMessageSerializer(serializers.ModelSerializer):
         }
 
 
+# Column order of the rows accepted by the fast encoder below. Use it with
+# ``values_list(*PIX_MESSAGE_WIRE_FIELDS)`` or in a RETURNING clause.
+PIX_MESSAGE_WIRE_FIELDS = (
+    "end_to_end_id",
+    "amount",
+    "payer_name",
+    "payer_cpf_cnpj",
+    "payer_ispb",
+    "payer_agencia",
+    "payer_conta_transacional",
+    "payer_tipo_conta",
+    "receiver_name",
+    "receiver_cpf_cnpj",
+    "receiver_ispb",
+    "receiver_agencia",
+    "receiver_conta_transacional",
+    "receiver_tipo_conta",
+    "free_text",
+    "tx_id",
+    "payment_at",
+)
+
+_CENTS = Decimal("0.01")
+
+_PARTY_TEMPLATE = (
+    '{{"nome": {}, "cpfCnpj": {}, "ispb": {}, "agencia": {}, "contaTransacional": {}, "tipoConta": {}}}'
+)
+_MESSAGE_TEMPLATE = (
+    '{{"endToEndId": {}, "valor": "{}", "pagador": ' + _PARTY_TEMPLATE + ', "recebedor": ' + _PARTY_TEMPLATE
+    + ', "campoLivre": {}, "txId": {}, "dataHoraPagamento": "{}"}}'
+)
+
+
+def _encode_row(row: Sequence, tz) -> str:
+    payment_at = row[16].astimezone(tz).isoformat()
+    if payment_at.endswith("+00:00"):
+        payment_at = payment_at[:-6] + "Z"
+    return _MESSAGE_TEMPLATE.format(
+        encode_basestring_ascii(row[0]),
+        format(row[1].quantize(_CENTS), "f"),
+        *[encode_basestring_ascii(value) for value in row[2:16]],
+        payment_at,
+    )
+
+
+def encode_pix_message(row: Sequence) -> bytes:
+    """
+    Encodes one ``PIX_MESSAGE_WIRE_FIELDS`` row into the same bytes as
+    ``JsonResponse(PixMessageSerializer(message).data)``, without building a
+    model instance or going through DRF fields.
+    """
+    return _encode_row(row, timezone.get_current_timezone()).encode()
+
+
+def encode_pix_messages(rows: Iterable[Sequence]) -> bytes:
+    """Many-message counterpart of ``encode_pix_message``, encoded as a JSON array."""
+    tz = timezone.get_current_timezone()
+    return ("[" + ", ".join(_encode_row(row, tz) for row in rows) + "]").encode()
+
+
+
+def iter_encode_pix_messages(rows: Iterable[Sequence], chunk_size: int = 500) -> Iterator[bytes]:
+    """
+    Incremental form of ``encode_pix_messages``: yields the same JSON array in
+    pieces of at most ``chunk_size`` messages, so only one piece is held in
+    memory at a time.
+    """
+    tz = timezone.get_current_timezone()
+    separator = "["
+    chunk = []
+    for row in rows:
+        chunk.append(separator + _encode_row(row, tz))
+        separator = ", "
+        if len(chunk) >= chunk_size:
+            yield "".join(chunk).encode()
+            chunk = []
+    if separator == "[":
+        chunk.append("[")
+    chunk.append("]")
+    yield "".join(chunk).encode()
+
+
+# MessagePack form of the same messages: one map per message with the keys
+# of PixMessageSerializer, except that ``valor`` is an integer amount in
+# centavos and ``dataHoraPagamento`` a MessagePack timestamp (extension -1).
+# A batch is the maps written one after the other, not an array, so it can be
+# streamed without knowing the count and read back with ``msgpack.Unpacker``.
+def _msgpack_row(row: Sequence) -> dict:
+    return {
+        "endToEndId": row[0],
+        "valor": int(row[1].quantize(_CENTS).scaleb(2)),
+        "pagador": {
+            "nome": row[2], "cpfCnpj": row[3], "ispb": row[4],
+            "agencia": row[5], "contaTransacional": row[6], "tipoConta": row[7],
+        },
+        "recebedor": {
+            "nome": row[8], "cpfCnpj": row[9], "ispb": row[10],
+            "agencia": row[11], "contaTransacional": row[12], "tipoConta": row[13],
+        },
+        "campoLivre": row[14],
+        "txId": row[15],
+        "dataHoraPagamento": row[16],
+    }
+
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+
+def pack_pix_messages(rows: Iterable[Sequence]) -> bytes:
+    """MessagePack counterpart of ``encode_pix_messages``; one row packs to a single map."""
+    packer = msgpack.Packer(datetime=True, autoreset=False)
+    for row in rows:
+        packer.pack(_msgpack_row(row))
+    return packer.bytes()
+
+
+def iter_pack_pix_messages(rows: Iterable[Sequence], chunk_size: int = 500) -> Iterator[bytes]:
+    """Incremental form of ``pack_pix_messages``, ``chunk_size`` messages per piece."""
+    packer = msgpack.Packer(datetime=True, autoreset=False)
+    pending = 0
+    for row in rows:
+        packer.pack(_msgpack_row(row))
+        pending += 1
+        if pending >= chunk_size:
+            yield packer.bytes()
+            packer.reset()
+            pending = 0
+    if pending:
+        yield packer.bytes()
+
+
+_PARTY_KEYS = (
+    ("nome", "name"),
+    ("cpfCnpj", "cpf_cnpj"),
+    ("ispb", "ispb"),
+    ("agencia", "agencia"),
+    ("contaTransacional", "conta_transacional"),
+    ("tipoConta", "tipo_conta"),
+)
+_MAX_LENGTHS = {
+    field.name: field.max_length for field in PixMessage._meta.concrete_fields if field.max_length is not None
+}
+_MAX_AMOUNT = Decimal("999999999999.99")
+
+
+def _decode_text(value, field: str, label: str, required: bool = True) -> str:
+    if not isinstance(value, str):
+        raise ValueError(f"{label}: expected a string.")
+    if required and not value:
+        raise ValueError(f"{label}: must not be empty.")
+    if "\x00" in value:
+        # PostgreSQL text cannot hold NUL; it would fail the whole COPY.
+        raise ValueError(f"{label}: must not contain NUL characters.")
+    max_length = _MAX_LENGTHS.get(field)
+    if max_length is not None and len(value) > max_length:
+        raise ValueError(f"{label}: at most {max_length} characters.")
+    return value
+
+
+def _decode_party(value, prefix: str, label: str) -> list:
+    if not isinstance(value, dict):
+        raise ValueError(f"{label}: expected an object.")
+    decoded = [
+        _decode_text(value.get(key), f"{prefix}_{field}", f"{label}.{key}") for key, field in _PARTY_KEYS
+    ]
+    if not (len(decoded[2]) == 8 and decoded[2].isdigit()):
+        raise ValueError(f"{label}.ispb: expected 8 digits.")
+    return decoded
+
+
+def _decode_amount(value) -> Decimal:
+    if isinstance(value, bool) or not isinstance(value, (str, int, Decimal)):
+        raise ValueError("valor: expected a decimal number.")
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise ValueError("valor: expected a decimal number.") from None
+    if not amount.is_finite() or amount <= 0 or amount > _MAX_AMOUNT or amount.as_tuple().exponent < -2:
+        raise ValueError("valor: expected a positive amount with at most 2 decimal places.")
+    return amount
+
+
+def decode_pix_message(payload) -> tuple:
+    """
+    Inverse of ``encode_pix_message``: validates one message in the API's wire
+    shape and returns it as a ``PIX_MESSAGE_WIRE_FIELDS`` row. Parse JSON with
+    ``parse_float=Decimal`` so ``valor`` keeps its exact value. Raises
+    ``ValueError`` naming the offending field.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Expected a JSON object.")
+    row = (
+        _decode_text(payload.get("endToEndId"), "end_to_end_id", "endToEndId"),
+        _decode_amount(payload.get("valor")),
+        *_decode_party(payload.get("pagador"), "payer", "pagador"),
+        *_decode_party(payload.get("recebedor"), "receiver", "recebedor"),
+        _decode_text(payload.get("campoLivre", ""), "free_text", "campoLivre", required=False),
+        _decode_text(payload.get("txId"), "tx_id", "txId"),
+    )
+    payment_at = payload.get("dataHoraPagamento")
+    try:
+        parsed_at = parse_datetime(payment_at) if isinstance(payment_at, str) else None
+    except ValueError:
+        parsed_at = None
+    if parsed_at is None:
+        raise ValueError("dataHoraPagamento: expected an ISO 8601 datetime.")
+    if timezone.is_naive(parsed_at):
+        parsed_at = timezone.make_aware(parsed_at)
+    return row + (parsed_at,)
@@ -0,0 +1,82 @@
+"""
+Micro-benchmark: JSON against MessagePack for 1k and 10k messages, encoding
+on the server and decoding on the collector (down to ``Decimal`` amounts and
+aware datetimes on both paths). Not collected by the default test run;
+execute with
+
+    python manage.py test data.tests.bench_msgpack
+"""
+import json
+import os
+import time
+from decimal import Decimal
+
+import msgpack
+from django.test import SimpleTestCase
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from data.serializers import encode_pix_messages, pack_pix_messages
+
+
+SIZES = [int(size) for size in os.environ.get("BENCH_SIZES", "1000,10000").split(",")]
+ROUNDS = int(os.environ.get("BENCH_ROUNDS", 5))
+
+
+def _decode_json(body: bytes) -> list:
+    messages = json.loads(body)
+    for message in messages:
+        message["valor"] = Decimal(message["valor"])
+        message["dataHoraPagamento"] = parse_datetime(message["dataHoraPagamento"])
+    return messages
+
+
+def _decode_msgpack(body: bytes) -> list:
+    unpacker = msgpack.Unpacker(timestamp=3)
+    unpacker.feed(body)
+    messages = list(unpacker)
+    for message in messages:
+        message["valor"] = Decimal(message["valor"]).scaleb(-2)
+    return messages
+
+
+class BenchMsgpack(SimpleTestCase):
+    def _rows(self, count: int) -> list:
+        now = timezone.now()
+        return [
+            (
+                f"E12345678bench{i}", Decimal(i % 100000) / 100,
+                "Tester", "12345678901", "87654321", "0001", "111", "CACC",
+                "Receiver", "01987654321", "12345678", "0001", "222", "SVGS",
+                "", f"tx{i}", now,
+            )
+            for i in range(count)
+        ]
+
+
+    def _best_of(self, func) -> float:
+        best = float("inf")
+        for _ in range(ROUNDS):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        return best
+
+
+    def test_json_vs_msgpack(self):
+        print()
+        for size in SIZES:
+            rows = self._rows(size)
+            json_body, packed_body = encode_pix_messages(rows), pack_pix_messages(rows)
+
+            json_encode = self._best_of(lambda: encode_pix_messages(rows))
+            packed_encode = self._best_of(lambda: pack_pix_messages(rows))
+            json_decode = self._best_of(lambda: _decode_json(json_body))
+            packed_decode = self._best_of(lambda: _decode_msgpack(packed_body))
+            print(
+                f"  {size:>6} messages:"
+                f" json bytes={len(json_body)} encode={json_encode * 1000:.1f}ms decode={json_decode * 1000:.1f}ms |"
+                f" msgpack bytes={len(packed_body)} encode={packed_encode * 1000:.1f}ms"
+                f" decode={packed_decode * 1000:.1f}ms"
+            )
+            self.assertEqual(_decode_msgpack(packed_body), _decode_json(json_body))
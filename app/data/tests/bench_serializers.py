@@ -0,0 +1,72 @@
+"""
+Micro-benchmark: DRF PixMessageSerializer against the fast row encoder for
+1k and 10k messages. Not collected by the default test run; execute with
+
+    python manage.py test data.tests.bench_serializers
+"""
+import os
+import time
+from decimal import Decimal
+
+from django.http import JsonResponse
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from data.models import PixMessage
+from data.serializers import PIX_MESSAGE_WIRE_FIELDS, PixMessageSerializer, encode_pix_messages
+
+
+SIZES = [int(size) for size in os.environ.get("BENCH_SIZES", "1000,10000").split(",")]
+ROUNDS = int(os.environ.get("BENCH_ROUNDS", 5))
+
+
+class BenchSerializers(SimpleTestCase):
+    def _messages(self, count: int) -> list:
+        now = timezone.now()
+        return [
+            PixMessage(
+                end_to_end_id=f"E12345678bench{i}",
+                tx_id=f"tx{i}",
+                amount=Decimal(i % 100000) / 100,
+                payment_at=now,
+                free_text="",
+                payer_name="Tester",
+                payer_cpf_cnpj="12345678901",
+                payer_ispb="87654321",
+                payer_agencia="0001",
+                payer_conta_transacional="111",
+                payer_tipo_conta="CACC",
+                receiver_name="Receiver",
+                receiver_cpf_cnpj="01987654321",
+                receiver_ispb="12345678",
+                receiver_agencia="0001",
+                receiver_conta_transacional="222",
+                receiver_tipo_conta="SVGS",
+            )
+            for i in range(count)
+        ]
+
+
+    def _best_of(self, func) -> float:
+        best = float("inf")
+        for _ in range(ROUNDS):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        return best
+
+
+    def test_drf_vs_fast_encoder(self):
+        print()
+        for size in SIZES:
+            messages = self._messages(size)
+            rows = [tuple(getattr(m, field) for field in PIX_MESSAGE_WIRE_FIELDS) for m in messages]
+
+            drf = self._best_of(
+                lambda: JsonResponse(PixMessageSerializer(messages, many=True).data, safe=False).content
+            )
+            fast = self._best_of(lambda: encode_pix_messages(rows))
+            print(
+                f"  {size:>6} messages: drf={drf * 1000:.1f}ms fast={fast * 1000:.1f}ms speedup={drf / fast:.1f}x"
+            )
+            self.assertLess(fast, drf)
@@ -0,0 +1,125 @@
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+import msgpack
+
+from django.http import JsonResponse
+from django.test import TestCase
+from django.utils import timezone
+
+from data.models import PixMessage
+from data.serializers import (
+    PIX_MESSAGE_WIRE_FIELDS,
+    PixMessageSerializer,
+    encode_pix_message,
+    encode_pix_messages,
+    iter_encode_pix_messages,
+    iter_pack_pix_messages,
+    pack_pix_messages,
+)
+
+
+class TestFastPixMessageEncoder(TestCase):
+    def setUp(self) -> None:
+        self.ispb = "12345678"
+
+
+    def _create_message(self, suffix: str, **overrides) -> PixMessage:
+        fields = dict(
+            end_to_end_id=f"E{self.ispb}{suffix}",
+            tx_id=f"tx{suffix}",
+            amount=Decimal("10.00"),
+            payment_at=timezone.now(),
+            free_text="",
+            payer_name="Tester",
+            payer_cpf_cnpj="12345678901",
+            payer_ispb="87654321",
+            payer_agencia="0001",
+            payer_conta_transacional="111",
+            payer_tipo_conta="CACC",
+            receiver_name="Receiver",
+            receiver_cpf_cnpj="01987654321",
+            receiver_ispb=self.ispb,
+            receiver_agencia="0001",
+            receiver_conta_transacional="222",
+            receiver_tipo_conta="SVGS",
+        )
+        fields.update(overrides)
+        return PixMessage.objects.create(**fields)
+
+
+    def _create_varied_messages(self) -> None:
+        self._create_message("plain")
+        self._create_message("cents", amount=Decimal("0.01"))
+        self._create_message("large", amount=Decimal("999999999999.99"))
+        self._create_message("round", amount=Decimal("1234"))
+        self._create_message(
+            "text",
+            free_text='Pagamento "aluguel" \\ março\nlinha 2\t✓',
+            payer_name="João Ção",
+            receiver_name="Zoë </script>",
+        )
+        self._create_message(
+            "whole_second", payment_at=datetime(2022, 7, 23, 19, 47, 18, tzinfo=dt_timezone.utc)
+        )
+
+
+    def test_single_message_is_byte_identical_to_drf(self):
+        self._create_varied_messages()
+        for message in PixMessage.objects.all():
+            row = PixMessage.objects.filter(pk=message.pk).values_list(*PIX_MESSAGE_WIRE_FIELDS).get()
+            expected = JsonResponse(PixMessageSerializer(message).data).content
+            self.assertEqual(encode_pix_message(row), expected, message.end_to_end_id)
+
+
+    def test_many_messages_are_byte_identical_to_drf(self):
+        self._create_varied_messages()
+        messages = list(PixMessage.objects.order_by("id"))
+        rows = list(PixMessage.objects.order_by("id").values_list(*PIX_MESSAGE_WIRE_FIELDS))
+
+        expected = JsonResponse(PixMessageSerializer(messages, many=True).data, safe=False).content
+        self.assertEqual(encode_pix_messages(rows), expected)
+
+
+    def test_empty_batch_encodes_as_empty_array(self):
+        expected = JsonResponse(PixMessageSerializer([], many=True).data, safe=False).content
+        self.assertEqual(encode_pix_messages([]), expected)
+
+
+    def test_incremental_encoding_matches_single_buffer(self):
+        self._create_varied_messages()
+        rows = list(PixMessage.objects.order_by("id").values_list(*PIX_MESSAGE_WIRE_FIELDS))
+
+        for chunk_size in (1, 2, 4, 100):
+            chunks = list(iter_encode_pix_messages(rows, chunk_size))
+            self.assertEqual(b"".join(chunks), encode_pix_messages(rows), chunk_size)
+        self.assertEqual(b"".join(iter_encode_pix_messages([])), encode_pix_messages([]))
+
+
+    def test_msgpack_round_trip_matches_drf_fields(self):
+        self._create_varied_messages()
+        messages = list(PixMessage.objects.order_by("id"))
+        rows = list(PixMessage.objects.order_by("id").values_list(*PIX_MESSAGE_WIRE_FIELDS))
+
+        unpacker = msgpack.Unpacker(timestamp=3)
+        unpacker.feed(pack_pix_messages(rows))
+        decoded = list(unpacker)
+
+        self.assertEqual(len(decoded), len(messages))
+        for message, unpacked in zip(messages, decoded):
+            expected = dict(PixMessageSerializer(message).data)
+            self.assertEqual(unpacked.keys(), expected.keys())
+            self.assertEqual(Decimal(unpacked.pop("valor")) / 100, Decimal(expected.pop("valor")))
+            self.assertEqual(unpacked.pop("dataHoraPagamento"), message.payment_at)
+            expected.pop("dataHoraPagamento")
+            self.assertEqual(unpacked, expected, message.end_to_end_id)
+
+
+    def test_incremental_msgpack_matches_single_buffer(self):
+        self._create_varied_messages()
+        rows = list(PixMessage.objects.order_by("id").values_list(*PIX_MESSAGE_WIRE_FIELDS))
+
+        for chunk_size in (1, 4, 100):
+            chunks = list(iter_pack_pix_messages(rows, chunk_size))
+            self.assertEqual(b"".join(chunks), pack_pix_messages(rows), chunk_size)
+        self.assertEqual(list(iter_pack_pix_messages([])), [])
@@ -1,6 +1,15 @@
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from util.metrics import render_metrics
+
 @api_view(['GET'])
 def health_check(request):
     return Response({"message": "ok"})
+
+
+@require_GET
+def metrics(request):
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
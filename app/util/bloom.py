@@ -0,0 +1,100 @@
+"""
+In-process Bloom filter of recently stored end_to_end_ids.
+
+Ingest consults it before loading a batch: ids the filter has never seen are
+new for sure and go straight to the insert, while possible repeats are
+confirmed with one batched SELECT, so a replayed batch is answered without
+the staging/COPY/INSERT round trips. The database stays the authority on
+duplicates; the filter only saves work, and a false positive costs a lookup.
+"""
+import hashlib
+import logging
+import math
+import os
+import threading
+from datetime import timedelta
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from data.models import PixMessageKey
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings, sized for ``capacity`` items at
+    ``error_rate`` false positives. Once ``capacity`` items have been added
+    it is cleared and starts over, trading a burst of extra lookups for a
+    bounded false-positive rate.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str) -> None:
+        positions = self._positions(item)
+        with self._lock:
+            if self.count >= self.capacity:
+                self.bits = bytearray(len(self.bits))
+                self.count = 0
+            for position in positions:
+                self.bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def update(self, items: Iterable[str]) -> None:
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+_filter: Optional[BloomFilter] = None
+_filter_pid: Optional[int] = None
+_filter_lock = threading.Lock()
+
+
+def recent_ids_filter() -> Optional[BloomFilter]:
+    """
+    The per-process filter, warmed on first use with the ids stored in the
+    last ``INGEST_BLOOM_WARM_HOURS``, or ``None`` when
+    ``INGEST_BLOOM_FILTER_ENABLED`` is off.
+    """
+    global _filter, _filter_pid
+    if not getattr(settings, "INGEST_BLOOM_FILTER_ENABLED", False):
+        return None
+    pid = os.getpid()
+    if _filter is not None and _filter_pid == pid:
+        return _filter
+    with _filter_lock:
+        if _filter is None or _filter_pid != pid:
+            capacity = int(getattr(settings, "INGEST_BLOOM_CAPACITY", 1_000_000))
+            bloom = BloomFilter(capacity, float(getattr(settings, "INGEST_BLOOM_ERROR_RATE", 0.01)))
+            since = timezone.now() - timedelta(hours=float(getattr(settings, "INGEST_BLOOM_WARM_HOURS", 24)))
+            bloom.update(
+                PixMessageKey.objects.filter(created_at__gte=since)
+                .order_by("-created_at")
+                .values_list("end_to_end_id", flat=True)[:capacity]
+                .iterator(chunk_size=10000)
+            )
+            logging.getLogger(__name__).info("bloom.warmed", extra={"count": bloom.count})
+            _filter, _filter_pid = bloom, pid
+    return _filter
+
+
+def reset_recent_ids_filter() -> None:
+    global _filter, _filter_pid
+    with _filter_lock:
+        _filter, _filter_pid = None, None
@@ -0,0 +1,162 @@
+"""
+Content-Encoding negotiation for stream responses.
+
+gzip is always available; brotli (``br``) and zstd are offered when the
+``brotli`` or ``zstandard`` packages are installed. Buffered bodies below
+``STREAM_COMPRESSION_MIN_BYTES`` are sent as they are, since the headers and
+CPU would cost more than the bytes saved. Streaming bodies are compressed
+chunk by chunk, each chunk flushed so the client still receives them as the
+server produces them.
+"""
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+
+class _Deflate:
+    def __init__(self) -> None:
+        # wbits 31: zlib deflate in a gzip container.
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self) -> None:
+        self._compressor = brotli.Compressor(quality=4)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _Zstd:
+    def __init__(self) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Available encodings in server preference order, used to break ties
+# between equally weighted client choices.
+ENCODERS: Dict[str, Callable] = {}
+if zstandard is not None:
+    ENCODERS["zstd"] = _Zstd
+if brotli is not None:
+    ENCODERS["br"] = _Brotli
+ENCODERS["gzip"] = _Deflate
+
+
+def negotiate_encoding(accept_encoding: Optional[str], available: Iterable[str] = None) -> Optional[str]:
+    """
+    The preferred encoding of an ``Accept-Encoding`` header among
+    ``available`` (default ``ENCODERS``), honouring q-values and ``*``, or
+    ``None`` for identity.
+    """
+    available = list(ENCODERS if available is None else available)
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+
+    wildcard = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for name in available:
+        weight = weights.get(name, wildcard)
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def _compress_chunks(chunks: Iterable[bytes], encoder) -> Iterator[bytes]:
+    for chunk in chunks:
+        data = encoder.compress(chunk) + encoder.flush()
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+async def _acompress_chunks(chunks, encoder):
+    async for chunk in chunks:
+        data = encoder.compress(chunk) + encoder.flush()
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+def compress_one(body: bytes, encoding: str) -> bytes:
+    encoder = ENCODERS[encoding]()
+    return encoder.compress(body) + encoder.finish()
+
+
+def compress_response(request, response):
+    """
+    Encodes a 200 ``response`` with the encoding negotiated from the
+    request's ``Accept-Encoding``, when STREAM_COMPRESSION_ENABLED and the
+    body is streamed or at least STREAM_COMPRESSION_MIN_BYTES long.
+    """
+    if not getattr(settings, "STREAM_COMPRESSION_ENABLED", True):
+        return response
+    if response.status_code != 200 or response.has_header("Content-Encoding"):
+        return response
+    patch_vary_headers(response, ("Accept-Encoding",))
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+    if encoding is None:
+        return response
+
+    if response.streaming:
+        encoder = ENCODERS[encoding]()
+        if response.is_async:
+            response.streaming_content = _acompress_chunks(response.streaming_content, encoder)
+        else:
+            response.streaming_content = _compress_chunks(response.streaming_content, encoder)
+    else:
+        if len(response.content) < int(getattr(settings, "STREAM_COMPRESSION_MIN_BYTES", 1024)):
+            return response
+        response.content = compress_one(response.content, encoding)
+        response["Content-Length"] = str(len(response.content))
+    response["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,157 @@
+"""
+Chunked consumption of the reservations of closed streams.
+
+DELETE closes the stream and flags it ``consume_pending`` in one transaction;
+its reserved messages are then consumed ``STREAM_CONSUME_CHUNK_SIZE`` at a
+time, each chunk in its own short transaction, and the last chunk clears the
+flag. A stream with a small reservation is closed and consumed in that first
+transaction, as before. With ``STREAM_CONSUME_ASYNC``, DELETE returns right
+after closing and a background thread of the process consumes the chunks.
+
+Chunks of one stream are serialized on its row lock, so the flag is only
+cleared once nothing reserved is left. If the process stops in between, the
+flag stays set and ``finalize_closed_streams`` (the ``finalize_streams``
+command) resumes from whatever is still reserved. Reserved messages of a
+closed stream are never claimed again, so consumption is delayed, not lost.
+"""
+import atexit
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from data.models import PixMessage, PixStream
+from util.metrics import increment_counter
+from util.utils import claim_horizon
+
+
+# Separate statements: the chunk's snapshot must be taken after the stream
+# lock is granted, so it sees every chunk consumed while this one waited.
+_LOCK_STREAM_SQL = f"""
+SELECT id FROM {PixStream._meta.db_table} WHERE id = %(stream)s AND consume_pending FOR NO KEY UPDATE
+"""
+
+_CONSUME_CHUNK_SQL = f"""
+WITH chunk AS (
+    SELECT id, created_at FROM {PixMessage._meta.db_table}
+    WHERE reserved_by_id = %(stream)s AND status = %(reserved)s AND created_at >= %(horizon)s
+    ORDER BY id
+    LIMIT %(limit)s
+    FOR UPDATE
+)
+UPDATE {PixMessage._meta.db_table} AS m
+SET status = %(consumed)s, consumed_at = %(now)s
+FROM chunk
+WHERE m.id = chunk.id AND m.created_at = chunk.created_at AND m.created_at >= %(horizon)s
+"""
+
+
+def consume_chunk_size() -> int:
+    return int(getattr(settings, "STREAM_CONSUME_CHUNK_SIZE", 5000))
+
+
+@transaction.atomic
+def consume_reserved_chunk(stream: PixStream) -> Tuple[int, bool]:
+    """
+    Consumes up to ``STREAM_CONSUME_CHUNK_SIZE`` messages reserved by the
+    closed ``stream`` and returns how many, and whether the stream is done,
+    in which case its ``consume_pending`` flag has been cleared.
+    """
+    limit = consume_chunk_size()
+    with connection.cursor() as cursor:
+        cursor.execute(_LOCK_STREAM_SQL, {"stream": stream.pk})
+        if cursor.fetchone() is None:
+            return 0, True
+        cursor.execute(
+            _CONSUME_CHUNK_SQL,
+            {
+                "stream": stream.pk,
+                "reserved": PixMessage.MessageStatus.RESERVED,
+                "consumed": PixMessage.MessageStatus.CONSUMED,
+                "now": timezone.now(),
+                "horizon": claim_horizon(),
+                "limit": limit,
+            },
+        )
+        consumed = cursor.rowcount
+    done = consumed < limit
+    if done:
+        PixStream.objects.filter(pk=stream.pk).update(consume_pending=False)
+    increment_counter("stream_messages_consumed_total", consumed, ispb=stream.ispb)
+    return consumed, done
+
+
+def finalize_stream(stream: PixStream) -> int:
+    """Consumes what ``stream`` still has reserved, chunk by chunk; returns how many."""
+    total, done = 0, False
+    while not done:
+        consumed, done = consume_reserved_chunk(stream)
+        total += consumed
+    return total
+
+
+def finalize_closed_streams() -> Tuple[int, int]:
+    """
+    Finishes every stream left ``consume_pending``, e.g. by a process that
+    stopped mid-way. Returns how many streams and messages were finalized.
+    """
+    streams = list(PixStream.objects.filter(consume_pending=True, active=False).order_by("id"))
+    messages = sum(finalize_stream(stream) for stream in streams)
+    if streams:
+        logging.getLogger(__name__).info(
+            "stream.finalized", extra={"streams": len(streams), "messages": messages}
+        )
+    return len(streams), messages
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+_scheduled: List[Future] = []
+
+
+def _finalize_in_background(stream: PixStream) -> None:
+    try:
+        finalize_stream(stream)
+    except Exception:
+        # Left flagged; the finalize_streams command resumes it.
+        logging.getLogger(__name__).warning(
+            "stream.finalize_failed", extra={"stream": stream.interation_id}, exc_info=True
+        )
+    finally:
+        connection.close()
+
+
+def schedule_finalize(stream: PixStream) -> None:
+    """Consumes the rest of ``stream``'s reservation on this process's finalizer thread."""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # A forked worker cannot use its parent's thread.
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pix-finalizer")
+            _executor_pid = os.getpid()
+            _scheduled.clear()
+        _scheduled[:] = [future for future in _scheduled if not future.done()]
+        _scheduled.append(_executor.submit(_finalize_in_background, stream))
+
+
+def wait_for_finalizers(timeout: Optional[float] = None) -> None:
+    """Blocks until the reservations handed to the finalizer thread so far are consumed."""
+    with _executor_lock:
+        pending = list(_scheduled) if _executor_pid == os.getpid() else []
+    for future in pending:
+        future.result(timeout)
+
+
+@atexit.register
+def _finish_on_exit() -> None:
+    try:
+        wait_for_finalizers(timeout=30)
+    except Exception:
+        # Too late to report; the flag is still set for finalize_streams.
+        pass
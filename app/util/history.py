@@ -0,0 +1,101 @@
+"""
+Read-only history of an ISPB's consumed messages, paged by id.
+
+A page is the messages with ``after < id <= bound``: the bound is the id of
+the last message of the page, read first from ``pixmessage_history_idx``
+alone, so the cost of a page depends on its size and not on how deep into
+the history it is. Nothing here writes; reservations are never touched.
+"""
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils.dateparse import parse_datetime
+
+from data.models import PixMessage
+from data.serializers import PIX_MESSAGE_WIRE_FIELDS
+
+
+# Query parameter -> lookup on PixMessage.
+TIME_FILTERS = {
+    "paymentFrom": "payment_at__gte",
+    "paymentTo": "payment_at__lt",
+    "consumedFrom": "consumed_at__gte",
+    "consumedTo": "consumed_at__lt",
+}
+
+
+class HistoryQuery:
+    """The validated parameters of one history page request."""
+
+    def __init__(self, ispb: str, after: int, limit: int, filters: Dict[str, datetime]) -> None:
+        self.ispb = ispb
+        self.after = after
+        self.limit = limit
+        self.filters = filters
+
+    def messages(self) -> QuerySet:
+        messages = PixMessage.objects.filter(
+            receiver_ispb=self.ispb, status=PixMessage.MessageStatus.CONSUMED, id__gt=self.after, **self.filters
+        )
+        consumed_before = self.filters.get("consumed_at__lt")
+        if consumed_before is not None:
+            # A message is stored before it is consumed, so partitions
+            # created after the range can be pruned.
+            messages = messages.filter(created_at__lt=consumed_before)
+        return messages.order_by("id")
+
+    def page_bound(self) -> Optional[int]:
+        """Id of the last message of the page, or ``None`` for an empty page."""
+        ids = list(self.messages().values_list("id", flat=True)[:self.limit])
+        return ids[-1] if ids else None
+
+    def rows(self, bound: int, chunk_size: Optional[int] = None) -> Iterator[tuple]:
+        """
+        The page's ``PIX_MESSAGE_WIRE_FIELDS`` rows in id order, read through
+        a server-side cursor when ``chunk_size`` is given.
+        """
+        rows = self.messages().filter(id__lte=bound).values_list(*PIX_MESSAGE_WIRE_FIELDS)
+        if chunk_size is None:
+            return iter(list(rows))
+        return rows.iterator(chunk_size=chunk_size)
+
+    def next_query_string(self, bound: int) -> str:
+        params = {"after": bound, "limit": self.limit}
+        for name, lookup in TIME_FILTERS.items():
+            if lookup in self.filters:
+                params[name] = self.filters[lookup].isoformat()
+        return urlencode(params)
+
+
+def parse_history_query(ispb: str, params) -> Optional[HistoryQuery]:
+    """
+    Reads ``after`` (an id, default 0), ``limit`` (default
+    HISTORY_PAGE_DEFAULT_MESSAGES, capped at HISTORY_PAGE_MAX_MESSAGES) and
+    the ISO-8601 bounds of ``TIME_FILTERS``. Returns ``None`` when any of
+    them is invalid.
+    """
+    maximum = int(getattr(settings, "HISTORY_PAGE_MAX_MESSAGES", 5000))
+    try:
+        after = int(params.get("after", 0))
+        limit = int(params.get("limit", getattr(settings, "HISTORY_PAGE_DEFAULT_MESSAGES", 100)))
+    except ValueError:
+        return None
+    if after < 0 or limit < 1:
+        return None
+
+    filters: Dict[str, datetime] = {}
+    for name, lookup in TIME_FILTERS.items():
+        value = params.get(name)
+        if value is None:
+            continue
+        try:
+            moment = parse_datetime(value)
+        except ValueError:
+            return None
+        if moment is None or moment.tzinfo is None:
+            return None
+        filters[lookup] = moment
+    return HistoryQuery(ispb, after, min(limit, maximum), filters)
@@ -0,0 +1,287 @@
+"""
+Bulk ingest of Pix messages sent in the API's own wire shape.
+
+``iter_ndjson`` and ``iter_json_array`` parse a request body incrementally,
+without holding it in memory. ``ingest_pix_messages`` validates the records
+with ``decode_pix_message`` and loads every ``INGEST_BATCH_SIZE`` valid rows
+in one transaction: COPY into a temporary staging table, then one
+INSERT ... SELECT into the message table with duplicate end_to_end_ids
+skipped by the key trigger; with ``INGEST_BLOOM_FILTER_ENABLED``, repeats
+flagged by ``util.bloom`` are confirmed with one lookup instead of being
+loaded. Each rejected record is reported with its position in the feed,
+and the end_to_end_ids inserted are listed in feed order for reconciliation.
+A whole feed is loaded into one priority lane, e.g. LOW for bulk imports.
+"""
+import codecs
+import io
+import json
+import logging
+from decimal import Decimal
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from data.models import PixMessage, PixMessageKey
+from data.serializers import PIX_MESSAGE_WIRE_FIELDS, decode_pix_message
+from util.bloom import recent_ids_filter
+from util.notifications import notify_new_messages
+
+
+READ_CHUNK_BYTES = 64 * 1024
+
+STAGE_TABLE = "pix_ingest_stage"
+
+# The staging table borrows the message table's column types and lives for
+# the whole connection; its rows are dropped at the end of every batch.
+_STAGE_SQL = (
+    f"CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} ON COMMIT DELETE ROWS AS "
+    f"SELECT 0::integer AS position, {', '.join(PIX_MESSAGE_WIRE_FIELDS)} "
+    f"FROM {PixMessage._meta.db_table} WITH NO DATA"
+)
+_COPY_SQL = f"COPY {STAGE_TABLE} (position, {', '.join(PIX_MESSAGE_WIRE_FIELDS)}) FROM STDIN"
+_INSERT_SQL = f"""
+INSERT INTO {PixMessage._meta.db_table} ({', '.join(PIX_MESSAGE_WIRE_FIELDS)}, status, priority, created_at)
+SELECT {', '.join(PIX_MESSAGE_WIRE_FIELDS)}, %(pending)s, %(priority)s, %(now)s FROM {STAGE_TABLE} ORDER BY position
+RETURNING end_to_end_id, receiver_ispb
+"""
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+MALFORMED_JSON = "Malformed JSON."
+RECORD_TOO_LARGE = "Record too large."
+DUPLICATE_END_TO_END_ID = "Duplicate endToEndId."
+
+# (payload, None) for each parsed record, or (None, detail) when a record
+# could not be parsed.
+ParsedRecord = Tuple[Optional[object], Optional[str]]
+
+
+def _json_decoder() -> json.JSONDecoder:
+    return json.JSONDecoder(parse_float=Decimal)
+
+
+def iter_ndjson(stream) -> Iterator[ParsedRecord]:
+    """
+    One record per non-blank line of ``stream``; a bad line is reported and
+    skipped. Lines are read up to ``INGEST_MAX_RECORD_BYTES``: a longer one is
+    reported as too large and the rest of it is read past in pieces.
+    """
+    decoder = _json_decoder()
+    max_record = int(getattr(settings, "INGEST_MAX_RECORD_BYTES", 1024 * 1024))
+    while True:
+        line = stream.readline(max_record + 1)
+        if not line:
+            return
+        if len(line) > max_record and not line.endswith(b"\n"):
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(max_record + 1)
+            yield None, RECORD_TOO_LARGE
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield decoder.decode(line.decode("utf-8")), None
+        except ValueError:
+            yield None, MALFORMED_JSON
+
+
+def iter_json_array(stream) -> Iterator[ParsedRecord]:
+    """
+    The items of a top-level JSON array read from ``stream`` in
+    ``READ_CHUNK_BYTES`` pieces. A syntax error cannot be skipped past, so it
+    is reported once and ends the iteration; so is a record that does not
+    parse within ``INGEST_MAX_RECORD_BYTES`` (counted in decoded characters),
+    instead of reading the rest of the body in search of its end.
+    """
+    decoder = _json_decoder()
+    max_record = int(getattr(settings, "INGEST_MAX_RECORD_BYTES", 1024 * 1024))
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer, pos, eof = "", 0, False
+    expecting = "["
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        if eof:
+            return False
+        chunk = stream.read(READ_CHUNK_BYTES)
+        eof = not chunk
+        buffer = buffer[pos:] + text.decode(chunk, final=eof)
+        pos = 0
+        return True
+
+    try:
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos == len(buffer):
+                if fill():
+                    continue
+                if expecting != "end":
+                    yield None, MALFORMED_JSON
+                return
+
+            char = buffer[pos]
+            if expecting == "[":
+                if char != "[":
+                    break
+                pos += 1
+                expecting = "first"
+            elif expecting == "separator":
+                if char == "]":
+                    pos += 1
+                    expecting = "end"
+                elif char == ",":
+                    pos += 1
+                    expecting = "value"
+                else:
+                    break
+            elif expecting == "first" and char == "]":
+                pos += 1
+                expecting = "end"
+            elif expecting in ("first", "value"):
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    # Possibly a value cut at the end of the buffer.
+                    if len(buffer) - pos >= max_record:
+                        yield None, RECORD_TOO_LARGE
+                        return
+                    if fill():
+                        continue
+                    break
+                if end == len(buffer) and fill():
+                    continue
+                pos = end
+                expecting = "separator"
+                yield value, None
+            else:
+                break
+    except UnicodeDecodeError:
+        pass
+    yield None, MALFORMED_JSON
+
+
+def parse_priority(value: Optional[str]) -> Optional[int]:
+    """The lane named by ``value`` (alta, normal or baixa); NORMAL when absent, ``None`` when unknown."""
+    if value is None:
+        return PixMessage.MessagePriority.NORMAL
+    for priority, label in PixMessage.MessagePriority.choices:
+        if value == label:
+            return priority
+    return None
+
+
+def _copy_line(position: int, row: tuple) -> str:
+    # Row layout from PIX_MESSAGE_WIRE_FIELDS: end_to_end_id, amount, 14 text
+    # columns, payment_at.
+    text = [value.translate(_COPY_ESCAPES) for value in row[2:16]]
+    return "\t".join(
+        (str(position), row[0].translate(_COPY_ESCAPES), str(row[1]), *text, row[16].isoformat())
+    ) + "\n"
+
+
+def _known_ids(batch: List[Tuple[int, tuple]]) -> Set[str]:
+    """Ids of ``batch`` already stored, looked up only for the filter's possible repeats."""
+    seen = recent_ids_filter()
+    if seen is None:
+        return set()
+    candidates = [row[0] for _, row in batch if row[0] in seen]
+    if not candidates:
+        return set()
+    return set(PixMessageKey.objects.filter(end_to_end_id__in=candidates).values_list("end_to_end_id", flat=True))
+
+
+def load_pix_rows(
+    batch: List[Tuple[int, tuple]], priority: int = PixMessage.MessagePriority.NORMAL
+) -> Tuple[List[str], List[Tuple[int, str]]]:
+    """
+    Inserts ``(position, row)`` pairs of ``PIX_MESSAGE_WIRE_FIELDS`` rows into
+    the ``priority`` lane in one transaction, skipping end_to_end_ids that are already stored or
+    repeated within the batch. Returns the new ids, in batch order, and the
+    ``(position, id)`` pairs of the duplicates. Safe to replay: a retried batch only reports
+    duplicates.
+    """
+    known = _known_ids(batch)
+    pending = [(position, row) for position, row in batch if row[0] not in known]
+
+    inserted = []
+    if pending:
+        buffer = io.StringIO()
+        for position, row in pending:
+            buffer.write(_copy_line(position, row))
+        buffer.seek(0)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(_STAGE_SQL)
+            cursor.execute("SET LOCAL pix.duplicate_policy = 'skip'")
+            cursor.copy_expert(_COPY_SQL, buffer)
+            cursor.execute(
+                _INSERT_SQL,
+                {"pending": PixMessage.MessageStatus.PENDING, "priority": priority, "now": timezone.now()},
+            )
+            inserted = cursor.fetchall()
+            notify_new_messages({ispb for _, ispb in inserted})
+
+    unclaimed = {end_to_end_id for end_to_end_id, _ in inserted}
+    seen = recent_ids_filter()
+    if seen is not None:
+        seen.update(unclaimed)
+
+    new_ids = []
+    duplicates = []
+    for position, row in batch:
+        end_to_end_id = row[0]
+        if end_to_end_id in unclaimed:
+            # A repeat later in the same batch is the duplicate, not this one.
+            unclaimed.discard(end_to_end_id)
+            new_ids.append(end_to_end_id)
+        else:
+            duplicates.append((position, end_to_end_id))
+    return new_ids, duplicates
+
+
+def ingest_pix_messages(
+    records: Iterable[ParsedRecord],
+    batch_size: Optional[int] = None,
+    priority: int = PixMessage.MessagePriority.NORMAL,
+) -> dict:
+    logger = logging.getLogger(__name__)
+    if batch_size is None:
+        batch_size = int(getattr(settings, "INGEST_BATCH_SIZE", 5000))
+
+    inserted: List[str] = []
+    rejected: List[dict] = []
+    batch: List[Tuple[int, tuple]] = []
+
+    def flush() -> None:
+        new_ids, duplicates = load_pix_rows(batch, priority)
+        inserted.extend(new_ids)
+        rejected.extend(
+            {"index": position, "endToEndId": end_to_end_id, "detail": DUPLICATE_END_TO_END_ID}
+            for position, end_to_end_id in duplicates
+        )
+        logger.info("ingest.batch", extra={"size": len(batch), "inserted": len(new_ids)})
+        batch.clear()
+
+    for index, (payload, error) in enumerate(records):
+        if error is not None:
+            rejected.append({"index": index, "detail": error})
+            continue
+        try:
+            batch.append((index, decode_pix_message(payload)))
+        except ValueError as exc:
+            reject = {"index": index, "detail": str(exc)}
+            if isinstance(payload, dict) and isinstance(payload.get("endToEndId"), str):
+                reject["endToEndId"] = payload["endToEndId"]
+            rejected.append(reject)
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    rejected.sort(key=lambda reject: reject["index"])
+    return {"inserted": len(inserted), "new": inserted, "rejected": rejected}
@@ -0,0 +1,258 @@
+import json
+import subprocess
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, List, Optional
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from beeteller.pooled_postgresql.base import close_pools
+from data.models import PixMessage
+from util.finalize import wait_for_finalizers
+from util.notifications import stop_listener
+
+try:
+    import msgpack
+except ImportError:  # only needed for --accept */msgpack
+    msgpack = None
+
+
+# Bumped whenever the meaning of a reported field changes.
+RESULT_FORMAT = 1
+
+_SEED_SQL = f"""
+INSERT INTO {PixMessage._meta.db_table} (
+    end_to_end_id, tx_id, amount, payment_at, free_text,
+    payer_name, payer_cpf_cnpj, payer_ispb, payer_agencia, payer_conta_transacional, payer_tipo_conta,
+    receiver_name, receiver_cpf_cnpj, receiver_ispb, receiver_agencia, receiver_conta_transacional, receiver_tipo_conta,
+    status, created_at
+)
+SELECT
+    'E' || %(ispb)s || 'bench' || n, 'tx' || n, (n %% 100000) / 100.0, now(), '',
+    'Tester', '12345678901', '87654321', '0001', '111', 'CACC',
+    'Receiver', '01987654321', %(ispb)s, '0001', '222', 'SVGS',
+    'pendente', now()
+FROM generate_series(1, %(count)s) AS n
+"""
+
+
+def bench_ispbs(count: int) -> List[str]:
+    return [f"{90000000 + n:08d}" for n in range(count)]
+
+
+def seed_messages(ispbs: List[str], messages: int) -> Dict[str, int]:
+    """Inserts ``messages`` pending messages spread evenly over ``ispbs``."""
+    seeded = {}
+    with connection.cursor() as cursor:
+        for n, ispb in enumerate(ispbs):
+            count = messages // len(ispbs) + (1 if n < messages % len(ispbs) else 0)
+            cursor.execute(_SEED_SQL, {"ispb": ispb, "count": count})
+            seeded[ispb] = count
+        cursor.execute(f"ANALYZE {PixMessage._meta.db_table}")
+    return seeded
+
+
+def _percentile(ordered: List[float], fraction: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _end_to_end_ids(resp) -> List[str]:
+    body = b"".join(resp.streaming_content) if resp.streaming else resp.content
+    if resp["Content-Type"].startswith("application/msgpack"):
+        unpacker = msgpack.Unpacker()
+        unpacker.feed(body)
+        return [message["endToEndId"] for message in unpacker]
+    decoded = json.loads(body)
+    return [message["endToEndId"] for message in (decoded if isinstance(decoded, list) else [decoded])]
+
+
+def run_stream_benchmark(
+    messages: int,
+    ispbs: int,
+    collectors: int,
+    accept: str = "multipart/json",
+    limit: int = 100,
+    timeout: float = 300.0,
+) -> dict:
+    """
+    Seeds ``messages`` over ``ispbs`` ISPBs in the current database and runs
+    ``collectors`` collectors per ISPB, each in its own thread and connection,
+    through ``stream/start``, GETs on ``Pull-Next`` and a final DELETE, all
+    through the real views. A collector stops once every message of its ISPB
+    has been delivered to some collector, or at ``timeout``.
+    """
+    seeded = seed_messages(bench_ispbs(ispbs), messages)
+    lock = threading.Lock()
+    delivered: Counter = Counter()
+    delivered_by_ispb: Counter = Counter()
+    latencies: List[float] = []
+    outcomes: Counter = Counter()
+    deadline = time.monotonic() + timeout
+
+    def collect(ispb: str) -> None:
+        client = Client()
+        try:
+            path = f"/api/pix/{ispb}/stream/start"
+            while True:
+                started = time.perf_counter()
+                resp = client.get(f"{path}?limit={limit}", HTTP_ACCEPT=accept)
+                ids = _end_to_end_ids(resp) if resp.status_code == 200 else []
+                elapsed = time.perf_counter() - started
+                with lock:
+                    outcomes[resp.status_code] += 1
+                    if resp.status_code in (200, 204):
+                        latencies.append(elapsed)
+                    delivered.update(ids)
+                    delivered_by_ispb[ispb] += len(ids)
+                    done = delivered_by_ispb[ispb] >= seeded[ispb]
+                if resp.status_code not in (200, 204):
+                    return
+                path = resp["Pull-Next"]
+                if done or time.monotonic() >= deadline:
+                    client.delete(path)
+                    return
+        finally:
+            connection.close()
+
+    workers = [ispb for ispb in seeded for _ in range(collectors)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(workers)) as pool:
+        list(pool.map(collect, workers))
+    elapsed = time.perf_counter() - started
+
+    unique = len(delivered)
+    pulls = outcomes[200] + outcomes[204]
+    ordered = sorted(latencies)
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "messages_per_second": round(unique / elapsed, 1) if elapsed else None,
+        "pulls": pulls,
+        "pull_p50_ms": None if not ordered else round(_percentile(ordered, 0.50) * 1000, 3),
+        "pull_p99_ms": None if not ordered else round(_percentile(ordered, 0.99) * 1000, 3),
+        "empty_poll_rate": round(outcomes[204] / pulls, 4) if pulls else None,
+        "rejected_starts": outcomes[429],
+        "delivered": sum(delivered.values()),
+        "duplicates": sum(delivered.values()) - unique,
+        "lost": sum(seeded.values()) - unique,
+        "consumed": PixMessage.objects.filter(
+            receiver_ispb__in=list(seeded), status=PixMessage.MessageStatus.CONSUMED
+        ).count(),
+    }
+
+
+def _setting_value(raw: str):
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test of the stream protocol: seeds messages over several ISPBs in a throwaway test database "
+        "and runs concurrent collectors through start, pulls and DELETE. Reports messages/sec, pull latency, "
+        "empty polls and duplicated or lost messages, optionally as JSON for later comparison."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=20000, help="Messages to seed in total.")
+        parser.add_argument("--ispbs", type=int, default=4, help="ISPBs the messages are spread over.")
+        parser.add_argument("--collectors", type=int, default=6, help="Concurrent collectors per ISPB.")
+        parser.add_argument("--limit", type=int, default=100, help="Pull-Limit of each multipart pull.")
+        parser.add_argument(
+            "--accept", default="multipart/json",
+            choices=["application/json", "multipart/json", "application/msgpack", "multipart/msgpack"],
+        )
+        parser.add_argument("--timeout", type=float, default=300.0, help="Give up on collecting after this long.")
+        parser.add_argument(
+            "--long-poll", type=float, default=0.5,
+            help="STREAM_LONG_POLLING_TIMEOUT_SECONDS for the run, so the last empty polls end quickly.",
+        )
+        parser.add_argument(
+            "--set", action="append", default=[], metavar="SETTING=VALUE",
+            help="Override a setting for the run (VALUE parsed as JSON when possible). Repeatable.",
+        )
+        parser.add_argument("--label", default="", help="Free text stored with the result.")
+        parser.add_argument("--output", default=None, help="Write the result as JSON to this file.")
+        parser.add_argument("--compare", default=None, help="A previous --output file to compare against.")
+        parser.add_argument("--keepdb", action="store_true", help="Reuse the test database between runs.")
+
+    def handle(self, *args, **options):
+        if options["accept"].endswith("msgpack") and msgpack is None:
+            raise CommandError("--accept */msgpack needs the msgpack package.")
+        overrides = {"STREAM_LONG_POLLING_TIMEOUT_SECONDS": options["long_poll"]}
+        for item in options["set"]:
+            name, sep, value = item.partition("=")
+            if not sep:
+                raise CommandError(f"--set expects SETTING=VALUE, got {item!r}.")
+            overrides[name] = _setting_value(value)
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options["keepdb"])
+        try:
+            with override_settings(**overrides):
+                results = run_stream_benchmark(
+                    options["messages"], options["ispbs"], options["collectors"],
+                    accept=options["accept"], limit=options["limit"], timeout=options["timeout"],
+                )
+        finally:
+            wait_for_finalizers()
+            stop_listener()
+            connections.close_all()
+            close_pools()
+            teardown_databases(old_config, verbosity=0, keepdb=options["keepdb"])
+            teardown_test_environment()
+
+        report = {
+            "format": RESULT_FORMAT,
+            "label": options["label"],
+            "revision": _git_revision(),
+            "finished_at": datetime.now(dt_timezone.utc).isoformat(),
+            "config": {
+                "messages": options["messages"],
+                "ispbs": options["ispbs"],
+                "collectors": options["collectors"],
+                "limit": options["limit"],
+                "accept": options["accept"],
+                "settings": overrides,
+            },
+            "results": results,
+        }
+        for name, value in results.items():
+            self.stdout.write(f"{name:>20}: {value}")
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+        if options["compare"]:
+            with open(options["compare"]) as baseline_file:
+                self.compare(json.load(baseline_file), report)
+        if results["duplicates"] or results["lost"]:
+            raise CommandError(f"{results['duplicates']} duplicated and {results['lost']} lost messages.")
+
+    def compare(self, baseline: dict, report: dict) -> None:
+        workload = {name: value for name, value in report["config"].items() if name != "settings"}
+        baseline_workload = {name: value for name, value in baseline.get("config", {}).items() if name != "settings"}
+        if baseline_workload != workload:
+            self.stderr.write("warning: the baseline ran a different workload")
+        self.stdout.write(f"compared with {baseline.get('label') or baseline.get('revision')}:")
+        for name in ("messages_per_second", "pull_p50_ms", "pull_p99_ms", "empty_poll_rate"):
+            before, after = baseline["results"].get(name), report["results"][name]
+            if before and after is not None:
+                self.stdout.write(f"{name:>20}: {before} -> {after} ({(after - before) / before:+.1%})")
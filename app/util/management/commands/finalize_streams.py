@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from util.finalize import finalize_closed_streams
+
+
+class Command(BaseCommand):
+    help = (
+        "Consumes the reserved messages of closed streams whose DELETE did not finish consuming them "
+        "(STREAM_CONSUME_ASYNC, or a process that stopped mid-way). Runs once, or every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, default=None,
+            help="Keep running, finalizing every this many seconds.",
+        )
+
+    def finalize(self) -> None:
+        streams, messages = finalize_closed_streams()
+        if streams:
+            self.stdout.write(f"finalized {streams} streams, consumed {messages} messages")
+
+    def handle(self, *args, **options):
+        interval = options["interval"]
+        if interval is None:
+            self.finalize()
+            return
+
+        self.stdout.write(f"finalizing every {interval:g}s")
+        while True:
+            close_old_connections()
+            try:
+                self.finalize()
+            except DatabaseError as exc:
+                self.stderr.write(f"finalize failed: {exc}")
+            time.sleep(interval)
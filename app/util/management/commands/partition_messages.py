@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from util.partitions import advance_queue_horizon, ensure_partitions, expire_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates upcoming daily partitions of the message table, detaches or drops the ones "
+        "past the retention period and advances the claim horizon. Meant to run daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead", type=int, default=None,
+            help="Days of partitions to create ahead of today (default: MESSAGE_PARTITION_PREMAKE_DAYS).",
+        )
+        parser.add_argument(
+            "--retention", type=int, default=None,
+            help="Days of partitions to keep attached (default: MESSAGE_RETENTION_DAYS).",
+        )
+        parser.add_argument(
+            "--drop", action="store_true",
+            help="Drop expired partitions instead of detaching them.",
+        )
+
+    def handle(self, *args, **options):
+        for name in ensure_partitions(options["ahead"]):
+            self.stdout.write(f"created {name}")
+
+        expired, kept = expire_partitions(options["retention"], drop=options["drop"])
+        for name in expired:
+            self.stdout.write(f"{'dropped' if options['drop'] else 'detached'} {name}")
+        for name in kept:
+            self.stdout.write(self.style.WARNING(f"kept {name}: still has pending or reserved messages"))
+
+        horizon = advance_queue_horizon()
+        self.stdout.write(f"queue horizon {horizon.isoformat()}")
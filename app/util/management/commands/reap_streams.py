@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from util.utils import expire_idle_streams, stream_lease_timeout
+
+
+class Command(BaseCommand):
+    help = (
+        "Closes streams idle for longer than STREAM_LEASE_TIMEOUT_SECONDS and returns their "
+        "reserved messages to pending. Runs once, or every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, default=None,
+            help="Keep running, reaping every this many seconds.",
+        )
+        parser.add_argument(
+            "--ispb", default=None,
+            help="Only reap streams of this ISPB.",
+        )
+
+    def reap(self, ispb) -> None:
+        streams, messages = expire_idle_streams(ispb)
+        if streams:
+            self.stdout.write(f"expired {streams} streams, released {messages} messages")
+
+    def handle(self, *args, **options):
+        interval = options["interval"]
+        if interval is None:
+            self.reap(options["ispb"])
+            return
+
+        self.stdout.write(f"reaping every {interval:g}s, lease {stream_lease_timeout():g}s")
+        while True:
+            close_old_connections()
+            try:
+                self.reap(options["ispb"])
+            except DatabaseError as exc:
+                self.stderr.write(f"reap failed: {exc}")
+            time.sleep(interval)
@@ -0,0 +1,341 @@
+"""
+In-process metrics of the stream engine, aggregated across workers.
+
+Each process records into its own in-memory registry (a dict update under a
+lock, no I/O) and writes a snapshot of it to ``METRICS_DIR/<pid>-<start>.json``
+at most every ``METRICS_FLUSH_SECONDS``. ``render_metrics`` sums the snapshots
+of every process in the Prometheus text format, so any worker can answer a
+scrape for all of them. Active streams per ISPB are read from the database
+at scrape time rather than recorded.
+
+Snapshots of processes that have exited (no such PID, or a PID since reused
+by a newer process) are folded into ``retired.json`` and removed at scrape
+time, so counters keep their totals and never go backwards while the
+directory only holds one file per live process. PIDs are checked on this
+host, so ``METRICS_DIR`` must not be shared between hosts or containers.
+"""
+import atexit
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Count
+
+from data.models import PixStream
+
+
+_SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (help, bucket upper bounds)
+HISTOGRAMS = {
+    "stream_claim_seconds": ("Latency of one claim (reservation) query.", _SECONDS_BUCKETS),
+    "stream_poll_iterations": ("Claim attempts made by one pull request.", (1, 2, 3, 5, 10, 20, 50, 100)),
+    "stream_long_poll_wait_seconds": ("Time one pull request spent waiting between claims.", _SECONDS_BUCKETS),
+    "stream_serialize_seconds": (
+        "Time to encode a pull body; per chunk, including its cursor fetch, for mode=streamed.",
+        _SECONDS_BUCKETS,
+    ),
+}
+
+# name -> help
+COUNTERS = {
+    "stream_pulls_total": "Pull requests answered with 200 or 204.",
+    "stream_empty_pulls_total": "Pull requests that ended with no message (204).",
+    "stream_messages_reserved_total": "Messages reserved by pulls.",
+    "stream_messages_consumed_total": "Messages consumed by ACK or DELETE.",
+    "stream_wait_probes_total": "Pending-work probes run by the wait coordinator, one per batch of ISPBs.",
+}
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+_RETIRED = "retired.json"
+
+
+class _Registry:
+    def __init__(self) -> None:
+        self.pid = os.getpid()
+        # Tells this process's snapshot apart from one left by an earlier
+        # process with the same PID.
+        self.started = time.time_ns()
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, _Labels], float] = {}
+        # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self.histograms: Dict[Tuple[str, _Labels], List[float]] = {}
+        self.flushed_at = time.monotonic()
+        self.flushed = False
+
+
+_registry = _Registry()
+
+
+def _current() -> _Registry:
+    global _registry
+    if _registry.pid != os.getpid():
+        # A forked worker starts from zero instead of re-reporting its parent.
+        _registry = _Registry()
+    return _registry
+
+
+def metrics_enabled() -> bool:
+    return bool(getattr(settings, "METRICS_ENABLED", True))
+
+
+def metrics_dir() -> str:
+    return getattr(settings, "METRICS_DIR", "") or os.path.join(tempfile.gettempdir(), "beeteller-metrics")
+
+
+def increment_counter(name: str, amount: float = 1, **labels: str) -> None:
+    if not metrics_enabled():
+        return
+    registry = _current()
+    key = (name, tuple(sorted(labels.items())))
+    with registry.lock:
+        registry.counters[key] = registry.counters.get(key, 0) + amount
+    _maybe_flush(registry)
+
+
+def observe_histogram(name: str, value: float, **labels: str) -> None:
+    if not metrics_enabled():
+        return
+    buckets = HISTOGRAMS[name][1]
+    registry = _current()
+    key = (name, tuple(sorted(labels.items())))
+    with registry.lock:
+        histogram = registry.histograms.get(key)
+        if histogram is None:
+            histogram = registry.histograms[key] = [0.0] * (len(buckets) + 2)
+        histogram[bisect_left(buckets, value)] += 1
+        histogram[-1] += value
+    _maybe_flush(registry)
+
+
+def _dump(counters: Dict, histograms: Dict) -> dict:
+    return {
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, list(labels), list(values)] for (name, labels), values in histograms.items()],
+    }
+
+
+def _snapshot(registry: _Registry) -> dict:
+    with registry.lock:
+        return _dump(registry.counters, registry.histograms)
+
+
+def _write(path: str, data: dict) -> None:
+    # A temporary file of its own, as a scrape and a background flush of the
+    # same process may write the same snapshot at once.
+    descriptor, temporary = tempfile.mkstemp(
+        prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=os.path.dirname(path)
+    )
+    try:
+        with os.fdopen(descriptor, "w") as snapshot:
+            json.dump(data, snapshot)
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.unlink(temporary)
+        except OSError:
+            pass
+        raise
+
+
+def _load(path: str) -> Optional[dict]:
+    try:
+        with open(path) as snapshot:
+            return json.load(snapshot)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(counters: Dict, histograms: Dict, data: dict) -> None:
+    for name, labels, value in data["counters"]:
+        key = (name, tuple(tuple(label) for label in labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, values in data["histograms"]:
+        key = (name, tuple(tuple(label) for label in labels))
+        total = histograms.setdefault(key, [0.0] * len(values))
+        for i, value in enumerate(values):
+            total[i] += value
+
+
+def _owner(filename: str) -> Tuple[Optional[int], str]:
+    """The PID and start time a snapshot name was written by; no PID for ``retired.json``."""
+    pid, _, started = filename[: -len(".json")].partition("-")
+    return (int(pid), started) if pid.isdigit() else (None, "")
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, owned by another user.
+        return True
+    return True
+
+
+class _DirectoryLock:
+    """Serializes retiring snapshots with reading them, across processes."""
+
+    def __init__(self, directory: str) -> None:
+        self.path = os.path.join(directory, ".lock")
+
+    def __enter__(self) -> "_DirectoryLock":
+        self.file = open(self.path, "a")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.file.close()
+
+
+def _retire(directory: str, filenames: List[str]) -> None:
+    """
+    Adds the snapshots ``filenames`` to ``retired.json`` and removes them.
+    Callers hold the directory lock, so each is folded in exactly once.
+    """
+    filenames = [filename for filename in filenames if os.path.exists(os.path.join(directory, filename))]
+    if not filenames:
+        return
+    counters: Dict[Tuple[str, _Labels], float] = {}
+    histograms: Dict[Tuple[str, _Labels], List[float]] = {}
+    for filename in [_RETIRED] + filenames:
+        data = _load(os.path.join(directory, filename))
+        if data is not None:
+            _merge(counters, histograms, data)
+    _write(os.path.join(directory, _RETIRED), _dump(counters, histograms))
+    for filename in filenames:
+        os.remove(os.path.join(directory, filename))
+
+
+def _stale_snapshots(directory: str, registry: _Registry) -> List[str]:
+    stale = []
+    for filename in os.listdir(directory):
+        if not filename.endswith(".json"):
+            continue
+        pid, started = _owner(filename)
+        if pid is None:
+            continue
+        if pid == registry.pid:
+            if started != str(registry.started):
+                stale.append(filename)
+        elif not _process_alive(pid):
+            stale.append(filename)
+    return stale
+
+
+def flush_metrics(registry: _Registry = None) -> None:
+    """Writes this process's snapshot, replacing the previous one atomically."""
+    registry = registry or _current()
+    registry.flushed_at = time.monotonic()
+    directory = metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    if not registry.flushed:
+        # Whatever an earlier process with this PID left behind, before it
+        # could be mistaken for this one's.
+        with _DirectoryLock(directory):
+            _retire(directory, [
+                filename for filename in os.listdir(directory)
+                if filename.endswith(".json") and _owner(filename)[0] == registry.pid
+            ])
+        registry.flushed = True
+    _write(os.path.join(directory, f"{registry.pid}-{registry.started}.json"), _snapshot(registry))
+
+
+def _maybe_flush(registry: _Registry) -> None:
+    if time.monotonic() - registry.flushed_at >= float(getattr(settings, "METRICS_FLUSH_SECONDS", 5.0)):
+        try:
+            flush_metrics(registry)
+        except OSError:
+            pass
+
+
+@atexit.register
+def _flush_at_exit() -> None:
+    if _registry.pid == os.getpid() and (_registry.counters or _registry.histograms):
+        try:
+            flush_metrics(_registry)
+        except Exception:
+            pass
+
+
+def collect_metrics() -> Tuple[Dict, Dict]:
+    """
+    Counters and histograms summed over the snapshots of every process,
+    live or retired; snapshots of exited processes are retired first.
+    """
+    registry = _current()
+    flush_metrics(registry)
+    counters: Dict[Tuple[str, _Labels], float] = {}
+    histograms: Dict[Tuple[str, _Labels], List[float]] = {}
+    directory = metrics_dir()
+    with _DirectoryLock(directory):
+        _retire(directory, _stale_snapshots(directory, registry))
+        for filename in os.listdir(directory):
+            if not filename.endswith(".json"):
+                continue
+            data = _load(os.path.join(directory, filename))
+            if data is not None:
+                _merge(counters, histograms, data)
+    return counters, histograms
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    labels = list(labels)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_metrics() -> str:
+    counters, histograms = collect_metrics()
+    lines = []
+    for name, description in COUNTERS.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+        for (key_name, labels), value in sorted(counters.items()):
+            if key_name == name:
+                lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+
+    pulls = sum(value for (name, _), value in counters.items() if name == "stream_pulls_total")
+    empty = sum(value for (name, _), value in counters.items() if name == "stream_empty_pulls_total")
+    lines += [
+        "# HELP stream_empty_pull_ratio Share of pull requests that ended with no message.",
+        "# TYPE stream_empty_pull_ratio gauge",
+        f"stream_empty_pull_ratio {_format_number(empty / pulls if pulls else 0)}",
+    ]
+
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+        for (key_name, labels), values in sorted(histograms.items()):
+            if key_name != name:
+                continue
+            cumulative = 0.0
+            for bound, count in zip(list(buckets) + ["+Inf"], values[:-1]):
+                cumulative += count
+                bucket_labels = list(labels) + [("le", str(bound))]
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {_format_number(cumulative)}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(values[-1])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {_format_number(cumulative)}")
+
+    lines += ["# HELP stream_active Active collector streams.", "# TYPE stream_active gauge"]
+    active = (
+        PixStream.objects.filter(active=True, is_prefetch=False)
+        .values("ispb")
+        .order_by("ispb")
+        .annotate(count=Count("id"))
+        .values_list("ispb", "count")
+    )
+    for ispb, count in active:
+        lines.append(f'stream_active{{ispb="{ispb}"}} {count}')
+    return "\n".join(lines) + "\n"
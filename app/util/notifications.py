@@ -0,0 +1,344 @@
+"""
+Wake-ups for long-polling streams backed by PostgreSQL LISTEN/NOTIFY.
+
+Insert paths call ``notify_new_messages`` inside their transaction, so the
+notification is only delivered once the rows are visible. Waiting pulls
+subscribe to the receiving ISPB's channel through a single per-process
+``MessageListener`` instead of re-running the claim query on a timer.
+
+The listener also coordinates the waits: rather than each waiting pull
+re-claiming on its own timer, it runs one probe per ISPB with waiters (one
+query for all due ISPBs) and wakes all of that ISPB's waiters when pending
+work shows up. The probe interval of an ISPB starts at
+``STREAM_POLL_INTERVAL_SECONDS`` after a delivery or notification and doubles
+while it stays idle, up to ``STREAM_NOTIFY_SAFETY_POLL_SECONDS`` (or
+``STREAM_POLL_MAX_INTERVAL_SECONDS`` when notifications are off). The probe
+is what still finds work whose notification was missed or never sent.
+"""
+import asyncio
+import logging
+import os
+import select
+import threading
+import time
+from typing import Dict, Iterable, Optional, Set
+
+import psycopg2
+from django.conf import settings
+from django.db import connections
+
+from data.models import PixMessage, PixQueueHorizon
+from util.metrics import increment_counter
+
+
+CHANNEL_PREFIX = "pix_ispb_"
+RECONNECT_DELAY_SECONDS = 1.0
+
+
+def channel_for(ispb: str) -> str:
+    return f"{CHANNEL_PREFIX}{ispb}"
+
+
+_PROBE_SQL = f"""
+SELECT ispb
+FROM unnest(%s::text[]) AS ispb
+WHERE EXISTS (
+    SELECT 1 FROM {PixMessage._meta.db_table} m
+    WHERE m.receiver_ispb = ispb
+      AND m.status = %s
+      AND m.created_at >= COALESCE(
+          (SELECT created_after FROM {PixQueueHorizon._meta.db_table} WHERE id = 1), '-infinity'
+      )
+)
+"""
+
+
+def notify_new_messages(ispbs: Iterable[str], using: str = "default") -> None:
+    channels = sorted({channel_for(ispb) for ispb in ispbs})
+    connection = connections[using]
+    if not channels or connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(channel, '') FROM unnest(%s::text[]) AS channel", [channels])
+
+
+class Subscription:
+    """
+    A waiter's interest in one ISPB channel. Sync pulls block on ``wait``;
+    async pulls pass their event loop and await ``wait_async`` instead.
+    """
+
+    def __init__(
+        self,
+        listener: "MessageListener",
+        channel: str,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> None:
+        self._listener = listener
+        self._loop = loop
+        self._event = threading.Event()
+        self._async_event = asyncio.Event() if loop is not None else None
+        self.channel = channel
+
+    def _wake(self) -> None:
+        self._event.set()
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._async_event.set)
+            except RuntimeError:
+                pass
+
+    def wait(self, timeout: float) -> bool:
+        woke = self._event.wait(timeout)
+        self._event.clear()
+        return woke
+
+    async def wait_async(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._async_event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._async_event.clear()
+
+    def close(self) -> None:
+        self._listener.unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class _Probe:
+    """Backoff state of one ISPB's probe."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.due_at = time.monotonic() + interval
+
+
+class MessageListener:
+    """
+    Owns one autocommit connection per process that LISTENs on the channels
+    of every ISPB with a waiting pull (unless ``listen`` is off), probes those
+    ISPBs for pending messages and wakes the matching subscriptions.
+    """
+
+    def __init__(self, using: str = "default", listen: bool = True) -> None:
+        self.using = using
+        self.listen = listen
+        self.pid = os.getpid()
+        self.available = False
+        self.probes = 0
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._probes: Dict[str, _Probe] = {}
+        self._listening: Set[str] = set()
+        self._conn = None
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_w, False)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pix-listener", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._kick()
+        self._thread.join(timeout=5)
+
+    def is_running(self) -> bool:
+        return self._thread.is_alive() and not self._stopped.is_set()
+
+    def subscribe(self, ispb: str, loop: Optional[asyncio.AbstractEventLoop] = None) -> Subscription:
+        subscription = Subscription(self, channel_for(ispb), loop=loop)
+        with self._lock:
+            self._subscribers.setdefault(subscription.channel, set()).add(subscription)
+            if subscription.channel not in self._probes:
+                self._probes[subscription.channel] = _Probe(self._min_interval())
+        self._kick()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.channel]
+                self._probes.pop(subscription.channel, None)
+
+    def delivered(self, ispb: str, full: bool = False) -> None:
+        """
+        Probes ``ispb`` at the fastest rate again, as more work may follow.
+        After a ``full`` batch its waiters are woken right away instead: the
+        rest may sit in a prefetch buffer, which the probe does not see.
+        """
+        if full:
+            self._wake([channel_for(ispb)])
+            return
+        with self._lock:
+            probe = self._probes.get(channel_for(ispb))
+            if probe is not None:
+                self._reset(probe)
+
+    def _min_interval(self) -> float:
+        return float(getattr(settings, "STREAM_POLL_INTERVAL_SECONDS", 0.2))
+
+    def _max_interval(self) -> float:
+        if self.listen:
+            return float(getattr(settings, "STREAM_NOTIFY_SAFETY_POLL_SECONDS", 2.0))
+        return float(getattr(settings, "STREAM_POLL_MAX_INTERVAL_SECONDS", 1.6))
+
+    def _reset(self, probe: _Probe) -> None:
+        # Always push the deadline out: a woken waiter may stay subscribed while
+        # its claim is in flight, and an overdue busy probe would spin.
+        probe.interval = self._min_interval()
+        probe.due_at = time.monotonic() + probe.interval
+
+    def _kick(self) -> None:
+        try:
+            os.write(self._wakeup_w, b"\0")
+        except BlockingIOError:
+            pass
+
+    def _run(self) -> None:
+        logger = logging.getLogger(__name__)
+        while not self._stopped.is_set():
+            try:
+                self._connect()
+                if self.listen:
+                    self._listen_pending()
+                readable, _, _ = select.select([self._conn, self._wakeup_r], [], [], self._select_timeout())
+                if self._wakeup_r in readable:
+                    os.read(self._wakeup_r, 4096)
+                if self._conn in readable:
+                    self._conn.poll()
+                    self._dispatch()
+                self._probe_due()
+            except Exception:
+                # Not only database errors: a failing select, wakeup pipe or
+                # metric is retried too, so the thread keeps serving waiters.
+                logger.warning("stream.listener_error", exc_info=True)
+                self._disconnect()
+                self._stopped.wait(RECONNECT_DELAY_SECONDS)
+        self._disconnect()
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+
+    def _connect(self) -> None:
+        if self._conn is not None:
+            return
+        conn = psycopg2.connect(**connections[self.using].get_connection_params())
+        conn.autocommit = True
+        self._conn = conn
+        self._listening = set()
+        self.available = True
+
+    def _disconnect(self) -> None:
+        self.available = False
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except psycopg2.Error:
+                pass
+            self._conn = None
+
+    def _listen_pending(self) -> None:
+        with self._lock:
+            missing = set(self._subscribers) - self._listening
+        if not missing:
+            return
+        with self._conn.cursor() as cursor:
+            for channel in sorted(missing):
+                cursor.execute(f'LISTEN "{channel}"')
+        self._listening |= missing
+
+    def _dispatch(self) -> None:
+        channels = {notify.channel for notify in self._conn.notifies}
+        self._conn.notifies.clear()
+        self._wake(channels)
+
+    def _wake(self, channels: Iterable[str]) -> None:
+        with self._lock:
+            woken = []
+            for channel in channels:
+                woken.extend(self._subscribers.get(channel, ()))
+                if channel in self._probes:
+                    self._reset(self._probes[channel])
+        for subscription in woken:
+            subscription._wake()
+
+    def _select_timeout(self) -> float:
+        with self._lock:
+            next_due = min((probe.due_at for probe in self._probes.values()), default=None)
+        if next_due is None:
+            return 1.0
+        return min(1.0, max(0.0, next_due - time.monotonic()))
+
+    def _probe_due(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            due = sorted(channel for channel, probe in self._probes.items() if probe.due_at <= now)
+        if not due:
+            return
+        with self._conn.cursor() as cursor:
+            cursor.execute(
+                _PROBE_SQL,
+                [[channel[len(CHANNEL_PREFIX):] for channel in due], PixMessage.MessageStatus.PENDING],
+            )
+            busy = {channel_for(ispb) for ispb, in cursor.fetchall()}
+        self.probes += 1
+        increment_counter("stream_wait_probes_total")
+
+        now = time.monotonic()
+        with self._lock:
+            for channel in due:
+                probe = self._probes.get(channel)
+                if probe is not None and channel not in busy:
+                    probe.interval = min(probe.interval * 2, self._max_interval())
+                    probe.due_at = now + probe.interval
+        self._wake(busy)
+
+
+_listener: Optional[MessageListener] = None
+_listener_lock = threading.Lock()
+
+
+def get_listener() -> Optional[MessageListener]:
+    """
+    Return the process listener, or ``None`` when neither notifications nor
+    wait coordination (STREAM_WAIT_COORDINATION_ENABLED) are on, in which case
+    every waiting pull polls on its own.
+    """
+    global _listener
+    listen = getattr(settings, "STREAM_NOTIFICATIONS_ENABLED", True)
+    if not listen and not getattr(settings, "STREAM_WAIT_COORDINATION_ENABLED", True):
+        return None
+    if connections["default"].vendor != "postgresql":
+        return None
+    with _listener_lock:
+        if _listener is not None and _listener.pid == os.getpid() and _listener.listen != listen:
+            _listener.stop()
+        if (
+            _listener is None
+            or _listener.pid != os.getpid()
+            or not _listener.is_running()
+            or _listener.listen != listen
+        ):
+            _listener = MessageListener(listen=listen)
+            _listener.start()
+        return _listener
+
+
+def stop_listener() -> None:
+    global _listener
+    with _listener_lock:
+        if _listener is not None and _listener.pid == os.getpid():
+            _listener.stop()
+        _listener = None
@@ -0,0 +1,193 @@
+"""
+Daily range partitions of the message table.
+
+``data_pixmessage`` is partitioned by ``created_at`` (see
+data/migrations/0003_partition_pix_messages.py). Partitions are named
+``data_pixmessage_pYYYYMMDD`` and cover one UTC day; rows outside every
+partition land in ``data_pixmessage_default``. ``ensure_partitions`` creates
+upcoming partitions, ``expire_partitions`` detaches or drops those past the
+retention period, and ``advance_queue_horizon`` moves the created_at cutoff
+that lets claims skip partitions holding only consumed history.
+"""
+import logging
+import time
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from data.models import PixMessage, PixMessageKey, PixQueueHorizon
+
+
+PARENT_TABLE = PixMessage._meta.db_table
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+PARTITION_PREFIX = f"{PARENT_TABLE}_p"
+
+_UNFINISHED = (PixMessage.MessageStatus.PENDING, PixMessage.MessageStatus.RESERVED)
+
+_horizon_cache: Tuple[float, Optional[datetime]] = (0.0, None)
+
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc)
+
+
+def list_partitions() -> List[Tuple[str, date]]:
+    """Daily partitions currently attached to the message table, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s AND child.relname LIKE %s
+            """,
+            [PARENT_TABLE, PARTITION_PREFIX + "%"],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        suffix = name[len(PARTITION_PREFIX):]
+        if len(suffix) == 8 and suffix.isdigit():
+            partitions.append((name, datetime.strptime(suffix, "%Y%m%d").date()))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+@transaction.atomic
+def create_partition(day: date) -> str:
+    """
+    Creates and attaches the partition for ``day``. Rows already sitting in
+    the default partition for that day are moved into it first, since the
+    attach would otherwise fail on them.
+    """
+    name = partition_name(day)
+    lower, upper = day_start(day), day_start(day + timedelta(days=1))
+    with connection.cursor() as cursor:
+        # The CHECK constraints must match the parent's for the attach.
+        cursor.execute(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """,
+            [lower, upper],
+        )
+        # The delete above released the moved rows' keys, and the detached
+        # table has no insert trigger yet to register them again.
+        cursor.execute(
+            f"INSERT INTO {PixMessageKey._meta.db_table} (end_to_end_id, created_at) "
+            f"SELECT end_to_end_id, created_at FROM {name}"
+        )
+        cursor.execute(
+            f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [lower, upper]
+        )
+    logging.getLogger(__name__).info("partitions.created", extra={"partition": name})
+    return name
+
+
+def ensure_partitions(ahead_days: Optional[int] = None, today: Optional[date] = None) -> List[str]:
+    """
+    Creates the missing daily partitions from the oldest row left in the
+    default partition (or today) up to ``ahead_days`` days from today.
+    """
+    if ahead_days is None:
+        ahead_days = int(getattr(settings, "MESSAGE_PARTITION_PREMAKE_DAYS", 7))
+    today = today or timezone.now().astimezone(dt_timezone.utc).date()
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT min(created_at) FROM {DEFAULT_PARTITION}")
+        (oldest,) = cursor.fetchone()
+    first = min(today, oldest.astimezone(dt_timezone.utc).date()) if oldest is not None else today
+
+    existing = {day for _, day in list_partitions()}
+    created = []
+    day = first
+    while day <= today + timedelta(days=ahead_days):
+        if day not in existing:
+            created.append(create_partition(day))
+        day += timedelta(days=1)
+    return created
+
+
+def expire_partitions(
+    retention_days: Optional[int] = None, drop: bool = False, today: Optional[date] = None
+) -> Tuple[List[str], List[str]]:
+    """
+    Detaches (or drops, with ``drop``) the partitions whose whole day is older
+    than ``retention_days``. A partition still holding pending or reserved
+    messages is kept. Returns the expired and the kept partition names.
+    """
+    logger = logging.getLogger(__name__)
+    if retention_days is None:
+        retention_days = int(getattr(settings, "MESSAGE_RETENTION_DAYS", 90))
+    today = today or timezone.now().astimezone(dt_timezone.utc).date()
+    cutoff = today - timedelta(days=retention_days)
+
+    expired, kept = [], []
+    for name, day in list_partitions():
+        if day >= cutoff:
+            break
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {name} WHERE status IN %s)", [_UNFINISHED])
+            if cursor.fetchone()[0]:
+                logger.warning("partitions.expire_skipped", extra={"partition": name})
+                kept.append(name)
+                continue
+            cursor.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}")
+            if drop:
+                cursor.execute(f"DROP TABLE {name}")
+                PixMessageKey.objects.filter(
+                    created_at__gte=day_start(day), created_at__lt=day_start(day + timedelta(days=1))
+                ).delete()
+        logger.info("partitions.expired", extra={"partition": name, "dropped": drop})
+        expired.append(name)
+    return expired, kept
+
+
+def advance_queue_horizon(now: Optional[datetime] = None) -> datetime:
+    """
+    Stores the start of the oldest day that may still hold a pending or
+    reserved message. New rows are stamped with the current time, so with no
+    unfinished rows the horizon is the start of the day an hour ago, which
+    leaves room for inserts still in flight.
+    """
+    now = now or timezone.now()
+    oldest = PixMessage.objects.filter(status__in=_UNFINISHED).order_by("created_at").values_list(
+        "created_at", flat=True
+    ).first()
+    bound = now - timedelta(hours=1)
+    if oldest is not None:
+        bound = min(bound, oldest)
+    horizon = day_start(bound.astimezone(dt_timezone.utc).date())
+    PixQueueHorizon.objects.update_or_create(pk=1, defaults={"created_after": horizon})
+    reset_queue_horizon_cache()
+    return horizon
+
+
+def queue_horizon() -> Optional[datetime]:
+    """
+    The stored horizon, cached per process for
+    ``MESSAGE_QUEUE_HORIZON_CACHE_SECONDS``. A stale value is always an older
+    one, which only prunes less.
+    """
+    global _horizon_cache
+    expires_at, horizon = _horizon_cache
+    if time.monotonic() < expires_at:
+        return horizon
+    horizon = PixQueueHorizon.objects.filter(pk=1).values_list("created_after", flat=True).first()
+    ttl = float(getattr(settings, "MESSAGE_QUEUE_HORIZON_CACHE_SECONDS", 60.0))
+    _horizon_cache = (time.monotonic() + ttl, horizon)
+    return horizon
+
+
+def reset_queue_horizon_cache() -> None:
+    global _horizon_cache
+    _horizon_cache = (0.0, None)
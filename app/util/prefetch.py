@@ -0,0 +1,224 @@
+"""
+Per-process prefetch of pending messages, one buffer per ISPB.
+
+With ``STREAM_PREFETCH_ENABLED``, a pull that finds its ISPB's buffer empty
+claims up to ``STREAM_PREFETCH_MESSAGES`` messages at once for a hidden
+prefetch stream (``PixStream.is_prefetch``) of this process. Later pulls of
+local streams are served from the buffer: the messages they take are moved
+from the prefetch stream to the pulling stream with a primary-key update, so
+DELETE still consumes exactly what each stream was handed.
+
+Prefetched messages stay reserved, so no other process can take them. They
+go back to pending when the buffer is older than
+``STREAM_PREFETCH_LEASE_SECONDS``, when the process exits, or, if it dies,
+when the reaper expires the prefetch stream like any idle stream.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from data.models import PixMessage, PixStream
+from data.serializers import PIX_MESSAGE_WIRE_FIELDS
+from util.notifications import notify_new_messages
+from util.utils import (
+    _CLAIM_CTES,
+    _CLAIM_FORMAT,
+    _CLAIM_UPDATE,
+    _RELEASE_RESERVED_SQL,
+    _claim_params,
+    _stream_is_closed,
+    claim_horizon,
+    generate_random_string,
+)
+
+
+# The regular claim, also returning the estimated size of each message so
+# handouts can honour the byte budget of the pulling stream, and its lane to
+# keep the buffer in claim order.
+_PREFETCH_CLAIM_SQL = (_CLAIM_CTES + _CLAIM_UPDATE + "\nRETURNING m.id, {size}, m.priority, {returning}\n").format(
+    returning=", ".join(f"m.{field}" for field in PIX_MESSAGE_WIRE_FIELDS),
+    **_CLAIM_FORMAT,
+)
+
+# Moves prefetched messages to the pulling stream, locking it like a claim
+# does so a concurrent DELETE either consumes them or nothing moves. Rows no
+# longer held by the prefetch stream (released by the reaper) are skipped.
+_HANDOUT_SQL = f"""
+WITH live AS (
+    SELECT id FROM {PixStream._meta.db_table} WHERE id = %(stream)s AND active FOR NO KEY UPDATE
+)
+UPDATE {PixMessage._meta.db_table} AS m
+SET reserved_by_id = live.id, reserved_at = %(now)s
+FROM live
+WHERE m.id = ANY(%(ids)s) AND m.created_at >= %(horizon)s
+AND m.reserved_by_id = %(prefetch)s AND m.status = %(reserved)s
+RETURNING m.id
+"""
+
+# Large enough that a prefetch claim is bounded by its message count alone.
+_UNBOUNDED_BYTES = 2 ** 62
+
+
+class PrefetchBuffer:
+    """Messages of one ISPB claimed ahead by this process, in claim (priority, id) order."""
+
+    def __init__(self, ispb: str) -> None:
+        self.ispb = ispb
+        self.stream: Optional[PixStream] = None
+        self.rows: List[tuple] = []
+        self.filled_at = 0.0
+        self.lock = threading.Lock()
+
+    def _expired(self) -> bool:
+        lease = float(getattr(settings, "STREAM_PREFETCH_LEASE_SECONDS", 30.0))
+        return time.monotonic() - self.filled_at > lease
+
+    def _refill(self) -> None:
+        if self.stream is None:
+            self.stream = PixStream.objects.create(
+                interation_id=f"prefetch-{generate_random_string(12)}", ispb=self.ispb, is_prefetch=True
+            )
+        else:
+            PixStream.objects.filter(pk=self.stream.pk).update(last_pull_at=timezone.now())
+        size = int(getattr(settings, "STREAM_PREFETCH_MESSAGES", 500))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _PREFETCH_CLAIM_SQL, _claim_params(self.stream, size, _UNBOUNDED_BYTES, timezone.now(), fair=False)
+            )
+            rows = cursor.fetchall()
+        if not rows and _stream_is_closed(self.stream):
+            # Reaped while idle; the next refill starts a new prefetch stream.
+            self.stream = None
+        rows.sort(key=lambda row: (row[2], row[0]))
+        self.rows = rows
+        self.filled_at = time.monotonic()
+
+    def release(self) -> int:
+        """Closes the prefetch stream and returns its unserved messages to pending."""
+        stream, self.stream, self.rows = self.stream, None, []
+        if stream is None:
+            return 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            PixStream.objects.filter(pk=stream.pk).update(active=False, terminated_at=timezone.now())
+            cursor.execute(
+                _RELEASE_RESERVED_SQL,
+                {
+                    "streams": [stream.pk],
+                    "pending": PixMessage.MessageStatus.PENDING,
+                    "reserved": PixMessage.MessageStatus.RESERVED,
+                    "horizon": claim_horizon(),
+                },
+            )
+            released = cursor.rowcount
+            if released:
+                notify_new_messages([self.ispb])
+        return released
+
+    def take(self, stream: PixStream, limit: int, max_bytes: int, reserved_at: datetime) -> Optional[List[tuple]]:
+        """
+        Hands up to ``limit`` prefetched messages, within ``max_bytes``, to
+        ``stream`` and returns their wire rows, or ``None`` when ``stream``
+        is closed.
+        """
+        with self.lock:
+            if self.rows and self._expired():
+                self.release()
+            if not self.rows:
+                self._refill()
+
+            picked, used = [], 0
+            for row in self.rows[:limit]:
+                used += row[1]
+                if picked and used > max_bytes:
+                    break
+                picked.append(row)
+            if not picked:
+                return None if _stream_is_closed(stream) else []
+            del self.rows[:len(picked)]
+            prefetch = self.stream
+
+        # Handouts of different streams run concurrently; the rows taken
+        # above are no longer visible to them.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _HANDOUT_SQL,
+                {
+                    "stream": stream.pk,
+                    "prefetch": prefetch.pk,
+                    "ids": [row[0] for row in picked],
+                    "now": reserved_at,
+                    "horizon": claim_horizon(),
+                    "reserved": PixMessage.MessageStatus.RESERVED,
+                },
+            )
+            moved = {row[0] for row in cursor.fetchall()}
+
+        if not moved and _stream_is_closed(stream):
+            with self.lock:
+                if self.stream is prefetch:
+                    self.rows[:0] = picked
+            return None
+        if len(moved) < len(picked):
+            # The prefetch stream outlived its lease and was reaped: what is
+            # left in the buffer may already belong to someone else.
+            logging.getLogger(__name__).warning("prefetch.lost", extra={"ispb": self.ispb})
+            with self.lock:
+                if self.stream is prefetch:
+                    self.stream, self.rows = None, []
+        return [row[3:] for row in picked if row[0] in moved]
+
+
+_buffers: Dict[str, PrefetchBuffer] = {}
+_buffers_pid: Optional[int] = None
+_buffers_lock = threading.Lock()
+
+
+def prefetch_buffer(ispb: str) -> PrefetchBuffer:
+    global _buffers, _buffers_pid
+    with _buffers_lock:
+        if _buffers_pid != os.getpid():
+            # A forked worker must not serve its parent's reservations.
+            _buffers, _buffers_pid = {}, os.getpid()
+        buffer = _buffers.get(ispb)
+        if buffer is None:
+            buffer = _buffers[ispb] = PrefetchBuffer(ispb)
+        return buffer
+
+
+def take_prefetched(
+    stream: PixStream, limit: int, max_bytes: Optional[int] = None, reserved_at: Optional[datetime] = None
+) -> Optional[List[tuple]]:
+    if max_bytes is None:
+        max_bytes = int(getattr(settings, "STREAM_MULTIPART_MAX_BYTES", 8 * 1024 * 1024))
+    return prefetch_buffer(stream.ispb).take(stream, limit, max_bytes, reserved_at or timezone.now())
+
+
+def release_prefetched() -> int:
+    """Returns every message prefetched by this process to pending."""
+    logger = logging.getLogger(__name__)
+    with _buffers_lock:
+        buffers = list(_buffers.values()) if _buffers_pid == os.getpid() else []
+    released = 0
+    for buffer in buffers:
+        with buffer.lock:
+            released += buffer.release()
+    if released:
+        logger.info("prefetch.released", extra={"messages": released})
+    return released
+
+
+@atexit.register
+def _release_on_exit() -> None:
+    try:
+        release_prefetched()
+    except Exception:
+        # Too late to report; the reaper releases them after the lease.
+        pass
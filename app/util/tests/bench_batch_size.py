@@ -0,0 +1,83 @@
+"""
+Benchmark: multipart pull throughput as the batch size grows. Not collected
+by the default test run; execute with
+
+    python manage.py test util.tests.bench_batch_size
+
+Tunable through BENCH_MESSAGES and BENCH_BATCH_SIZES (comma separated).
+"""
+import json
+import os
+import time
+from decimal import Decimal
+
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from data.models import PixMessage, PixStream
+
+
+MESSAGES = int(os.environ.get("BENCH_MESSAGES", 20000))
+BATCH_SIZES = [int(size) for size in os.environ.get("BENCH_BATCH_SIZES", "1,10,100,1000,5000").split(",")]
+
+
+@override_settings(STREAM_LONG_POLLING_TIMEOUT_SECONDS=0.0, STREAM_MULTIPART_MAX_MESSAGES=max(BATCH_SIZES))
+class BenchBatchSize(TransactionTestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.ispb = "12345678"
+        now = timezone.now()
+        PixMessage.objects.bulk_create(
+            [
+                PixMessage(
+                    end_to_end_id=f"E{self.ispb}bench{i}",
+                    tx_id=f"tx{i}",
+                    amount=Decimal("10.00"),
+                    payment_at=now,
+                    free_text="",
+                    payer_name="Tester",
+                    payer_cpf_cnpj="12345678901",
+                    payer_ispb="87654321",
+                    payer_agencia="0001",
+                    payer_conta_transacional="111",
+                    payer_tipo_conta="CACC",
+                    receiver_name="Receiver",
+                    receiver_cpf_cnpj="01987654321",
+                    receiver_ispb=self.ispb,
+                    receiver_agencia="0001",
+                    receiver_conta_transacional="222",
+                    receiver_tipo_conta="SVGS",
+                )
+                for i in range(MESSAGES)
+            ],
+            batch_size=5000,
+        )
+
+
+    def _drain(self, batch_size: int) -> dict:
+        PixMessage.objects.update(status=PixMessage.MessageStatus.PENDING, reserved_by=None, reserved_at=None)
+        stream = PixStream.objects.create(interation_id=f"bench{batch_size}", ispb=self.ispb)
+
+        pulls = delivered = 0
+        started = time.perf_counter()
+        while True:
+            resp = self.client.get(
+                f"/api/pix/{self.ispb}/stream/{stream.interation_id}?limit={batch_size}",
+                HTTP_ACCEPT="multipart/json",
+            )
+            if resp.status_code != 200:
+                break
+            pulls += 1
+            body = b"".join(resp.streaming_content) if resp.streaming else resp.content
+            delivered += len(json.loads(body))
+        elapsed = time.perf_counter() - started
+        return {"pulls": pulls, "messages": delivered, "messages_per_second": round(delivered / elapsed)}
+
+
+    def test_throughput_by_batch_size(self):
+        print(f"\nmessages={MESSAGES}")
+        for batch_size in BATCH_SIZES:
+            result = self._drain(batch_size)
+            self.assertEqual(result["messages"], MESSAGES)
+            print(f"  batch={batch_size:>5}: {result}")
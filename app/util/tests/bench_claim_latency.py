@@ -0,0 +1,133 @@
+"""
+Benchmark: claim latency as consumed history grows, with the partial queue
+indexes against the previous full (receiver_ispb, status, id) layout. Not
+collected by the default test run; execute with
+
+    python manage.py test util.tests.bench_claim_latency
+
+Tunable through BENCH_HISTORY_ROWS (comma separated, cumulative), BENCH_ROUNDS
+and BENCH_LIMIT. The default sizes need tens of gigabytes of disk.
+"""
+import os
+import statistics
+import time
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from data.models import PixMessage, PixStream
+from util.utils import reserve_messages
+
+
+HISTORY_ROWS = [int(size) for size in os.environ.get("BENCH_HISTORY_ROWS", "1000000,10000000,50000000").split(",")]
+ROUNDS = int(os.environ.get("BENCH_ROUNDS", 200))
+LIMIT = int(os.environ.get("BENCH_LIMIT", 10))
+ISPBS = 500
+
+TABLE = PixMessage._meta.db_table
+
+# Index DDL of each layout; the other layout's indexes are dropped first.
+LAYOUTS = {
+    "partial": [
+        f"CREATE INDEX pixmessage_pending_idx ON {TABLE} (receiver_ispb, priority, id) WHERE status = 'pendente'",
+        f"CREATE INDEX pixmessage_reserved_idx ON {TABLE} (reserved_by_id, id) WHERE status = 'reservado'",
+    ],
+    "full": [
+        f"CREATE INDEX bench_full_claim_idx ON {TABLE} (receiver_ispb, status, id)",
+        f"CREATE INDEX bench_full_reserved_by_idx ON {TABLE} (reserved_by_id)",
+        f"CREATE INDEX bench_full_status_idx ON {TABLE} (status)",
+    ],
+}
+CLAIM_INDEX = {"partial": "pixmessage_pending_idx", "full": "bench_full_claim_idx"}
+ALL_INDEXES = [
+    "pixmessage_pending_idx",
+    "pixmessage_reserved_idx",
+    "bench_full_claim_idx",
+    "bench_full_reserved_by_idx",
+    "bench_full_status_idx",
+]
+
+_INSERT_SQL = f"""
+INSERT INTO {TABLE} (
+    end_to_end_id, tx_id, amount, payment_at, free_text,
+    payer_name, payer_cpf_cnpj, payer_ispb, payer_agencia, payer_conta_transacional, payer_tipo_conta,
+    receiver_name, receiver_cpf_cnpj, receiver_ispb, receiver_agencia, receiver_conta_transacional, receiver_tipo_conta,
+    status, reserved_at, consumed_at, created_at
+)
+SELECT
+    %(prefix)s || n, 'tx' || n, 10.00, %(now)s, '',
+    'Tester', '12345678901', '87654321', '0001', '111', 'CACC',
+    'Receiver', '01987654321', coalesce(%(ispb)s, lpad((n %% {ISPBS})::text, 8, '0')), '0001', '222', 'SVGS',
+    %(status)s, %(consumed_at)s, %(consumed_at)s, %(now)s
+FROM generate_series(%(start)s, %(stop)s) AS n
+"""
+
+
+class BenchClaimLatency(TransactionTestCase):
+    def setUp(self) -> None:
+        self.ispb = f"{7:08d}"
+        self.addCleanup(self._apply_layout, "partial")
+
+
+    def _execute(self, *statements: str, params: dict = None) -> None:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement, params)
+
+
+    def _insert(self, prefix: str, start: int, stop: int, status: str, ispb: str = None) -> None:
+        now = timezone.now()
+        consumed_at = now if status == PixMessage.MessageStatus.CONSUMED else None
+        params = {
+            "prefix": prefix,
+            "ispb": ispb,
+            "start": start,
+            "stop": stop,
+            "status": status,
+            "now": now,
+            "consumed_at": consumed_at,
+        }
+        self._execute(_INSERT_SQL, params=params)
+
+
+    def _apply_layout(self, layout: str) -> None:
+        self._execute(*[f"DROP INDEX IF EXISTS {name}" for name in ALL_INDEXES], *LAYOUTS[layout])
+        self._execute(f"ANALYZE {TABLE}")
+
+
+    def _index_size(self, name: str) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_relation_size(%s::regclass)", [name])
+            return cursor.fetchone()[0]
+
+
+    def _measure(self, layout: str) -> dict:
+        self._execute(f"DELETE FROM {TABLE} WHERE end_to_end_id LIKE 'Pbench%%'")
+        self._insert("Pbench", 0, ROUNDS * LIMIT - 1, PixMessage.MessageStatus.PENDING, self.ispb)
+        self._apply_layout(layout)
+        stream = PixStream.objects.create(interation_id=f"bench-{layout}-{time.monotonic_ns()}", ispb=self.ispb)
+
+        latencies = []
+        for _ in range(ROUNDS):
+            started = time.perf_counter()
+            rows = reserve_messages(stream, LIMIT)
+            latencies.append(time.perf_counter() - started)
+            self.assertEqual(len(rows), LIMIT)
+        latencies.sort()
+        return {
+            "p50_ms": round(statistics.median(latencies) * 1000, 3),
+            "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3),
+            "claim_index_mb": round(self._index_size(CLAIM_INDEX[layout]) / 1024 / 1024, 1),
+        }
+
+
+    def test_claim_latency_by_history_size(self):
+        print(f"\nrounds={ROUNDS} limit={LIMIT}")
+        inserted = 0
+        for size in HISTORY_ROWS:
+            self._execute(f"DROP INDEX IF EXISTS {', '.join(ALL_INDEXES)}")
+            self._insert("Hbench", inserted, size - 1, PixMessage.MessageStatus.CONSUMED)
+            inserted = size
+            for layout in ("full", "partial"):
+                print(f"  history={size:>9} {layout:>7}: {self._measure(layout)}")
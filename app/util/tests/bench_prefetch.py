@@ -0,0 +1,89 @@
+"""
+Benchmark: messages/sec handed to collectors of one ISPB with the prefetch
+buffer on and off. Not collected by the default test run; execute with
+
+    python manage.py test util.tests.bench_prefetch
+
+Tunable through BENCH_MESSAGES, BENCH_COLLECTORS, BENCH_LIMIT and
+BENCH_PREFETCH (the STREAM_PREFETCH_MESSAGES used when on).
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from data.models import PixMessage, PixStream
+from util.prefetch import release_prefetched
+from util.utils import claim_pull_batch
+
+
+MESSAGES = int(os.environ.get("BENCH_MESSAGES", 50000))
+COLLECTORS = int(os.environ.get("BENCH_COLLECTORS", 6))
+LIMIT = int(os.environ.get("BENCH_LIMIT", 10))
+PREFETCH = int(os.environ.get("BENCH_PREFETCH", 500))
+
+_INSERT_SQL = f"""
+INSERT INTO {PixMessage._meta.db_table} (
+    end_to_end_id, tx_id, amount, payment_at, free_text,
+    payer_name, payer_cpf_cnpj, payer_ispb, payer_agencia, payer_conta_transacional, payer_tipo_conta,
+    receiver_name, receiver_cpf_cnpj, receiver_ispb, receiver_agencia, receiver_conta_transacional, receiver_tipo_conta,
+    status, created_at
+)
+SELECT
+    %(prefix)s || n, 'tx' || n, 10.00, %(now)s, '',
+    'Tester', '12345678901', '87654321', '0001', '111', 'CACC',
+    'Receiver', '01987654321', %(ispb)s, '0001', '222', 'SVGS',
+    'pendente', %(now)s
+FROM generate_series(1, %(count)s) AS n
+"""
+
+
+class BenchPrefetch(TransactionTestCase):
+    def setUp(self) -> None:
+        self.ispb = "12345678"
+        self.addCleanup(release_prefetched)
+
+
+    def _run(self, label: str) -> dict:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _INSERT_SQL, {"prefix": f"E{label}", "now": timezone.now(), "ispb": self.ispb, "count": MESSAGES}
+            )
+            cursor.execute(f"ANALYZE {PixMessage._meta.db_table}")
+        streams = [
+            PixStream.objects.create(interation_id=f"bench-{label}-{n}", ispb=self.ispb) for n in range(COLLECTORS)
+        ]
+
+        def collect(stream: PixStream) -> int:
+            delivered = 0
+            try:
+                while True:
+                    batch = claim_pull_batch(stream, LIMIT, streamed=False)
+                    if not batch.count:
+                        return delivered
+                    delivered += batch.count
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=COLLECTORS) as pool:
+            delivered = sum(pool.map(collect, streams))
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(delivered, MESSAGES)
+        self.assertEqual(
+            PixMessage.objects.filter(reserved_by__in=streams, status=PixMessage.MessageStatus.RESERVED).count(),
+            MESSAGES,
+        )
+        return {"messages": delivered, "seconds": round(elapsed, 2), "msgs_per_s": round(delivered / elapsed)}
+
+
+    def test_prefetch_throughput(self):
+        print(f"\nmessages={MESSAGES} collectors={COLLECTORS} limit={LIMIT} prefetch={PREFETCH}")
+        with override_settings(STREAM_PREFETCH_ENABLED=False):
+            print(f"  off: {self._run('off')}")
+        with override_settings(STREAM_PREFETCH_ENABLED=True, STREAM_PREFETCH_MESSAGES=PREFETCH):
+            print(f"  on:  {self._run('on')}")
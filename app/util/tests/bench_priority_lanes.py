@@ -0,0 +1,102 @@
+"""
+Benchmark: latency of HIGH priority messages while one ISPB drains a large
+LOW priority backlog. Not collected by the default test run; execute with
+
+    python manage.py test util.tests.bench_priority_lanes
+
+Tunable through BENCH_BACKLOG (LOW rows seeded, default one million),
+BENCH_LIMIT (messages per claim) and BENCH_SAMPLES (HIGH messages inserted at
+evenly spaced points of the drain). For each sample it reports the claim time
+of the pull that delivered the HIGH message and how many pulls it would have
+waited for if claims still took an ISPB's messages in id order.
+"""
+import os
+import statistics
+import time
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from data.models import PixMessage, PixStream
+from util.ingest import load_pix_rows
+from util.utils import reserve_messages
+
+
+BACKLOG = int(os.environ.get("BENCH_BACKLOG", 1_000_000))
+LIMIT = int(os.environ.get("BENCH_LIMIT", 500))
+SAMPLES = int(os.environ.get("BENCH_SAMPLES", 10))
+
+TABLE = PixMessage._meta.db_table
+
+_SEED_SQL = f"""
+INSERT INTO {TABLE} (
+    end_to_end_id, tx_id, amount, payment_at, free_text,
+    payer_name, payer_cpf_cnpj, payer_ispb, payer_agencia, payer_conta_transacional, payer_tipo_conta,
+    receiver_name, receiver_cpf_cnpj, receiver_ispb, receiver_agencia, receiver_conta_transacional, receiver_tipo_conta,
+    status, priority, created_at
+)
+SELECT
+    'Ebulk' || n, 'tx' || n, 10.00, now(), '',
+    'Tester', '12345678901', '87654321', '0001', '111', 'CACC',
+    'Receiver', '01987654321', %(ispb)s, '0001', '222', 'SVGS',
+    %(pending)s, %(priority)s, now()
+FROM generate_series(1, %(count)s) AS n
+"""
+
+
+class BenchPriorityLanes(TransactionTestCase):
+    def setUp(self) -> None:
+        self.ispb = f"{7:08d}"
+        self.stream = PixStream.objects.create(interation_id="bench-lanes", ispb=self.ispb)
+
+
+    def _insert_high(self, n: int) -> str:
+        end_to_end_id = f"E{self.ispb}high{n}"
+        load_pix_rows(
+            [(0, (
+                end_to_end_id, 10, "Tester", "12345678901", "87654321", "0001", "111", "CACC",
+                "Receiver", "01987654321", self.ispb, "0001", "222", "SVGS", "", f"txhigh{n}", timezone.now(),
+            ))],
+            PixMessage.MessagePriority.HIGH,
+        )
+        return end_to_end_id
+
+
+    def test_high_priority_latency_during_drain(self):
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _SEED_SQL,
+                {
+                    "ispb": self.ispb,
+                    "count": BACKLOG,
+                    "pending": PixMessage.MessageStatus.PENDING,
+                    "priority": PixMessage.MessagePriority.LOW,
+                },
+            )
+            cursor.execute(f"ANALYZE {TABLE}")
+        print(f"\nseeded {BACKLOG} LOW messages in {time.perf_counter() - started:.1f}s; {LIMIT} per claim")
+
+        pulls = -(-BACKLOG // LIMIT)
+        sample_at = {pulls * n // SAMPLES for n in range(SAMPLES)}
+        print(f"{'backlog':>10} {'HIGH claim ms':>14} {'LOW claim ms':>13} {'id-order wait (pulls)':>22}")
+        low_times = []
+        drained = 0
+        for pull in range(pulls + 1):
+            high = self._insert_high(pull) if pull in sample_at else None
+            backlog = BACKLOG - drained
+            claim_started = time.perf_counter()
+            rows = reserve_messages(self.stream, LIMIT)
+            elapsed_ms = (time.perf_counter() - claim_started) * 1000
+            if high is None:
+                low_times.append(elapsed_ms)
+                drained += len(rows)
+                continue
+
+            self.assertEqual(rows[0][0], high)
+            drained += len(rows) - 1
+            recent = statistics.median(low_times[-50:]) if low_times else float("nan")
+            print(f"{backlog:>10} {elapsed_ms:>14.2f} {recent:>13.2f} {-(-backlog // LIMIT) + 1:>22}")
+
+        self.assertEqual(drained, BACKLOG)
@@ -0,0 +1,124 @@
+"""
+Benchmark: database queries made by idle long polls, with every waiter
+re-claiming on its own timer against the per-process wait coordinator, with
+and without LISTEN/NOTIFY. Not collected by the default test run; execute with
+
+    python manage.py test util.tests.bench_wait_coordination
+
+Tunable through BENCH_ISPBS, BENCH_COLLECTORS (per ISPB) and BENCH_IDLE_SECONDS
+(the long-poll timeout, spent idle). After the idle round, one message is
+inserted per ISPB halfway through a second long poll to report how long it
+took to be delivered.
+"""
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.test import Client, TransactionTestCase, override_settings
+
+from data.models import PixStream
+from util import metrics
+from util.notifications import get_listener, stop_listener
+
+
+ISPBS = int(os.environ.get("BENCH_ISPBS", 2))
+COLLECTORS = int(os.environ.get("BENCH_COLLECTORS", 6))
+IDLE_SECONDS = float(os.environ.get("BENCH_IDLE_SECONDS", 8.0))
+
+MODES = {
+    "own timers": {"STREAM_NOTIFICATIONS_ENABLED": False, "STREAM_WAIT_COORDINATION_ENABLED": False},
+    "coordinated": {"STREAM_NOTIFICATIONS_ENABLED": False, "STREAM_WAIT_COORDINATION_ENABLED": True},
+    "coordinated + notify": {"STREAM_NOTIFICATIONS_ENABLED": True, "STREAM_WAIT_COORDINATION_ENABLED": True},
+}
+
+
+def _claims() -> int:
+    return sum(
+        int(sum(values[:-1]))
+        for (name, _), values in metrics._current().histograms.items()
+        if name == "stream_claim_seconds"
+    )
+
+
+class BenchWaitCoordination(TransactionTestCase):
+    def setUp(self) -> None:
+        self.ispbs = [f"{80000000 + n:08d}" for n in range(ISPBS)]
+        self.addCleanup(stop_listener)
+
+
+    def _long_polls(self, streams, on_started=None) -> list:
+        finished = []
+
+        def pull(stream: PixStream) -> None:
+            try:
+                resp = Client().get(f"/api/pix/{stream.ispb}/stream/{stream.interation_id}")
+                finished.append((stream.ispb, resp.status_code, time.monotonic()))
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(streams)) as pool:
+            futures = [pool.submit(pull, stream) for stream in streams]
+            if on_started is not None:
+                on_started()
+            for future in futures:
+                future.result()
+        return finished
+
+
+    def _run(self, mode: str) -> dict:
+        streams = [
+            PixStream.objects.create(interation_id=f"bench-{mode}-{ispb}-{n}", ispb=ispb)
+            for ispb in self.ispbs
+            for n in range(COLLECTORS)
+        ]
+        stop_listener()
+        get_listener()
+        time.sleep(0.2)
+
+        metrics._registry = metrics._Registry()
+        started = time.monotonic()
+        idle = self._long_polls(streams)
+        elapsed = time.monotonic() - started
+        listener = get_listener()
+        probes = listener.probes if listener is not None else 0
+        claims = _claims()
+        self.assertTrue(all(code == 204 for _, code, _ in idle))
+
+        inserted_at = {}
+
+        def insert_later() -> None:
+            time.sleep(IDLE_SECONDS / 2)
+            for ispb in self.ispbs:
+                resp = Client().post(f"/api/util/msgs/{ispb}/1")
+                inserted_at[ispb] = time.monotonic()
+                self.assertEqual(resp.status_code, 201)
+            connection.close()
+
+        inserter = threading.Thread(target=insert_later)
+        delivered = self._long_polls(streams, on_started=inserter.start)
+        inserter.join()
+        latencies = [finished - inserted_at[ispb] for ispb, code, finished in delivered if code == 200]
+
+        PixStream.objects.filter(pk__in=[stream.pk for stream in streams]).update(active=False)
+        return {
+            "claims": claims,
+            "probes": probes,
+            "queries_per_second": (claims + probes) / elapsed,
+            "delivery_ms": statistics.median(latencies) * 1000 if latencies else None,
+        }
+
+
+    def test_idle_queries(self):
+        print(f"\n{ISPBS} ISPBs x {COLLECTORS} collectors idle for {IDLE_SECONDS:.0f}s")
+        print(f"{'mode':>22} {'claims':>8} {'probes':>8} {'queries/s':>10} {'delivery ms':>12}")
+        for mode, overrides in MODES.items():
+            with override_settings(STREAM_LONG_POLLING_TIMEOUT_SECONDS=IDLE_SECONDS, **overrides):
+                result = self._run(mode)
+            delivery = "-" if result["delivery_ms"] is None else f"{result['delivery_ms']:.1f}"
+            print(
+                f"{mode:>22} {result['claims']:>8} {result['probes']:>8}"
+                f" {result['queries_per_second']:>10.1f} {delivery:>12}"
+            )
@@ -0,0 +1,40 @@
+from django.test import TransactionTestCase, override_settings
+
+from data.models import PixMessage, PixStream
+from util.management.commands.bench_stream import run_stream_benchmark
+from util.notifications import stop_listener
+
+
+@override_settings(STREAM_LONG_POLLING_TIMEOUT_SECONDS=0.2)
+class TestStreamBenchmark(TransactionTestCase):
+    def setUp(self) -> None:
+        self.addCleanup(stop_listener)
+
+
+    def test_every_message_is_delivered_once_and_consumed(self):
+        results = run_stream_benchmark(messages=301, ispbs=2, collectors=3, limit=20, timeout=60)
+
+        self.assertEqual(results["delivered"], 301)
+        self.assertEqual(results["duplicates"], 0)
+        self.assertEqual(results["lost"], 0)
+        self.assertEqual(results["consumed"], 301)
+        self.assertEqual(results["rejected_starts"], 0)
+        self.assertGreaterEqual(results["pulls"], 301 // 20)
+        self.assertLessEqual(results["pull_p50_ms"], results["pull_p99_ms"])
+        self.assertFalse(PixStream.objects.filter(active=True).exists())
+
+
+    def test_collectors_beyond_the_limit_are_turned_away(self):
+        results = run_stream_benchmark(messages=50, ispbs=1, collectors=8, limit=10, timeout=60)
+
+        # Up to two, fewer when an early collector is done before the last start.
+        self.assertLessEqual(results["rejected_starts"], 2)
+        self.assertEqual(results["lost"], 0)
+        self.assertEqual(PixMessage.objects.filter(status=PixMessage.MessageStatus.CONSUMED).count(), 50)
+
+
+    def test_single_message_pulls(self):
+        results = run_stream_benchmark(messages=12, ispbs=1, collectors=2, accept="application/msgpack", timeout=60)
+
+        self.assertEqual(results["delivered"], 12)
+        self.assertEqual(results["duplicates"], 0)
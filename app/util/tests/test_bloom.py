@@ -0,0 +1,29 @@
+from django.test import SimpleTestCase
+
+from util.bloom import BloomFilter
+
+
+class TestBloomFilter(SimpleTestCase):
+    def test_added_items_are_always_found(self):
+        bloom = BloomFilter(capacity=10000)
+        items = [f"E12345678{i}" for i in range(10000)]
+        bloom.update(items)
+        self.assertTrue(all(item in bloom for item in items))
+
+
+    def test_false_positive_rate_stays_near_target(self):
+        bloom = BloomFilter(capacity=10000, error_rate=0.01)
+        bloom.update(f"E12345678{i}" for i in range(10000))
+
+        false_positives = sum(f"E87654321{i}" in bloom for i in range(20000))
+        self.assertLess(false_positives / 20000, 0.02)
+
+
+    def test_filter_starts_over_when_full(self):
+        bloom = BloomFilter(capacity=100)
+        bloom.update(f"old{i}" for i in range(100))
+        bloom.add("new")
+
+        self.assertEqual(bloom.count, 1)
+        self.assertIn("new", bloom)
+        self.assertLess(sum(f"old{i}" in bloom for i in range(100)), 10)
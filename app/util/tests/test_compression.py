@@ -0,0 +1,89 @@
+import gzip
+import zlib
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from util.compression import compress_response, negotiate_encoding
+
+
+class TestNegotiateEncoding(SimpleTestCase):
+    def test_q_values_pick_the_preferred_encoding(self):
+        available = ["zstd", "br", "gzip"]
+
+        self.assertEqual(negotiate_encoding("gzip, br", available), "br")
+        self.assertEqual(negotiate_encoding("gzip;q=1.0, br;q=0.5", available), "gzip")
+        self.assertEqual(negotiate_encoding("br;q=0, gzip;q=0.1", available), "gzip")
+        self.assertEqual(negotiate_encoding("deflate", available), None)
+        self.assertEqual(negotiate_encoding("", available), None)
+        self.assertEqual(negotiate_encoding(None, available), None)
+
+
+    def test_wildcard(self):
+        self.assertEqual(negotiate_encoding("*", ["gzip"]), "gzip")
+        self.assertEqual(negotiate_encoding("*, gzip;q=0", ["br", "gzip"]), "br")
+        self.assertEqual(negotiate_encoding("identity, *;q=0", ["gzip"]), None)
+
+
+    def test_malformed_weights_disable_the_encoding(self):
+        self.assertEqual(negotiate_encoding("gzip;q=high", ["gzip"]), None)
+
+
+class TestCompressResponse(SimpleTestCase):
+    def setUp(self) -> None:
+        self.request = RequestFactory().get("/", headers={"accept-encoding": "gzip"})
+
+
+    @override_settings(STREAM_COMPRESSION_MIN_BYTES=1024)
+    def test_small_bodies_are_left_alone(self):
+        resp = compress_response(self.request, HttpResponse(b"[]"))
+
+        self.assertEqual(resp.content, b"[]")
+        self.assertFalse(resp.has_header("Content-Encoding"))
+        self.assertEqual(resp["Vary"], "Accept-Encoding")
+
+
+    @override_settings(STREAM_COMPRESSION_MIN_BYTES=1024)
+    def test_large_bodies_are_compressed(self):
+        body = b'{"endToEndId": "E1"},' * 100
+
+        resp = compress_response(self.request, HttpResponse(body))
+
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertEqual(int(resp["Content-Length"]), len(resp.content))
+        self.assertEqual(gzip.decompress(resp.content), body)
+
+
+    def test_each_streamed_chunk_is_flushed(self):
+        chunks = [b'[{"a": 1}', b', {"a": 2}', b"]"]
+        pieces = []
+
+        def produce():
+            for chunk in chunks:
+                pieces.append(chunk)
+                yield chunk
+
+        resp = compress_response(self.request, StreamingHttpResponse(produce()))
+        decoder = zlib.decompressobj(31)
+        received, decoded = [], b""
+        for compressed in resp.streaming_content:
+            received.append(compressed)
+            decoded += decoder.decompress(compressed)
+            # Everything produced so far can be decoded from what was sent.
+            self.assertEqual(decoded, b"".join(pieces))
+
+        self.assertEqual(gzip.decompress(b"".join(received)), b"".join(chunks))
+
+
+    @override_settings(STREAM_COMPRESSION_ENABLED=False)
+    def test_disabled(self):
+        resp = compress_response(self.request, HttpResponse(b"x" * 4096))
+
+        self.assertEqual(resp.content, b"x" * 4096)
+        self.assertFalse(resp.has_header("Vary"))
+
+
+    def test_error_responses_are_not_compressed(self):
+        resp = compress_response(self.request, HttpResponse(b"x" * 4096, status=400))
+
+        self.assertFalse(resp.has_header("Content-Encoding"))
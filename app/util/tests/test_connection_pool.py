@@ -0,0 +1,161 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.db import OperationalError, connection, connections
+from django.test import AsyncRequestFactory, TransactionTestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.views import astream_continue_or_delete
+from beeteller.pooled_postgresql.base import close_pools, pool_stats
+from data.models import PixStream
+from util.notifications import stop_listener
+
+
+def _backends() -> int:
+    # Counted from outside the pool, so the probe itself holds no pooled slot.
+    probe = psycopg2.connect(**connection.get_connection_params(), application_name="pool-probe")
+    try:
+        with probe.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_stat_activity"
+                " WHERE datname = current_database() AND application_name <> 'pool-probe'"
+            )
+            return cursor.fetchone()[0]
+    finally:
+        probe.close()
+
+
+@override_settings(
+    DB_POOL_MAX_SIZE=3,
+    DB_POOL_TIMEOUT_SECONDS=1.5,
+    STREAM_NOTIFICATIONS_ENABLED=False,
+    STREAM_WAIT_COORDINATION_ENABLED=False,
+    STREAM_POLL_INTERVAL_SECONDS=0.05,
+    STREAM_LONG_POLLING_TIMEOUT_SECONDS=1.0,
+)
+class TestConnectionPool(TransactionTestCase):
+    def setUp(self) -> None:
+        self.assertTrue(getattr(connection, "pooled", False), "tests expect DB_POOL_ENABLED")
+        connection.close()
+        close_pools()
+        # The wait coordinator's own connection is not pooled.
+        self.addCleanup(stop_listener)
+
+
+    def test_idle_long_polls_share_a_capped_pool(self):
+        ispbs = ["12345678", "87654321"]
+        streams = [
+            PixStream.objects.create(interation_id=f"idle-{ispb}-{n}", ispb=ispb) for ispb in ispbs for n in range(6)
+        ]
+        connection.close()
+        peak = [0]
+        polling = threading.Event()
+
+        def sample():
+            while not polling.wait(0.05):
+                peak[0] = max(peak[0], _backends())
+
+        def poll(stream: PixStream) -> int:
+            try:
+                resp = APIClient().get(
+                    f"/api/pix/{stream.ispb}/stream/{stream.interation_id}", HTTP_ACCEPT="application/json"
+                )
+                return resp.status_code
+            finally:
+                connection.close()
+
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+        try:
+            with ThreadPoolExecutor(max_workers=len(streams)) as pool:
+                codes = list(pool.map(poll, streams))
+        finally:
+            polling.set()
+            sampler.join()
+
+        # Twelve collectors waited a full second each on at most three sessions;
+        # holding them through the wait would time the later ones out.
+        self.assertEqual(codes, [status.HTTP_204_NO_CONTENT] * len(streams))
+        self.assertLessEqual(peak[0], 3)
+        self.assertLessEqual(max(stats["opened"] for stats in pool_stats()), 3)
+
+
+    # Waits outlast DB_POOL_TIMEOUT_SECONDS, so a held connection fails the later polls.
+    @override_settings(STREAM_LONG_POLLING_TIMEOUT_SECONDS=2.0)
+    def test_idle_async_long_polls_share_a_capped_pool(self):
+        streams = [PixStream.objects.create(interation_id=f"async-idle-{n}", ispb="12345678") for n in range(6)]
+        connection.close()
+        factory = AsyncRequestFactory()
+
+        async def poll(stream: PixStream) -> int:
+            # As under ASGI: every request runs its sync calls on its own thread.
+            async with ThreadSensitiveContext():
+                try:
+                    request = factory.get(
+                        f"/api/pix/{stream.ispb}/stream/{stream.interation_id}", HTTP_ACCEPT="application/json"
+                    )
+                    resp = await astream_continue_or_delete(request, stream.ispb, stream.interation_id)
+                    return resp.status_code
+                finally:
+                    await sync_to_async(connections.close_all)()
+
+        async def poll_all() -> list:
+            return await asyncio.gather(*(poll(stream) for stream in streams))
+
+        self.assertEqual(asyncio.run(poll_all()), [status.HTTP_204_NO_CONTENT] * len(streams))
+        self.assertLessEqual(max(stats["opened"] for stats in pool_stats()), 3)
+
+
+    @override_settings(DB_POOL_MAX_SIZE=1, DB_POOL_TIMEOUT_SECONDS=0.2)
+    def test_exhausted_pool_times_out(self):
+        PixStream.objects.exists()
+
+        def other_thread():
+            try:
+                PixStream.objects.exists()
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            with self.assertRaises(OperationalError):
+                pool.submit(other_thread).result()
+
+
+    def test_connections_are_reused(self):
+        PixStream.objects.exists()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            first = cursor.fetchone()[0]
+        connection.close()
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            self.assertEqual(cursor.fetchone()[0], first)
+
+
+    @override_settings(DB_POOL_CHECK_SECONDS=0.0)
+    def test_dead_connections_are_replaced(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            dead = cursor.fetchone()[0]
+        connection.close()
+        killer = psycopg2.connect(**connection.get_connection_params())
+        with killer.cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(%s)", [dead])
+        killer.close()
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            self.assertNotEqual(cursor.fetchone()[0], dead)
+
+
+    def test_open_transactions_are_rolled_back_on_return(self):
+        connection.set_autocommit(False)
+        PixStream.objects.create(interation_id="uncommitted", ispb="12345678")
+        connection.close()
+
+        self.assertFalse(PixStream.objects.filter(interation_id="uncommitted").exists())
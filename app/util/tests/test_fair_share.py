@@ -0,0 +1,142 @@
+import statistics
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from data.models import PixMessage, PixStream
+from util.utils import reserve_messages, touch_stream
+
+
+class TestFairShare(TestCase):
+    """
+    Deterministic simulation of six collectors of one ISPB: every round a
+    burst of messages arrives and the collectors pull in a fixed order, so
+    the first ones always win the race, as the fastest clients would.
+    """
+
+    COLLECTORS = 6
+    ROUNDS = 12
+    BURST = 24
+    LIMIT = 10
+
+    def setUp(self) -> None:
+        self.ispb = "12345678"
+        self.sent = 0
+
+
+    def _send(self, count: int) -> None:
+        now = timezone.now()
+        PixMessage.objects.bulk_create(
+            PixMessage(
+                end_to_end_id=f"E{self.ispb}{self.sent + n}",
+                tx_id=f"tx{self.sent + n}",
+                amount=Decimal("10.00"),
+                payment_at=now,
+                free_text="",
+                payer_name="Tester",
+                payer_cpf_cnpj="12345678901",
+                payer_ispb="87654321",
+                payer_agencia="0001",
+                payer_conta_transacional="111",
+                payer_tipo_conta="CACC",
+                receiver_name="Receiver",
+                receiver_cpf_cnpj="01987654321",
+                receiver_ispb=self.ispb,
+                receiver_agencia="0001",
+                receiver_conta_transacional="222",
+                receiver_tipo_conta="SVGS",
+            )
+            for n in range(count)
+        )
+        self.sent += count
+
+
+    def _simulate(self, label: str) -> dict:
+        streams = [
+            PixStream.objects.create(interation_id=f"{label}{n}", ispb=self.ispb) for n in range(self.COLLECTORS)
+        ]
+        delivered = [0] * self.COLLECTORS
+        empty_pulls = 0
+        for _ in range(self.ROUNDS):
+            self._send(self.BURST)
+            for stream in streams:
+                touch_stream(stream)  # every collector is in its long poll
+            for n, stream in enumerate(streams):
+                count = len(reserve_messages(stream, self.LIMIT))
+                delivered[n] += count
+                empty_pulls += not count
+        for stream in streams:
+            stream.active = False
+            stream.save(update_fields=["active"])
+        return {
+            "delivered": delivered,
+            "variance": statistics.pvariance(delivered),
+            "cv": statistics.pstdev(delivered) / statistics.mean(delivered),
+            "empty_pulls": empty_pulls,
+        }
+
+
+    def test_fair_share_evens_out_collectors(self):
+        with override_settings(STREAM_FAIR_SHARE_ENABLED=False):
+            racing = self._simulate("race")
+        with override_settings(STREAM_FAIR_SHARE_ENABLED=True):
+            fair = self._simulate("fair")
+
+        self.assertEqual(racing["empty_pulls"], 3 * self.ROUNDS)
+        self.assertEqual(fair["empty_pulls"], 0)
+        self.assertGreater(racing["cv"], 0.8)
+        self.assertLess(fair["cv"], 0.1)
+        self.assertLess(fair["variance"], racing["variance"] / 100)
+        # Fairness must not starve the ISPB: the backlog is still drained.
+        self.assertGreaterEqual(sum(fair["delivered"]), 0.9 * sum(racing["delivered"]))
+
+
+    def test_lone_collector_gets_full_batches(self):
+        self._send(30)
+        stream = PixStream.objects.create(interation_id="lone", ispb=self.ispb)
+
+        self.assertEqual(len(reserve_messages(stream, self.LIMIT)), self.LIMIT)
+
+
+    def test_share_is_at_least_one_message(self):
+        self._send(1)
+        streams = [PixStream.objects.create(interation_id=f"s{n}", ispb=self.ispb) for n in range(3)]
+
+        self.assertEqual(len(reserve_messages(streams[0], self.LIMIT)), 1)
+
+
+    def test_prefetch_streams_do_not_dilute_the_share(self):
+        self._send(20)
+        stream = PixStream.objects.create(interation_id="real", ispb=self.ispb)
+        PixStream.objects.create(interation_id="prefetch", ispb=self.ispb, is_prefetch=True)
+
+        self.assertEqual(len(reserve_messages(stream, 20)), 20)
+
+
+    def test_lone_drainer_among_idle_collectors_gets_full_batches(self):
+        self._send(600)
+        drainer, *idle = [PixStream.objects.create(interation_id=f"d{n}", ispb=self.ispb) for n in range(6)]
+        for stream in idle:
+            touch_stream(stream)
+        PixStream.objects.filter(pk__in=[stream.pk for stream in idle]).update(
+            last_pull_at=timezone.now() - timedelta(minutes=1)
+        )
+
+        batches = []
+        for _ in range(12):
+            touch_stream(drainer)
+            batches.append(len(reserve_messages(drainer, 50)))
+        self.assertEqual(batches, [50] * 12)
+
+
+    def test_backlog_the_others_cannot_take_is_not_held_back(self):
+        self._send(400)
+        streams = [PixStream.objects.create(interation_id=f"b{n}", ispb=self.ispb) for n in range(4)]
+        for stream in streams:
+            touch_stream(stream)
+
+        # The others, pulling now too, could take 3 x 50 at most.
+        batches = [len(reserve_messages(streams[0], 50)) for _ in range(5)]
+        self.assertEqual(batches, [50] * 5)
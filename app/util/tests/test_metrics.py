@@ -0,0 +1,188 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from data.models import PixMessage, PixStream
+from util import metrics
+from util.metrics import flush_metrics, increment_counter, observe_histogram
+
+
+def _record_in_child() -> None:
+    increment_counter("stream_messages_reserved_total", 5, ispb="12345678")
+    flush_metrics()
+
+
+@override_settings(STREAM_LONG_POLLING_TIMEOUT_SECONDS=0.0)
+class TestMetrics(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.ispb = "12345678"
+        self.directory = directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(METRICS_DIR=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        metrics._registry = metrics._Registry()
+
+
+    def _create_message(self, suffix: str) -> PixMessage:
+        return PixMessage.objects.create(
+            end_to_end_id=f"E{self.ispb}{suffix}",
+            tx_id=f"tx{suffix}",
+            amount=Decimal("10.00"),
+            payment_at=timezone.now(),
+            free_text="",
+            payer_name="Tester",
+            payer_cpf_cnpj="12345678901",
+            payer_ispb="87654321",
+            payer_agencia="0001",
+            payer_conta_transacional="111",
+            payer_tipo_conta="CACC",
+            receiver_name="Receiver",
+            receiver_cpf_cnpj="01987654321",
+            receiver_ispb=self.ispb,
+            receiver_agencia="0001",
+            receiver_conta_transacional="222",
+            receiver_tipo_conta="SVGS",
+        )
+
+
+    def _scrape(self) -> dict:
+        resp = self.client.get("/metrics")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp["Content-Type"].startswith("text/plain"))
+        samples = {}
+        for line in resp.content.decode().splitlines():
+            if line and not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+        return samples
+
+
+    def test_pulls_are_counted(self):
+        for i in range(3):
+            self._create_message(str(i))
+        stream = PixStream.objects.create(interation_id="counted", ispb=self.ispb)
+        url = f"/api/pix/{self.ispb}/stream/{stream.interation_id}"
+
+        first = self.client.get(f"{url}?limit=2", HTTP_ACCEPT="multipart/json")
+        self.client.post(f"{url}/ack", {"batch": first["Pull-Batch"]}, format="json")
+        self.client.get(url, HTTP_ACCEPT="application/json")
+        self.client.get(url, HTTP_ACCEPT="application/json")
+        before_delete = self._scrape()
+        self.client.delete(url)
+        samples = self._scrape()
+
+        self.assertEqual(samples[f'stream_messages_reserved_total{{ispb="{self.ispb}"}}'], 3)
+        self.assertEqual(samples[f'stream_messages_consumed_total{{ispb="{self.ispb}"}}'], 3)
+        self.assertEqual(samples["stream_pulls_total"], 3)
+        self.assertEqual(samples["stream_empty_pulls_total"], 1)
+        self.assertAlmostEqual(samples["stream_empty_pull_ratio"], 1 / 3)
+        self.assertEqual(samples["stream_claim_seconds_count"], 3)
+        self.assertEqual(samples['stream_poll_iterations_bucket{le="1"}'], 3)
+        self.assertEqual(samples['stream_serialize_seconds_count{mode="buffered"}'], 2)
+        self.assertEqual(before_delete[f'stream_active{{ispb="{self.ispb}"}}'], 1)
+        self.assertNotIn(f'stream_active{{ispb="{self.ispb}"}}', samples)
+
+
+    def test_histogram_buckets_are_cumulative(self):
+        for value in (0.0002, 0.003, 0.003, 30.0):
+            observe_histogram("stream_claim_seconds", value)
+
+        samples = self._scrape()
+
+        self.assertEqual(samples['stream_claim_seconds_bucket{le="0.0005"}'], 1)
+        self.assertEqual(samples['stream_claim_seconds_bucket{le="0.005"}'], 3)
+        self.assertEqual(samples['stream_claim_seconds_bucket{le="10.0"}'], 3)
+        self.assertEqual(samples['stream_claim_seconds_bucket{le="+Inf"}'], 4)
+        self.assertEqual(samples["stream_claim_seconds_count"], 4)
+        self.assertAlmostEqual(samples["stream_claim_seconds_sum"], 30.0062)
+
+
+    def test_processes_are_summed(self):
+        increment_counter("stream_messages_reserved_total", 2, ispb=self.ispb)
+        child = multiprocessing.get_context("fork").Process(target=_record_in_child)
+        child.start()
+        child.join()
+
+        samples = self._scrape()
+
+        # The forked child reports only what it recorded itself.
+        self.assertEqual(samples[f'stream_messages_reserved_total{{ispb="{self.ispb}"}}'], 7)
+
+
+    def test_exited_processes_are_folded_in_once(self):
+        increment_counter("stream_messages_reserved_total", 2, ispb=self.ispb)
+        for _ in range(2):
+            child = multiprocessing.get_context("fork").Process(target=_record_in_child)
+            child.start()
+            child.join()
+
+        first = self._scrape()
+        second = self._scrape()
+
+        key = f'stream_messages_reserved_total{{ispb="{self.ispb}"}}'
+        self.assertEqual(first[key], 12)
+        self.assertEqual(second[key], 12)
+        # Only this process's snapshot is left next to the retired totals.
+        snapshots = sorted(name for name in os.listdir(self.directory) if name.endswith(".json"))
+        self.assertEqual(snapshots, [f"{os.getpid()}-{metrics._registry.started}.json", "retired.json"])
+
+
+    def test_reused_pid_does_not_overwrite_the_previous_totals(self):
+        # Left by an earlier process that had this process's PID.
+        with open(os.path.join(self.directory, f"{os.getpid()}-1.json"), "w") as snapshot:
+            json.dump({"counters": [["stream_pulls_total", [], 4]], "histograms": []}, snapshot)
+        increment_counter("stream_pulls_total")
+
+        samples = self._scrape()
+
+        self.assertEqual(samples["stream_pulls_total"], 5)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, f"{os.getpid()}-1.json")))
+
+
+    def test_concurrent_flushes_do_not_collide(self):
+        increment_counter("stream_messages_reserved_total", 3, ispb=self.ispb)
+        errors = []
+
+        def flush_repeatedly():
+            try:
+                for _ in range(50):
+                    flush_metrics()
+            except OSError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=flush_repeatedly) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual([name for name in os.listdir(self.directory) if name.endswith(".tmp")], [])
+        self.assertEqual(self._scrape()[f'stream_messages_reserved_total{{ispb="{self.ispb}"}}'], 3)
+
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled_metrics_record_nothing(self):
+        increment_counter("stream_pulls_total")
+        observe_histogram("stream_claim_seconds", 0.1)
+
+        samples = self._scrape()
+
+        self.assertNotIn("stream_pulls_total", samples)
+        self.assertNotIn("stream_claim_seconds_count", samples)
+
+
+    def test_post_metrics_not_allowed(self):
+        resp = self.client.post("/metrics", data={})
+        self.assertEqual(resp.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
@@ -0,0 +1,171 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from data.models import PixMessage, PixMessageKey, PixQueueHorizon, PixStream
+from util.partitions import (
+    DEFAULT_PARTITION,
+    advance_queue_horizon,
+    create_partition,
+    day_start,
+    ensure_partitions,
+    expire_partitions,
+    list_partitions,
+    partition_name,
+    reset_queue_horizon_cache,
+)
+from util.utils import _CLAIM_SQL, _claim_params, reserve_messages
+
+
+class TestMessagePartitions(TestCase):
+    def setUp(self) -> None:
+        self.ispb = "12345678"
+        self.today = timezone.now().date()
+        reset_queue_horizon_cache()
+        self.addCleanup(reset_queue_horizon_cache)
+
+
+    def _create_message(self, suffix: str, days_ago: int = 0, **overrides) -> PixMessage:
+        fields = dict(
+            end_to_end_id=f"E{self.ispb}{suffix}",
+            tx_id=f"tx{suffix}",
+            amount=Decimal("10.00"),
+            payment_at=timezone.now(),
+            free_text="",
+            payer_name="Tester",
+            payer_cpf_cnpj="12345678901",
+            payer_ispb="87654321",
+            payer_agencia="0001",
+            payer_conta_transacional="111",
+            payer_tipo_conta="CACC",
+            receiver_name="Receiver",
+            receiver_cpf_cnpj="01987654321",
+            receiver_ispb=self.ispb,
+            receiver_agencia="0001",
+            receiver_conta_transacional="222",
+            receiver_tipo_conta="SVGS",
+        )
+        fields.update(overrides)
+        message = PixMessage.objects.create(**fields)
+        if days_ago:
+            # Updating the partition key moves the row to the matching partition.
+            PixMessage.objects.filter(pk=message.pk).update(
+                created_at=message.created_at - timedelta(days=days_ago)
+            )
+        return message
+
+
+    def _partition_of(self, message: PixMessage) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT tableoid::regclass::text FROM {PixMessage._meta.db_table} WHERE id = %s", [message.pk]
+            )
+            return cursor.fetchone()[0]
+
+
+    def _explain_claim(self, stream: PixStream) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN " + _CLAIM_SQL, _claim_params(stream, 10, None, timezone.now()))
+            return "\n".join(row[0] for row in cursor.fetchall())
+
+
+    def test_ensure_partitions_creates_days_ahead_and_moves_default_rows(self):
+        message = self._create_message("m1")
+        self.assertEqual(self._partition_of(message), DEFAULT_PARTITION)
+
+        created = ensure_partitions(ahead_days=2, today=self.today)
+
+        self.assertEqual(created, [partition_name(self.today + timedelta(days=n)) for n in range(3)])
+        self.assertEqual(self._partition_of(message), partition_name(self.today))
+        self.assertEqual(ensure_partitions(ahead_days=2, today=self.today), [])
+
+
+    def test_end_to_end_id_is_unique_across_partitions(self):
+        create_partition(self.today - timedelta(days=1))
+        self._create_message("dup", days_ago=1)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self._create_message("dup")
+        self.assertEqual(PixMessageKey.objects.filter(end_to_end_id=f"E{self.ispb}dup").count(), 1)
+
+
+    def test_claim_plan_prunes_partitions_behind_horizon(self):
+        for days_ago in range(4):
+            create_partition(self.today - timedelta(days=days_ago))
+        stream = PixStream.objects.create(interation_id="prune", ispb=self.ispb)
+
+        plan = self._explain_claim(stream)
+        self.assertIn(partition_name(self.today - timedelta(days=3)), plan)
+
+        PixQueueHorizon.objects.create(pk=1, created_after=day_start(self.today - timedelta(days=1)))
+        reset_queue_horizon_cache()
+        plan = self._explain_claim(stream)
+
+        self.assertIn(partition_name(self.today), plan)
+        self.assertIn(partition_name(self.today - timedelta(days=1)), plan)
+        self.assertNotIn(partition_name(self.today - timedelta(days=2)), plan)
+        self.assertNotIn(partition_name(self.today - timedelta(days=3)), plan)
+
+
+    def test_claim_after_horizon_advance_still_reserves_pending(self):
+        for days_ago in range(3):
+            create_partition(self.today - timedelta(days=days_ago))
+        self._create_message("old", days_ago=2, status=PixMessage.MessageStatus.CONSUMED)
+        self._create_message("late", days_ago=1)
+        self._create_message("new")
+        stream = PixStream.objects.create(interation_id="horizon", ispb=self.ispb)
+
+        horizon = advance_queue_horizon()
+        self.assertEqual(horizon, day_start(self.today - timedelta(days=1)))
+
+        rows = reserve_messages(stream, 10)
+        self.assertEqual([row[0] for row in rows], [f"E{self.ispb}late", f"E{self.ispb}new"])
+
+
+    def test_expire_detaches_old_partitions_but_keeps_unfinished_ones(self):
+        for days_ago in (10, 11, 12):
+            create_partition(self.today - timedelta(days=days_ago))
+        self._create_message("done", days_ago=12, status=PixMessage.MessageStatus.CONSUMED)
+        self._create_message("waiting", days_ago=11)
+
+        expired, kept = expire_partitions(retention_days=10, today=self.today)
+
+        self.assertEqual(expired, [partition_name(self.today - timedelta(days=12))])
+        self.assertEqual(kept, [partition_name(self.today - timedelta(days=11))])
+        remaining = [name for name, _ in list_partitions()]
+        self.assertNotIn(partition_name(self.today - timedelta(days=12)), remaining)
+        self.assertIn(partition_name(self.today - timedelta(days=10)), remaining)
+        self.assertFalse(PixMessage.objects.filter(end_to_end_id=f"E{self.ispb}done").exists())
+        self.assertTrue(PixMessageKey.objects.filter(end_to_end_id=f"E{self.ispb}done").exists())
+
+
+    def test_expire_with_drop_removes_partition_and_keys(self):
+        day = self.today - timedelta(days=30)
+        create_partition(day)
+        self._create_message("gone", days_ago=30, status=PixMessage.MessageStatus.CONSUMED)
+        # Flush the deferred foreign key checks queued by this test's own
+        # transaction; a DROP TABLE refuses to run with pending trigger events.
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        expired, _ = expire_partitions(retention_days=10, drop=True, today=self.today)
+
+        self.assertEqual(expired, [partition_name(day)])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", [partition_name(day)])
+            self.assertIsNone(cursor.fetchone()[0])
+        self.assertFalse(PixMessageKey.objects.filter(end_to_end_id=f"E{self.ispb}gone").exists())
+
+
+    def test_command_creates_partitions_and_sets_horizon(self):
+        out = StringIO()
+        call_command("partition_messages", ahead=1, retention=30, stdout=out)
+
+        self.assertIn(f"created {partition_name(self.today)}", out.getvalue())
+        self.assertIn("queue horizon", out.getvalue())
+        self.assertTrue(PixQueueHorizon.objects.filter(pk=1).exists())
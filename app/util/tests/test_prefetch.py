@@ -0,0 +1,161 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from data.models import PixMessage, PixStream
+from util.partitions import queue_horizon
+from util.prefetch import prefetch_buffer, release_prefetched, take_prefetched
+from util.utils import admit_stream, claim_pull_batch, consume_and_close_stream, expire_idle_streams, reserve_messages
+
+
+@override_settings(STREAM_PREFETCH_ENABLED=True, STREAM_PREFETCH_MESSAGES=10, STREAM_PREFETCH_LEASE_SECONDS=30)
+class TestPrefetch(TestCase):
+    def setUp(self) -> None:
+        self.ispb = "12345678"
+        self.first = PixStream.objects.create(interation_id="first", ispb=self.ispb)
+        self.second = PixStream.objects.create(interation_id="second", ispb=self.ispb)
+        self.addCleanup(release_prefetched)
+
+
+    def _create_message(self, suffix: str, priority: int = PixMessage.MessagePriority.NORMAL) -> PixMessage:
+        return PixMessage.objects.create(
+            end_to_end_id=f"E{self.ispb}{suffix}",
+            tx_id=f"tx{suffix}",
+            amount=Decimal("10.00"),
+            payment_at=timezone.now(),
+            free_text="",
+            payer_name="Tester",
+            payer_cpf_cnpj="12345678901",
+            payer_ispb="87654321",
+            payer_agencia="0001",
+            payer_conta_transacional="111",
+            payer_tipo_conta="CACC",
+            receiver_name="Receiver",
+            receiver_cpf_cnpj="01987654321",
+            receiver_ispb=self.ispb,
+            receiver_agencia="0001",
+            receiver_conta_transacional="222",
+            receiver_tipo_conta="SVGS",
+            priority=priority,
+        )
+
+
+    def _ids(self, rows) -> list:
+        return [row[0] for row in rows]
+
+
+    def _prefetch_stream(self) -> PixStream:
+        return PixStream.objects.get(ispb=self.ispb, is_prefetch=True, active=True)
+
+
+    def test_pulls_are_served_from_one_prefetch_claim(self):
+        created = [self._create_message(f"{i:02d}") for i in range(20)]
+
+        first = claim_pull_batch(self.first, 3, streamed=False)
+        queue_horizon()
+        with self.assertNumQueries(1):
+            second = claim_pull_batch(self.second, 3, streamed=False)
+
+        self.assertEqual(self._ids(first.rows), [m.end_to_end_id for m in created[:3]])
+        self.assertEqual(self._ids(second.rows), [m.end_to_end_id for m in created[3:6]])
+        self.assertEqual(PixMessage.objects.filter(reserved_by=self.first).count(), 3)
+        self.assertEqual(PixMessage.objects.filter(reserved_by=self.second).count(), 3)
+        self.assertEqual(PixMessage.objects.filter(reserved_by=self._prefetch_stream()).count(), 4)
+        self.assertEqual(PixMessage.objects.filter(status=PixMessage.MessageStatus.PENDING).count(), 10)
+
+
+    def test_delete_consumes_only_what_the_stream_was_handed(self):
+        for i in range(6):
+            self._create_message(str(i))
+        handed = take_prefetched(self.first, 2)
+
+        consume_and_close_stream(self.first)
+
+        consumed = PixMessage.objects.filter(status=PixMessage.MessageStatus.CONSUMED)
+        self.assertEqual(sorted(consumed.values_list("end_to_end_id", flat=True)), self._ids(handed))
+        self.assertEqual(PixMessage.objects.filter(status=PixMessage.MessageStatus.RESERVED).count(), 4)
+
+
+    def test_byte_budget_is_honoured(self):
+        for i in range(5):
+            self._create_message(str(i))
+        self.assertEqual(len(take_prefetched(self.first, 10, max_bytes=1)), 1)
+
+
+    def test_closed_stream_gets_nothing_and_buffer_is_kept(self):
+        for i in range(4):
+            self._create_message(str(i))
+        take_prefetched(self.second, 1)
+        self.first.active = False
+        self.first.save(update_fields=["active"])
+
+        self.assertIsNone(take_prefetched(self.first, 2))
+        self.assertEqual(self._ids(take_prefetched(self.second, 3)), [f"E{self.ispb}{i}" for i in (1, 2, 3)])
+
+
+    def test_release_returns_unserved_messages_to_pending(self):
+        for i in range(5):
+            self._create_message(str(i))
+        take_prefetched(self.first, 2)
+        prefetch = self._prefetch_stream()
+
+        self.assertEqual(release_prefetched(), 3)
+
+        self.assertFalse(PixStream.objects.get(pk=prefetch.pk).active)
+        self.assertEqual(PixMessage.objects.filter(status=PixMessage.MessageStatus.PENDING).count(), 3)
+        self.assertEqual(PixMessage.objects.filter(reserved_by=self.first).count(), 2)
+
+
+    def test_expired_buffer_is_released_before_the_next_handout(self):
+        for i in range(5):
+            self._create_message(str(i))
+        take_prefetched(self.first, 1)
+        old = self._prefetch_stream()
+        prefetch_buffer(self.ispb).filled_at -= 60
+
+        take_prefetched(self.second, 1)
+
+        self.assertFalse(PixStream.objects.get(pk=old.pk).active)
+        self.assertEqual(PixMessage.objects.filter(reserved_by=self._prefetch_stream()).count(), 3)
+
+
+    @override_settings(STREAM_FAIR_SHARE_ENABLED=False)
+    def test_reaped_prefetch_is_never_handed_out_twice(self):
+        for i in range(4):
+            self._create_message(str(i))
+        take_prefetched(self.first, 1)
+        prefetch = self._prefetch_stream()
+        PixStream.objects.filter(pk=prefetch.pk).update(last_pull_at=timezone.now() - timedelta(hours=1))
+        expire_idle_streams(self.ispb)
+        direct = reserve_messages(self.second, 10)
+
+        late = take_prefetched(self.first, 10)
+
+        self.assertEqual(self._ids(direct), [f"E{self.ispb}{i}" for i in (1, 2, 3)])
+        self.assertEqual(late, [])
+        self.assertEqual(PixMessage.objects.filter(reserved_by=self.first).count(), 1)
+
+
+    @override_settings(STREAM_MAX_COLLECTORS_PER_ISPB=3)
+    def test_prefetch_stream_is_not_a_collector(self):
+        self._create_message("1")
+        take_prefetched(self.first, 1)
+
+        self.assertIsNotNone(admit_stream(self.ispb))
+        resp = APIClient().get(f"/api/pix/{self.ispb}/stream/{self._prefetch_stream().interation_id}")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+
+    def test_buffer_hands_out_higher_lanes_first(self):
+        low = [self._create_message(f"low{i}", priority=PixMessage.MessagePriority.LOW) for i in range(3)]
+        high = [self._create_message(f"high{i}", priority=PixMessage.MessagePriority.HIGH) for i in range(2)]
+
+        first = claim_pull_batch(self.first, 3, streamed=False)
+        second = claim_pull_batch(self.second, 3, streamed=False)
+
+        self.assertEqual(self._ids(first.rows), [m.end_to_end_id for m in high + low[:1]])
+        self.assertEqual(self._ids(second.rows), [m.end_to_end_id for m in low[1:]])
@@ -0,0 +1,129 @@
+from decimal import Decimal
+from io import StringIO
+
+import psycopg2
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from data.models import PixMessage, PixStream
+from util.finalize import consume_reserved_chunk, wait_for_finalizers
+from util.utils import consume_and_close_stream, expire_idle_streams, reserve_messages
+
+
+def _create_message(ispb: str, suffix: str) -> PixMessage:
+    return PixMessage.objects.create(
+        end_to_end_id=f"E{ispb}{suffix}",
+        tx_id=f"tx{suffix}",
+        amount=Decimal("10.00"),
+        payment_at=timezone.now(),
+        free_text="",
+        payer_name="Tester",
+        payer_cpf_cnpj="12345678901",
+        payer_ispb="87654321",
+        payer_agencia="0001",
+        payer_conta_transacional="111",
+        payer_tipo_conta="CACC",
+        receiver_name="Receiver",
+        receiver_cpf_cnpj="01987654321",
+        receiver_ispb=ispb,
+        receiver_agencia="0001",
+        receiver_conta_transacional="222",
+        receiver_tipo_conta="SVGS",
+    )
+
+
+@override_settings(STREAM_CONSUME_CHUNK_SIZE=3)
+class TestChunkedConsume(TestCase):
+    def setUp(self) -> None:
+        self.ispb = "12345678"
+        self.stream = PixStream.objects.create(interation_id="finalize", ispb=self.ispb)
+        for i in range(10):
+            _create_message(self.ispb, f"{i:02d}")
+        reserve_messages(self.stream, 10)
+
+
+    def _count(self, state: str) -> int:
+        return PixMessage.objects.filter(reserved_by=self.stream, status=state).count()
+
+
+    def test_delete_consumes_in_bounded_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            consume_and_close_stream(self.stream)
+
+        chunks = [query for query in queries.captured_queries if "LIMIT 3" in query["sql"]]
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(self._count(PixMessage.MessageStatus.CONSUMED), 10)
+        self.stream.refresh_from_db()
+        self.assertFalse(self.stream.active)
+        self.assertFalse(self.stream.consume_pending)
+
+
+    def test_interrupted_consume_is_resumed_by_the_command(self):
+        # What a DELETE leaves behind when its process stops after one chunk.
+        PixStream.objects.filter(pk=self.stream.pk).update(active=False, consume_pending=True)
+        self.assertEqual(consume_reserved_chunk(self.stream), (3, False))
+
+        out = StringIO()
+        call_command("finalize_streams", stdout=out)
+
+        self.assertEqual(out.getvalue().strip(), "finalized 1 streams, consumed 7 messages")
+        self.assertEqual(self._count(PixMessage.MessageStatus.CONSUMED), 10)
+        self.stream.refresh_from_db()
+        self.assertFalse(self.stream.consume_pending)
+
+
+    @override_settings(STREAM_LEASE_TIMEOUT_SECONDS=0)
+    def test_unfinished_reservation_is_never_handed_out_again(self):
+        PixStream.objects.filter(pk=self.stream.pk).update(active=False, consume_pending=True)
+
+        # The reaper only releases the reservations of streams it closes itself.
+        expire_idle_streams()
+        late = PixStream.objects.create(interation_id="late", ispb=self.ispb)
+        self.assertEqual(reserve_messages(late, 10), [])
+        self.assertEqual(self._count(PixMessage.MessageStatus.RESERVED), 10)
+
+
+@override_settings(STREAM_CONSUME_ASYNC=True, STREAM_CONSUME_CHUNK_SIZE=2)
+class TestAsyncConsume(TransactionTestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.ispb = "12345678"
+        self.addCleanup(wait_for_finalizers, 10)
+
+
+    def test_delete_returns_before_the_reservation_is_consumed(self):
+        stream = PixStream.objects.create(interation_id="async", ispb=self.ispb)
+        for i in range(9):
+            _create_message(self.ispb, f"{i:02d}")
+        resp = self.client.get(
+            f"/api/pix/{self.ispb}/stream/{stream.interation_id}?limit=9", HTTP_ACCEPT="multipart/json"
+        )
+        self.assertEqual(len(resp.json()), 9)
+
+        # A row lock held elsewhere stalls the finalizer, not the DELETE.
+        blocker = psycopg2.connect(**connection.get_connection_params())
+        self.addCleanup(blocker.close)
+        with blocker.cursor() as cursor:
+            cursor.execute(
+                f"SELECT 1 FROM {PixMessage._meta.db_table} WHERE end_to_end_id = %s FOR UPDATE", [f"E{self.ispb}05"]
+            )
+
+        resp = self.client.delete(f"/api/pix/{self.ispb}/stream/{stream.interation_id}")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        stream.refresh_from_db()
+        self.assertFalse(stream.active)
+        self.assertTrue(stream.consume_pending)
+        self.assertTrue(PixMessage.objects.filter(status=PixMessage.MessageStatus.RESERVED).exists())
+
+        blocker.rollback()
+        wait_for_finalizers(10)
+        self.assertEqual(
+            PixMessage.objects.filter(reserved_by=stream, status=PixMessage.MessageStatus.CONSUMED).count(), 9
+        )
+        stream.refresh_from_db()
+        self.assertFalse(stream.consume_pending)
@@ -0,0 +1,159 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from data.models import PixMessage, PixStream
+from util.utils import expire_idle_streams, reserve_messages
+
+
+@override_settings(
+    STREAM_LEASE_TIMEOUT_SECONDS=60, STREAM_MAX_COLLECTORS_PER_ISPB=2, STREAM_LONG_POLLING_TIMEOUT_SECONDS=0.0
+)
+class TestStreamLease(TestCase):
+    def setUp(self) -> None:
+        self.ispb = "12345678"
+
+
+    def _create_message(self, suffix: str, ispb: str = "") -> PixMessage:
+        return PixMessage.objects.create(
+            end_to_end_id=f"E{ispb or self.ispb}{suffix}",
+            tx_id=f"tx{suffix}",
+            amount=Decimal("10.00"),
+            payment_at=timezone.now(),
+            free_text="",
+            payer_name="Tester",
+            payer_cpf_cnpj="12345678901",
+            payer_ispb="87654321",
+            payer_agencia="0001",
+            payer_conta_transacional="111",
+            payer_tipo_conta="CACC",
+            receiver_name="Receiver",
+            receiver_cpf_cnpj="01987654321",
+            receiver_ispb=ispb or self.ispb,
+            receiver_agencia="0001",
+            receiver_conta_transacional="222",
+            receiver_tipo_conta="SVGS",
+        )
+
+
+    def _stream(self, name: str, idle_seconds: float, ispb: str = "", pulled: bool = True) -> PixStream:
+        stream = PixStream.objects.create(interation_id=name, ispb=ispb or self.ispb)
+        seen = timezone.now() - timedelta(seconds=idle_seconds)
+        PixStream.objects.filter(pk=stream.pk).update(
+            started_at=seen, last_pull_at=seen if pulled else None
+        )
+        return stream
+
+
+    def test_idle_stream_is_closed_and_its_messages_released(self):
+        idle = self._stream("idle", 120)
+        live = self._stream("live", 10)
+        for i in range(3):
+            self._create_message(str(i))
+        reserve_messages(idle, 2)
+        reserve_messages(live, 1)
+
+        self.assertEqual(expire_idle_streams(), (1, 2))
+
+        idle.refresh_from_db()
+        self.assertFalse(idle.active)
+        self.assertIsNotNone(idle.terminated_at)
+        self.assertTrue(PixStream.objects.get(pk=live.pk).active)
+        self.assertEqual(
+            PixMessage.objects.filter(status=PixMessage.MessageStatus.PENDING, reserved_by__isnull=True).count(), 2
+        )
+        self.assertEqual(PixMessage.objects.filter(reserved_by=live).count(), 1)
+
+
+    def test_stream_never_pulled_expires_from_its_start(self):
+        self._stream("fresh", 10, pulled=False)
+        stale = self._stream("stale", 120, pulled=False)
+
+        self.assertEqual(expire_idle_streams(), (1, 0))
+        self.assertFalse(PixStream.objects.get(pk=stale.pk).active)
+
+
+    def test_consumed_messages_are_not_released(self):
+        idle = self._stream("idle", 120)
+        message = self._create_message("done")
+        reserve_messages(idle, 1)
+        PixMessage.objects.filter(pk=message.pk).update(status=PixMessage.MessageStatus.CONSUMED)
+
+        self.assertEqual(expire_idle_streams(), (1, 0))
+        self.assertEqual(PixMessage.objects.get(pk=message.pk).status, PixMessage.MessageStatus.CONSUMED)
+
+
+    def test_expiry_can_be_limited_to_one_ispb(self):
+        self._stream("mine", 120)
+        other = self._stream("other", 120, ispb="87654321")
+
+        self.assertEqual(expire_idle_streams(self.ispb), (1, 0))
+        self.assertTrue(PixStream.objects.get(pk=other.pk).active)
+
+
+    def test_released_messages_are_delivered_to_a_new_stream(self):
+        idle = self._stream("idle", 120)
+        self._create_message("1")
+        reserve_messages(idle, 1)
+        expire_idle_streams()
+
+        self.assertEqual([row[0] for row in reserve_messages(self._stream("next", 0), 10)], [f"E{self.ispb}1"])
+
+
+    def test_stream_start_reclaims_abandoned_slots(self):
+        client = APIClient()
+        self._stream("crashed1", 120)
+        self._stream("crashed2", 120)
+
+        resp = client.get(f"/api/pix/{self.ispb}/stream/start")
+
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(PixStream.objects.filter(ispb=self.ispb, active=True).count(), 1)
+
+
+    def test_stream_start_reclaims_slots_never_pulled(self):
+        client = APIClient()
+        self._stream("silent1", 120, pulled=False)
+        self._stream("silent2", 120, pulled=False)
+
+        resp = client.get(f"/api/pix/{self.ispb}/stream/start")
+
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(PixStream.objects.filter(ispb=self.ispb, active=True).count(), 1)
+
+
+    def test_live_streams_still_count_against_the_limit(self):
+        client = APIClient()
+        self._stream("live1", 10)
+        self._stream("live2", 10)
+
+        resp = client.get(f"/api/pix/{self.ispb}/stream/start")
+
+        self.assertEqual(resp.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+    def test_expired_stream_continuation_returns_410(self):
+        client = APIClient()
+        idle = self._stream("idle", 120)
+        expire_idle_streams()
+
+        resp = client.get(f"/api/pix/{self.ispb}/stream/{idle.interation_id}")
+
+        self.assertEqual(resp.status_code, status.HTTP_410_GONE)
+
+
+    def test_reap_command(self):
+        idle = self._stream("idle", 120)
+        self._create_message("1")
+        reserve_messages(idle, 1)
+        out = StringIO()
+
+        call_command("reap_streams", stdout=out)
+
+        self.assertIn("expired 1 streams, released 1 messages", out.getvalue())
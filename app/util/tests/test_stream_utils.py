@@ -0,0 +1,120 @@
+import json
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import TestCase
+from django.utils import timezone
+
+from data.models import PixMessage, PixStream
+from data.serializers import PixMessageSerializer
+from util.partitions import queue_horizon
+from util.utils import reserve_messages
+
+
+class TestReserveMessages(TestCase):
+    def setUp(self) -> None:
+        self.ispb = "12345678"
+        self.stream = PixStream.objects.create(interation_id="reserve", ispb=self.ispb)
+
+
+    def _create_message(
+        self, suffix: str, ispb: str = "", priority: int = PixMessage.MessagePriority.NORMAL
+    ) -> PixMessage:
+        return PixMessage.objects.create(
+            end_to_end_id=f"E{ispb or self.ispb}{suffix}",
+            tx_id=f"tx{suffix}",
+            amount=Decimal("10.00"),
+            payment_at=timezone.now(),
+            free_text="",
+            payer_name="Tester",
+            payer_cpf_cnpj="12345678901",
+            payer_ispb="87654321",
+            payer_agencia="0001",
+            payer_conta_transacional="111",
+            payer_tipo_conta="CACC",
+            receiver_name="Receiver",
+            receiver_cpf_cnpj="01987654321",
+            receiver_ispb=ispb or self.ispb,
+            receiver_agencia="0001",
+            receiver_conta_transacional="222",
+            receiver_tipo_conta="SVGS",
+            priority=priority,
+        )
+
+
+    def test_batch_is_claimed_in_a_single_query(self):
+        created = [self._create_message(str(i)) for i in range(12)]
+        queue_horizon()  # read once per process and cached, not per claim
+
+        with self.assertNumQueries(1):
+            messages = reserve_messages(self.stream, 10)
+
+        self.assertEqual([row[0] for row in messages], [m.end_to_end_id for m in created[:10]])
+        reserved = PixMessage.objects.filter(reserved_by=self.stream)
+        self.assertEqual(reserved.count(), 10)
+        for m in reserved:
+            self.assertEqual(m.status, PixMessage.MessageStatus.RESERVED)
+            self.assertIsNotNone(m.reserved_at)
+
+
+    def test_only_pending_messages_of_the_stream_ispb_are_claimed(self):
+        self._create_message("other", ispb="87654321")
+        taken = self._create_message("taken")
+        taken.status = PixMessage.MessageStatus.CONSUMED
+        taken.save(update_fields=["status"])
+        pending = self._create_message("pending")
+
+        messages = reserve_messages(self.stream, 10)
+        self.assertEqual([row[0] for row in messages], [pending.end_to_end_id])
+
+
+    def test_empty_claim_on_active_stream_returns_empty_list(self):
+        self.assertEqual(reserve_messages(self.stream, 10), [])
+
+
+    def test_closed_stream_claims_nothing(self):
+        self._create_message("closed")
+        self.stream.active = False
+        self.stream.save(update_fields=["active"])
+
+        self.assertIsNone(reserve_messages(self.stream, 10))
+        self.assertFalse(PixMessage.objects.filter(reserved_by=self.stream).exists())
+
+
+    def test_byte_budget_limits_the_batch(self):
+        created = [self._create_message(str(i)) for i in range(5)]
+        sizes = [
+            len(json.dumps(PixMessageSerializer(m).data, cls=DjangoJSONEncoder)) + len(", ") for m in created
+        ]
+
+        messages = reserve_messages(self.stream, 10, max_bytes=sum(sizes[:3]))
+        self.assertEqual([row[0] for row in messages], [m.end_to_end_id for m in created[:3]])
+
+
+    def test_first_message_is_claimed_even_over_budget(self):
+        self._create_message("big")
+        messages = reserve_messages(self.stream, 10, max_bytes=1)
+        self.assertEqual(len(messages), 1)
+
+
+    def test_higher_lanes_are_claimed_first(self):
+        low = [self._create_message(f"low{i}", priority=PixMessage.MessagePriority.LOW) for i in range(3)]
+        normal = self._create_message("normal")
+        high = [self._create_message(f"high{i}", priority=PixMessage.MessagePriority.HIGH) for i in range(2)]
+
+        messages = reserve_messages(self.stream, 4)
+        self.assertEqual(
+            [row[0] for row in messages], [m.end_to_end_id for m in high + [normal] + low[:1]]
+        )
+        self.assertEqual(
+            list(PixMessage.objects.filter(status=PixMessage.MessageStatus.PENDING).values_list("end_to_end_id", flat=True)),
+            [m.end_to_end_id for m in low[1:]],
+        )
+
+
+    def test_byte_budget_follows_lane_order(self):
+        self._create_message("low", priority=PixMessage.MessagePriority.LOW)
+        high = self._create_message("high", priority=PixMessage.MessagePriority.HIGH)
+
+        messages = reserve_messages(self.stream, 10, max_bytes=1)
+        self.assertEqual([row[0] for row in messages], [high.end_to_end_id])
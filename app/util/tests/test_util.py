@@ -82,3 +82,16 @@ class TestUtilGenerateMessages(TestCase):
         resp = self.client.delete(f"/api/util/msgs/{ispb}/{number}")
         self.assertEqual(resp.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
 
+
+
+    def test_generate_messages_reports_new_ids(self):
+        ispb = "12345678"
+        resp = self.client.post(f"/api/util/msgs/{ispb}/3")
+
+        body = resp.json()
+        self.assertEqual(body["duplicates"], [])
+        self.assertEqual(len(body["new"]), 3)
+        self.assertEqual(
+            set(PixMessage.objects.filter(receiver_ispb=ispb).values_list("end_to_end_id", flat=True)),
+            set(body["new"]),
+        )
@@ -1,13 +1,31 @@
-from datetime import datetime, timezone as dt_timezone
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from operator import itemgetter
 import time
 import random
 import string
-from typing import List
+from typing import Iterator, List, NamedTuple, Optional, Tuple
 
 from data.models import PixMessage, PixStream
-from data.serializers import PixMessageSerializer
+from data.serializers import (
+    PIX_MESSAGE_WIRE_FIELDS,
+    encode_pix_message,
+    encode_pix_messages,
+    iter_encode_pix_messages,
+    iter_pack_pix_messages,
+    msgpack_available,
+    pack_pix_messages,
+)
+from util.compression import compress_response
+from util.metrics import increment_counter, observe_histogram
+from util.notifications import MessageListener, get_listener, notify_new_messages
+from util.partitions import queue_horizon
 
-from django.http import JsonResponse, HttpResponse
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.db.models import Q
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.utils import timezone as dj_timezone
 from django.conf import settings
 import logging
@@ -27,67 +45,714 @@ def build_pull_next(ispb: str, interation_id: str) -> str:
 
 
 def accepts_multipart(request) -> bool:
-    return request.headers.get("Accept", "application/json").lower() == "multipart/json"
+    return request.headers.get("Accept", "application/json").lower() in ("multipart/json", "multipart/msgpack")
+
+
+def accepts_msgpack(request) -> bool:
+    return request.headers.get("Accept", "application/json").lower() in ("application/msgpack", "multipart/msgpack")
 
 
 def is_valid_ispb(value: str) -> bool:
     return isinstance(value, str) and len(value) == 8 and value.isdigit()
 
 
+# Locks and closes every active stream whose lease ran out: no pull since
+# the lease timeout, or none at all since it started. The row lock waits for
+# an in-flight claim on the stream, and a stream that pulled meanwhile is
+# re-checked and left alone.
+_EXPIRE_STREAMS_SQL = f"""
+UPDATE {PixStream._meta.db_table}
+SET active = false, terminated_at = %(now)s
+WHERE active AND COALESCE(last_pull_at, started_at) < %(cutoff)s
+AND (%(ispb)s::varchar IS NULL OR ispb = %(ispb)s::varchar)
+RETURNING id
+"""
+
+# Runs as a separate statement so its snapshot includes the reservations of
+# the claims the statement above waited for.
+_RELEASE_RESERVED_SQL = f"""
+UPDATE {PixMessage._meta.db_table}
+SET status = %(pending)s, reserved_by_id = NULL, reserved_at = NULL
+WHERE reserved_by_id = ANY(%(streams)s) AND status = %(reserved)s AND created_at >= %(horizon)s
+RETURNING receiver_ispb
+"""
+
+
+def stream_lease_timeout() -> float:
+    return float(getattr(settings, "STREAM_LEASE_TIMEOUT_SECONDS", 120.0))
+
+
+@transaction.atomic
+def expire_idle_streams(ispb: Optional[str] = None, now: Optional[datetime] = None) -> Tuple[int, int]:
+    """
+    Closes the streams, of ``ispb`` or of every ISPB, idle for longer than
+    ``STREAM_LEASE_TIMEOUT_SECONDS`` and returns their reserved messages to
+    pending, so they free their collector slot and the messages are delivered
+    again. Returns how many streams and messages were released.
+    """
+    logger = logging.getLogger(__name__)
+    now = now or dj_timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _EXPIRE_STREAMS_SQL,
+            {"now": now, "cutoff": now - timedelta(seconds=stream_lease_timeout()), "ispb": ispb},
+        )
+        streams = [row[0] for row in cursor.fetchall()]
+        if not streams:
+            return 0, 0
+        cursor.execute(
+            _RELEASE_RESERVED_SQL,
+            {
+                "streams": streams,
+                "pending": PixMessage.MessageStatus.PENDING,
+                "reserved": PixMessage.MessageStatus.RESERVED,
+                "horizon": claim_horizon(),
+            },
+        )
+        ispbs = [row[0] for row in cursor.fetchall()]
+    notify_new_messages(set(ispbs))
+    logger.info("stream.expired", extra={"ispb": ispb, "streams": len(streams), "messages": len(ispbs)})
+    return len(streams), len(ispbs)
+
+
+# Key space of the transaction-scoped advisory locks serializing admission;
+# the second key is the ISPB itself (8 digits fit a 32-bit integer).
+ADMISSION_LOCK_CLASS = 0x50495841  # "PIXA"
+
+
+@transaction.atomic
+def admit_stream(ispb: str) -> Optional[PixStream]:
+    """
+    Opens a stream for ``ispb`` unless it already has
+    ``STREAM_MAX_COLLECTORS_PER_ISPB`` active collectors. Starts of one ISPB
+    queue on an advisory lock held until commit, across every app process,
+    and other ISPBs are never involved. Stream rows are only locked when one
+    of the ISPB's streams is past its lease and is expired here, which waits
+    for an in-flight claim on it; otherwise admission neither waits for nor
+    blocks claims.
+    """
+    logger = logging.getLogger(__name__)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", [ADMISSION_LOCK_CLASS, int(ispb)])
+    # Abandoned streams of this ISPB give their slots back before counting;
+    # a plain read first, so the locking reap only runs when there is one.
+    cutoff = dj_timezone.now() - timedelta(seconds=stream_lease_timeout())
+    lapsed = PixStream.objects.filter(ispb=ispb, active=True).filter(
+        Q(last_pull_at__lt=cutoff) | Q(last_pull_at__isnull=True, started_at__lt=cutoff)
+    )
+    if lapsed.exists():
+        expire_idle_streams(ispb)
+    active_count = PixStream.objects.filter(ispb=ispb, active=True, is_prefetch=False).count()
+
+    max_collectors = int(getattr(settings, "STREAM_MAX_COLLECTORS_PER_ISPB", 6))
+    if active_count >= max_collectors:
+        logger.warning("stream.limit_reached", extra={"ispb": ispb, "active": active_count})
+        return None
+
+    return PixStream.objects.create(interation_id=generate_random_string(12), ispb=ispb)
+
+
+# Serialized size of a message without its text fields, plus the ", "
+# separating it from the next element of a multipart array. Adding the
+# encoded length of the variable columns gives the size of the message in the
+# response, used to keep a batch within STREAM_MULTIPART_MAX_BYTES.
+_MESSAGE_JSON_OVERHEAD_BYTES = 305
+_MESSAGE_TEXT_COLUMNS = (
+    "end_to_end_id",
+    "tx_id",
+    "free_text",
+    "payer_name",
+    "payer_cpf_cnpj",
+    "payer_ispb",
+    "payer_agencia",
+    "payer_conta_transacional",
+    "payer_tipo_conta",
+    "receiver_name",
+    "receiver_cpf_cnpj",
+    "receiver_ispb",
+    "receiver_agencia",
+    "receiver_conta_transacional",
+    "receiver_tipo_conta",
+)
+
+# Claims pending rows for one stream in a single statement: the same state
+# change as PixMessage.mark_reserved, applied with SKIP LOCKED and returned
+# in one round trip. The stream row lock orders it against a concurrent
+# DELETE: either the DELETE consumes what is reserved here, or the stream is
+# seen closed and nothing is claimed. Candidates past the byte budget are
+# locked but not updated, so they are released again when the statement ends.
+# The created_at bound lets the planner prune partitions behind the queue
+# horizon, on the candidate scan and on the update target alike.
+# Candidates are taken by priority lane, then id: the ordered scan of
+# pixmessage_pending_idx reaches an ISPB's HIGH messages before the first
+# NORMAL one, however long the LOW backlog behind them.
+# With fair scheduling, a claim takes at most its share of the ISPB's
+# recent work: the visible backlog (counted up to limit x collectors) plus
+# what its collectors claimed lately, split evenly between them, minus what
+# this stream claimed lately. "Lately" is a running count kept on each
+# stream that decays over STREAM_FAIR_SHARE_WINDOW_SECONDS, so the
+# collectors that pull first after a burst do not take it all. Only
+# collectors that pulled or claimed within that window compete; active
+# streams that are not pulling get no share. The cap is also never below what is left
+# after a full batch for every other collector, so backlog that the others
+# could not take anyway is claimed now instead of waiting for them.
+_CLAIM_CTES = """
+WITH live AS (
+    SELECT id, {recent} AS recent FROM {stream_table} WHERE id = %(stream)s AND active FOR NO KEY UPDATE
+), collectors AS (
+    SELECT greatest(count(*), 1) AS n, coalesce(sum({recent}), 0) AS recent FROM {stream_table}
+    WHERE ispb = %(ispb)s AND active AND NOT is_prefetch AND %(fair)s
+    AND (id = %(stream)s OR greatest(last_pull_at, last_claim_at) >= %(now)s - make_interval(secs => %(fair_window)s))
+), share AS (
+    SELECT CASE WHEN %(fair)s THEN greatest(
+        ceil((count(*) + (SELECT recent FROM collectors)) / (SELECT n FROM collectors)
+            - coalesce((SELECT recent FROM live), 0)),
+        count(*) - %(limit)s * ((SELECT n FROM collectors) - 1),
+        1
+    ) ELSE %(limit)s END AS n
+    FROM (
+        SELECT 1 FROM {message_table}
+        WHERE receiver_ispb = %(ispb)s AND status = %(pending)s AND created_at >= %(horizon)s AND %(fair)s
+        LIMIT %(limit)s * (SELECT n FROM collectors)
+    ) backlog
+), candidates AS (
+    SELECT id, created_at, priority, {size} AS size FROM {message_table}
+    WHERE receiver_ispb = %(ispb)s AND status = %(pending)s AND created_at >= %(horizon)s
+    AND EXISTS (SELECT 1 FROM live)
+    ORDER BY priority, id
+    LIMIT %(limit)s
+    FOR UPDATE SKIP LOCKED
+), claimed AS (
+    SELECT id, created_at FROM (
+        SELECT id, created_at,
+            sum(size) OVER (ORDER BY priority, id) AS running,
+            row_number() OVER (ORDER BY priority, id) AS position
+        FROM candidates
+    ) sized
+    WHERE (running <= %(max_bytes)s OR position = 1) AND position <= (SELECT n FROM share)
+), tally AS (
+    UPDATE {stream_table}
+    SET recent_claims = (SELECT recent FROM live) + (SELECT count(*) FROM claimed), last_claim_at = %(now)s
+    WHERE id = (SELECT id FROM live) AND %(fair)s
+)"""
+
+_CLAIM_UPDATE = """
+UPDATE {message_table} AS m
+SET status = %(reserved)s, reserved_by_id = %(stream)s, reserved_at = %(now)s
+FROM claimed
+WHERE m.id = claimed.id AND m.created_at = claimed.created_at AND m.created_at >= %(horizon)s"""
+
+# Upper bound on the bytes of one text column in the wire encoding, quotes
+# included. to_json escapes quotes, backslashes and control characters the
+# way the encoder does but keeps other characters as UTF-8, which the encoder
+# writes as \uXXXX escapes: 6 bytes for a 2-byte character (accented
+# names), 6 for a 3-byte one and 12 for a 4-byte one, so 4 bytes per extra
+# UTF-8 byte is exact for the first and enough for the others.
+_ENCODED_TEXT_SIZE = "octet_length(to_json({column})::text) + 4 * (octet_length({column}) - char_length({column}))"
+
+_CLAIM_FORMAT = dict(
+    stream_table=PixStream._meta.db_table,
+    recent=(
+        "coalesce(recent_claims * exp(-greatest(extract(epoch FROM %(now)s - last_claim_at), 0)"
+        " / %(fair_window)s), 0)"
+    ),
+    message_table=PixMessage._meta.db_table,
+    size=" + ".join(
+        [str(_MESSAGE_JSON_OVERHEAD_BYTES), "octet_length(amount::text)"]
+        + [_ENCODED_TEXT_SIZE.format(column=column) for column in _MESSAGE_TEXT_COLUMNS]
+    ),
+)
+
+_CLAIM_SQL = (_CLAIM_CTES + _CLAIM_UPDATE + "\nRETURNING m.priority, m.id, {returning}\n").format(
+    returning=", ".join(f"m.{field}" for field in PIX_MESSAGE_WIRE_FIELDS),
+    **_CLAIM_FORMAT,
+)
+
+# Streamed pulls claim the same rows but only count them here; the rows are
+# read back afterwards through a server-side cursor, keyed by the stream and
+# the claim timestamp.
+_CLAIM_COUNT_SQL = (
+    _CLAIM_CTES + ", updated AS (" + _CLAIM_UPDATE + "\nRETURNING 1\n)\nSELECT count(*) FROM updated\n"
+).format(**_CLAIM_FORMAT)
+
+
+class PullBatch(NamedTuple):
+    """
+    Messages claimed by one pull. ``rows`` holds the wire rows, or is ``None``
+    when the batch is large enough to be streamed from the database instead.
+    """
+    count: int
+    reserved_at: datetime
+    rows: Optional[List[tuple]]
+
+
+def pull_batch_size(request, is_multipart: bool) -> Optional[int]:
+    """
+    Messages to claim for one pull. Multipart pulls may ask for a batch size
+    with the ``limit`` query parameter or the ``Pull-Limit`` header, capped at
+    STREAM_MULTIPART_MAX_MESSAGES. Returns ``None`` for an invalid hint.
+    """
+    if not is_multipart:
+        return 1
+
+    maximum = int(getattr(settings, "STREAM_MULTIPART_MAX_MESSAGES", 5000))
+    hint = request.GET.get("limit") or request.headers.get("Pull-Limit")
+    if hint is None:
+        return min(int(getattr(settings, "STREAM_MULTIPART_DEFAULT_MESSAGES", 10)), maximum)
+
+    try:
+        requested = int(hint)
+    except ValueError:
+        return None
+    if requested < 1:
+        return None
+    return min(requested, maximum)
+
+
+def invalid_batch_size_response() -> JsonResponse:
+    return JsonResponse({"detail": "Invalid limit. Expected a positive integer."}, status=400)
+
+
+def claim_horizon() -> datetime:
+    """
+    Lower bound on created_at of any claimable message, so the claim plan
+    only includes partitions from ``util.partitions.queue_horizon`` onwards.
+    """
+    return queue_horizon() or datetime.min.replace(tzinfo=dt_timezone.utc)
+
+
+def _claim_params(
+    stream: PixStream, limit: int, max_bytes: Optional[int], reserved_at: datetime, fair: Optional[bool] = None
+) -> dict:
+    if max_bytes is None:
+        max_bytes = int(getattr(settings, "STREAM_MULTIPART_MAX_BYTES", 8 * 1024 * 1024))
+    if fair is None:
+        fair = bool(getattr(settings, "STREAM_FAIR_SHARE_ENABLED", True))
+    return {
+        "fair": fair,
+        "fair_window": float(getattr(settings, "STREAM_FAIR_SHARE_WINDOW_SECONDS", 10.0)),
+        "stream": stream.pk,
+        "ispb": stream.ispb,
+        "pending": PixMessage.MessageStatus.PENDING,
+        "reserved": PixMessage.MessageStatus.RESERVED,
+        "limit": limit,
+        "max_bytes": max_bytes,
+        "now": reserved_at,
+        "horizon": claim_horizon(),
+    }
+
+
+def _stream_is_closed(stream: PixStream) -> bool:
+    return not PixStream.objects.filter(pk=stream.pk, active=True).exists()
+
+
+def reserve_messages(
+    stream: PixStream, limit: int, max_bytes: Optional[int] = None, reserved_at: Optional[datetime] = None
+) -> Optional[List[tuple]]:
+    """
+    Claims up to ``limit`` pending messages for ``stream`` and returns them as
+    ``PIX_MESSAGE_WIRE_FIELDS`` rows in claim (priority, id) order, or
+    ``None`` when the stream is closed.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(_CLAIM_SQL, _claim_params(stream, limit, max_bytes, reserved_at or dj_timezone.now()))
+        rows = cursor.fetchall()
+    if not rows and _stream_is_closed(stream):
+        return None
+    rows.sort(key=itemgetter(0, 1))
+    return [row[2:] for row in rows]
+
+
+def reserve_message_count(
+    stream: PixStream, limit: int, reserved_at: datetime, max_bytes: Optional[int] = None
+) -> Optional[int]:
+    """
+    Same claim as ``reserve_messages``, stamped with ``reserved_at`` and
+    returning only how many messages were reserved, or ``None`` when the
+    stream is closed.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(_CLAIM_COUNT_SQL, _claim_params(stream, limit, max_bytes, reserved_at))
+        (count,) = cursor.fetchone()
+    if not count and _stream_is_closed(stream):
+        return None
+    return count
+
+
+def streams_pull_body(is_multipart: bool, limit: int) -> bool:
+    return is_multipart and limit >= int(getattr(settings, "STREAM_STREAMING_MIN_MESSAGES", 500))
+
+
+def claim_pull_batch(stream: PixStream, limit: int, streamed: bool) -> Optional[PullBatch]:
+    reserved_at = dj_timezone.now()
+    started = time.perf_counter()
+    if streamed:
+        count = reserve_message_count(stream, limit, reserved_at)
+        batch = None if count is None else PullBatch(count, reserved_at, None)
+    else:
+        if getattr(settings, "STREAM_PREFETCH_ENABLED", False):
+            from util.prefetch import take_prefetched  # util.prefetch builds on this module
+
+            rows = take_prefetched(stream, limit, reserved_at=reserved_at)
+        else:
+            rows = reserve_messages(stream, limit, reserved_at=reserved_at)
+        batch = None if rows is None else PullBatch(len(rows), reserved_at, rows)
+    observe_histogram("stream_claim_seconds", time.perf_counter() - started)
+    if batch is not None and batch.count:
+        increment_counter("stream_messages_reserved_total", batch.count, ispb=stream.ispb)
+    return batch
+
+
+def record_pull(batch: PullBatch, iterations: int, waited: float) -> None:
+    """Records the outcome of one pull request's long poll."""
+    increment_counter("stream_pulls_total")
+    if not batch.count:
+        increment_counter("stream_empty_pulls_total")
+    observe_histogram("stream_poll_iterations", iterations)
+    observe_histogram("stream_long_poll_wait_seconds", waited)
+
+
+def iter_reserved_rows(stream: PixStream, reserved_at: datetime) -> Iterator[tuple]:
+    """
+    Reads back the rows of a streamed batch through a server-side cursor,
+    ``STREAM_STREAMING_CHUNK_SIZE`` rows per fetch.
+    """
+    chunk_size = int(getattr(settings, "STREAM_STREAMING_CHUNK_SIZE", 500))
+    return (
+        PixMessage.objects.filter(
+            reserved_by_id=stream.pk,
+            status=PixMessage.MessageStatus.RESERVED,
+            reserved_at=reserved_at,
+            created_at__gte=claim_horizon(),
+        )
+        .order_by("priority", "id")
+        .values_list(*PIX_MESSAGE_WIRE_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def _timed_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    while True:
+        started = time.perf_counter()
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        observe_histogram("stream_serialize_seconds", time.perf_counter() - started, mode="streamed")
+        yield chunk
+
+
+async def _aiter_chunks(chunks: Iterator[bytes]):
+    # Django would drain a synchronous iterator into a list before serving it
+    # under ASGI, so each chunk is pulled through sync_to_async instead.
+    while True:
+        chunk = await sync_to_async(next)(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
 def consume_and_close_stream(stream: PixStream) -> None:
-    PixMessage.objects.filter(reserved_by=stream, status=PixMessage.MessageStatus.RESERVED).update(
-        status=PixMessage.MessageStatus.CONSUMED, consumed_at=dj_timezone.now()
+    """
+    Closes ``stream`` and consumes its reserved messages in bounded chunks
+    (see ``util.finalize``), on a background thread with
+    ``STREAM_CONSUME_ASYNC``.
+    """
+    from util.finalize import consume_reserved_chunk, finalize_stream, schedule_finalize  # builds on this module
+
+    asynchronous = bool(getattr(settings, "STREAM_CONSUME_ASYNC", False))
+    with transaction.atomic():
+        # Closing first takes the stream row lock, so an in-flight reservation
+        # commits before its messages are consumed.
+        stream.active = False
+        stream.terminated_at = dj_timezone.now()
+        stream.consume_pending = True
+        stream.save(update_fields=["active", "terminated_at", "consume_pending"])
+        done = False if asynchronous else consume_reserved_chunk(stream)[1]
+    if asynchronous:
+        schedule_finalize(stream)
+    elif not done:
+        finalize_stream(stream)
+
+
+_BATCH_TOKEN_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def batch_token(reserved_at: datetime) -> str:
+    """The ``Pull-Batch`` token of a claim: its reservation time in microseconds."""
+    return str((reserved_at - _BATCH_TOKEN_EPOCH) // timedelta(microseconds=1))
+
+
+def parse_batch_token(token) -> Optional[datetime]:
+    if not isinstance(token, str) or not token.isdigit():
+        return None
+    try:
+        return _BATCH_TOKEN_EPOCH + timedelta(microseconds=int(token))
+    except OverflowError:
+        return None
+
+
+def parse_ack_request(request) -> Optional[dict]:
+    """
+    What an ACK confirms, as keyword arguments for ``acknowledge_messages``:
+    a JSON body with ``endToEndIds`` (at most STREAM_MULTIPART_MAX_MESSAGES)
+    or ``batch``, or an empty body with the ``Pull-Batch`` header. Returns
+    ``None`` for anything else.
+    """
+    if not request.body:
+        reserved_at = parse_batch_token(request.headers.get("Pull-Batch"))
+        return None if reserved_at is None else {"reserved_at": reserved_at}
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+
+    if "endToEndIds" in payload:
+        ids = payload["endToEndIds"]
+        maximum = int(getattr(settings, "STREAM_MULTIPART_MAX_MESSAGES", 5000))
+        if not isinstance(ids, list) or not ids or len(ids) > maximum:
+            return None
+        if not all(isinstance(end_to_end_id, str) for end_to_end_id in ids):
+            return None
+        return {"end_to_end_ids": ids}
+    reserved_at = parse_batch_token(payload.get("batch"))
+    return None if reserved_at is None else {"reserved_at": reserved_at}
+
+
+def invalid_ack_response() -> JsonResponse:
+    return JsonResponse(
+        {"detail": "Invalid acknowledgement. Send endToEndIds or the batch token from Pull-Batch."}, status=400
     )
-    stream.active = False
-    stream.terminated_at = dj_timezone.now()
-    stream.save(update_fields=["active", "terminated_at"])
 
 
-def stream_fetch_and_response(request, stream: PixStream):
-    logger = logging.getLogger(__name__)
+def acknowledge_messages(
+    stream: PixStream, end_to_end_ids: Optional[List[str]] = None, reserved_at: Optional[datetime] = None
+) -> Optional[int]:
+    """
+    Marks the messages reserved by ``stream`` that are listed in
+    ``end_to_end_ids``, or that were claimed at ``reserved_at`` (one pull's
+    batch), as consumed in one update, keeping the stream open and renewing
+    its lease. Messages not reserved by the stream are ignored. Returns how
+    many were consumed, or ``None`` when the stream is closed.
+    """
+    now = dj_timezone.now()
+    if not PixStream.objects.filter(pk=stream.pk, active=True).update(last_pull_at=now):
+        return None
+    messages = PixMessage.objects.filter(
+        reserved_by=stream, status=PixMessage.MessageStatus.RESERVED, created_at__gte=claim_horizon()
+    )
+    if end_to_end_ids is not None:
+        messages = messages.filter(end_to_end_id__in=end_to_end_ids)
+    else:
+        messages = messages.filter(reserved_at=reserved_at)
+    consumed = messages.update(status=PixMessage.MessageStatus.CONSUMED, consumed_at=now)
+    increment_counter("stream_messages_consumed_total", consumed, ispb=stream.ispb)
+    return consumed
+
+
+def touch_stream(stream: PixStream) -> None:
     stream.last_pull_at = dj_timezone.now()
     stream.save(update_fields=["last_pull_at"])
 
+
+def unsupported_accept_response(request) -> Optional[JsonResponse]:
     accept_raw = request.headers.get("Accept")
-    if accept_raw and accept_raw.lower() not in ("application/json", "multipart/json"):
-        return JsonResponse({"detail": "Unsupported Accept header. Use application/json or multipart/json."}, status=406)
+    supported = ["application/json", "multipart/json"]
+    if msgpack_available():
+        supported += ["application/msgpack", "multipart/msgpack"]
+    if accept_raw and accept_raw.lower() not in supported:
+        return JsonResponse({"detail": f"Unsupported Accept header. Use {', '.join(supported)}."}, status=406)
+    return None
 
-    is_multipart = accepts_multipart(request)
-    limit = 10 if is_multipart else 1
 
-    timeout_seconds = float(getattr(settings, "STREAM_LONG_POLLING_TIMEOUT_SECONDS", 8.0))
-    deadline = time.monotonic() + timeout_seconds
-    messages: List[PixMessage] = []
-    while time.monotonic() < deadline:
-        messages = list(
-            PixMessage.objects.select_for_update(skip_locked=True)
-            .filter(
-                receiver_ispb=stream.ispb,
-                status=PixMessage.MessageStatus.PENDING,
-            )
-            .order_by("id")[:limit]
-        )
+def stream_closed_response() -> JsonResponse:
+    return JsonResponse({"detail": "Stream is already closed. Start a new stream."}, status=410)
+
+
+def release_connection_while_waiting() -> None:
+    """
+    With the pooled backend, gives this thread's connection back to the pool
+    for the long-poll wait, so idle collectors hold no database session; the
+    next claim takes one again. Nothing to do inside a transaction. Async
+    pulls call it through ``sync_to_async``, on the thread that owns their
+    connection.
+    """
+    if getattr(connection, "pooled", False) and not connection.in_atomic_block:
+        connection.close()
+
 
-        if messages:
-            for m in messages:
-                m.mark_reserved(stream)
-                m.save(update_fields=["status", "reserved_by", "reserved_at"])
-            logger.info("stream.reserve", extra={"stream": stream.interation_id, "count": len(messages)})
-            break
+def long_poll_wait_seconds(listener: Optional[MessageListener], remaining: float) -> float:
+    """
+    While the process listener is up it probes for work on the waiters'
+    behalf, so they wait out the whole long poll; otherwise each waiter
+    re-claims on its own timer.
+    """
+    if listener is not None and listener.available:
+        return remaining
+    return min(remaining, float(getattr(settings, "STREAM_POLL_INTERVAL_SECONDS", 0.2)))
 
-        time.sleep(0.2)
 
+def record_delivery(listener: Optional[MessageListener], stream: PixStream, batch: PullBatch, limit: int) -> None:
+    if listener is not None and batch.count:
+        listener.delivered(stream.ispb, full=batch.count >= limit)
+
+
+def build_stream_response(
+    stream: PixStream,
+    batch: Optional[PullBatch],
+    is_multipart: bool,
+    asynchronous: bool = False,
+    binary: bool = False,
+):
+    """
+    The 200 (or 204) response of a pull. ``binary`` selects the MessagePack
+    encoding of ``pack_pix_messages`` instead of JSON.
+    """
+    logger = logging.getLogger(__name__)
     pull_next = build_pull_next(stream.ispb, stream.interation_id)
 
-    if not messages:
+    if batch is None or not batch.count:
         response = HttpResponse(status=204)
         response["Pull-Next"] = pull_next
         logger.info("stream.no_content", extra={"stream": stream.interation_id})
         return response
 
-    serializer = PixMessageSerializer(messages if is_multipart else messages[0], many=is_multipart)
-    data = serializer.data
-    response = JsonResponse(data, safe=not is_multipart)
+    content_type = "application/msgpack" if binary else "application/json"
+    if batch.rows is None:
+        chunk_size = int(getattr(settings, "STREAM_STREAMING_CHUNK_SIZE", 500))
+        encode = iter_pack_pix_messages if binary else iter_encode_pix_messages
+        chunks = _timed_chunks(encode(iter_reserved_rows(stream, batch.reserved_at), chunk_size))
+        response = StreamingHttpResponse(_aiter_chunks(chunks) if asynchronous else chunks, content_type=content_type)
+    else:
+        rows = batch.rows
+        started = time.perf_counter()
+        if binary:
+            body = pack_pix_messages(rows if is_multipart else rows[:1])
+        else:
+            body = encode_pix_messages(rows) if is_multipart else encode_pix_message(rows[0])
+        observe_histogram("stream_serialize_seconds", time.perf_counter() - started, mode="buffered")
+        response = HttpResponse(body, content_type=content_type)
     response["Pull-Next"] = pull_next
-    logger.info("stream.response", extra={"stream": stream.interation_id, "multipart": is_multipart, "count": len(messages)})
-    return response
\ No newline at end of file
+    response["Pull-Batch"] = batch_token(batch.reserved_at)
+    logger.info(
+        "stream.response",
+        extra={
+            "stream": stream.interation_id,
+            "multipart": is_multipart,
+            "binary": binary,
+            "count": batch.count,
+            "streamed": batch.rows is None,
+        },
+    )
+    return response
+
+
+def stream_fetch_and_response(request, stream: PixStream):
+    logger = logging.getLogger(__name__)
+    touch_stream(stream)
+
+    unsupported = unsupported_accept_response(request)
+    if unsupported is not None:
+        return unsupported
+
+    is_multipart = accepts_multipart(request)
+    limit = pull_batch_size(request, is_multipart)
+    if limit is None:
+        return invalid_batch_size_response()
+
+    timeout_seconds = float(getattr(settings, "STREAM_LONG_POLLING_TIMEOUT_SECONDS", 8.0))
+    deadline = time.monotonic() + timeout_seconds
+    streamed = streams_pull_body(is_multipart, limit)
+    batch: Optional[PullBatch] = None
+    iterations, waited = 0, 0.0
+
+    listener = get_listener()
+    subscription = listener.subscribe(stream.ispb) if listener is not None else None
+    try:
+        while True:
+            iterations += 1
+            batch = claim_pull_batch(stream, limit, streamed)
+            if batch is None:
+                return stream_closed_response()
+            if batch.count:
+                logger.info("stream.reserve", extra={"stream": stream.interation_id, "count": batch.count})
+                break
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            waiting_since = time.monotonic()
+            release_connection_while_waiting()
+            if subscription is not None:
+                subscription.wait(long_poll_wait_seconds(listener, remaining))
+            else:
+                time.sleep(long_poll_wait_seconds(listener, remaining))
+            waited += time.monotonic() - waiting_since
+    finally:
+        if subscription is not None:
+            subscription.close()
+
+    record_pull(batch, iterations, waited)
+    record_delivery(listener, stream, batch, limit)
+    return compress_response(
+        request, build_stream_response(stream, batch, is_multipart, binary=accepts_msgpack(request))
+    )
+
+
+async def astream_fetch_and_response(request, stream: PixStream):
+    """
+    Same flow as ``stream_fetch_and_response``, but the long-poll wait is an
+    awaitable, so a waiting pull holds no thread between claim attempts.
+    """
+    logger = logging.getLogger(__name__)
+    await sync_to_async(touch_stream)(stream)
+
+    unsupported = unsupported_accept_response(request)
+    if unsupported is not None:
+        return unsupported
+
+    is_multipart = accepts_multipart(request)
+    limit = pull_batch_size(request, is_multipart)
+    if limit is None:
+        return invalid_batch_size_response()
+
+    timeout_seconds = float(getattr(settings, "STREAM_LONG_POLLING_TIMEOUT_SECONDS", 8.0))
+    deadline = time.monotonic() + timeout_seconds
+    streamed = streams_pull_body(is_multipart, limit)
+    batch: Optional[PullBatch] = None
+    iterations, waited = 0, 0.0
+
+    listener = get_listener()
+    subscription = (
+        listener.subscribe(stream.ispb, loop=asyncio.get_running_loop()) if listener is not None else None
+    )
+    try:
+        while True:
+            iterations += 1
+            batch = await sync_to_async(claim_pull_batch)(stream, limit, streamed)
+            if batch is None:
+                return stream_closed_response()
+            if batch.count:
+                logger.info("stream.reserve", extra={"stream": stream.interation_id, "count": batch.count})
+                break
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            waiting_since = time.monotonic()
+            await sync_to_async(release_connection_while_waiting)()
+            if subscription is not None:
+                await subscription.wait_async(long_poll_wait_seconds(listener, remaining))
+            else:
+                await asyncio.sleep(long_poll_wait_seconds(listener, remaining))
+            waited += time.monotonic() - waiting_since
+    finally:
+        if subscription is not None:
+            subscription.close()
+
+    record_pull(batch, iterations, waited)
+    record_delivery(listener, stream, batch, limit)
+    return compress_response(
+        request, build_stream_response(stream, batch, is_multipart, asynchronous=True, binary=accepts_msgpack(request))
+    )